@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the generate -> aggregate -> write pipeline
+
+Runs the three stages at each requested size, each size in a fresh process so
+memory from one size does not leak into the next, and records wall time, peak
+RSS and rows/s per stage. Between consecutive sizes the scaling exponent of
+each stage is reported (time ratio over interaction ratio, on a log scale):
+~1 is linear, ~2 is a quadratic path.
+
+Sizes are presets or INTERACTIONSxEMPLOYEES[xPAGES[xSITES]] with k/m suffixes:
+
+    python benchmark.py --sizes xs,s,m --json bench.json
+    python benchmark.py --sizes 1k,50kx5000x1000 --baseline bench_baseline.json --threshold 0.25
+
+With --baseline the command exits with status 1 when any stage's wall time or
+peak RSS grew by more than --threshold over the stored run, or when the stored
+run used another engine, sink, visitor_sets, seed or generator; --save-baseline
+stores the current run instead.
+
+Peak RSS is that of the whole benchmark process while a stage runs, so it
+includes memory still held from the stages before it.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from instrumentation import peak_rss_mb
+
+# name: (interactions, employees, pages, sites)
+SIZE_PRESETS = {
+    'xs': (1_000, 200, 50, 4),
+    's': (100_000, 5_000, 1_000, 50),
+    'm': (1_000_000, 20_000, 5_000, 200),
+    'l': (10_000_000, 130_000, 40_000, 774),
+    'xl': (20_000_000, 130_000, 40_000, 774),
+}
+DEFAULT_SIZES = 'xs,s'
+STAGES = ['generate', 'aggregate', 'write']
+DEFAULT_THRESHOLD = 0.25
+# Stages faster than this are too noisy to compare against a baseline
+MIN_COMPARABLE_SECONDS = 0.05
+RSS_SAMPLE_INTERVAL = 0.01
+# Report meta entries that have to match for a baseline comparison to mean anything
+COMPARABLE_META = ['engine', 'sink', 'visitor_sets', 'seed', 'generator']
+# Interactions are generated with the vectorised generator of generate_scale_data.py
+GENERATOR = 'numpy'
+
+
+def _count(text):
+    """'10m' -> 10_000_000, '50k' -> 50_000"""
+    text = text.strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def parse_size(spec):
+    """A preset name or INTERACTIONSxEMPLOYEES[xPAGES[xSITES]] -> (label, interactions, employees, pages, sites)"""
+    if spec in SIZE_PRESETS:
+        return (spec,) + SIZE_PRESETS[spec]
+    parts = [_count(part) for part in spec.split('x')]
+    interactions = parts[0]
+    employees = parts[1] if len(parts) > 1 else max(200, min(130_000, interactions // 100))
+    pages = parts[2] if len(parts) > 2 else max(50, min(40_000, interactions // 250))
+    sites = parts[3] if len(parts) > 3 else max(4, min(774, pages // 50))
+    return spec, interactions, employees, pages, sites
+
+
+def current_rss_mb():
+    """Resident set size of this process, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+class StageMeter:
+    """Context manager timing a stage and sampling the process's peak RSS during it from a background thread"""
+
+    def __init__(self):
+        self.seconds = None
+        self.peak_rss_mb = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+
+    def __enter__(self):
+        self.peak_rss_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+
+
+def _stage_result(meter, rows):
+    return {
+        'seconds': meter.seconds,
+        'peak_rss_mb': meter.peak_rss_mb,
+        'rows': rows,
+        'rows_per_s': rows / meter.seconds if meter.seconds else None,
+    }
+
+
+def run_size(size, engine='python', visitor_sets='set', sink='parquet', seed=42, workers=None):
+    """Run generate -> aggregate -> write for one size in this process"""
+    from generate_complete_sample import generate_complete_output
+    from generate_scale_data import (chunk_to_records, concatenate_chunks, generate_dataset,
+                                     iter_interaction_chunks_np)
+    from output_sinks import FACT_TABLE, FACT_TABLE_COLUMNS, ExcelSink, ParquetSink
+
+    label, num_interactions, num_employees, num_pages, num_sites = size
+    stages = {}
+
+    with StageMeter() as meter:
+        dates, employees, pages = generate_dataset(num_employees, num_sites, num_pages, seed=seed)
+        chunks = iter_interaction_chunks_np(num_interactions, len(employees), len(pages), len(dates), seed=seed)
+        if engine == 'columnar':
+            # The columnar engine reads the NumPy chunks as they are
+            interactions = concatenate_chunks(chunks)
+        else:
+            interactions = []
+            for chunk in chunks:
+                interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+    stages['generate'] = _stage_result(meter, num_interactions)
+
+    with StageMeter() as meter:
+        aggregated = generate_complete_output(interactions, employees, pages, dates, engine=engine,
+                                              visitor_sets=visitor_sets, workers=workers)
+    stages['aggregate'] = _stage_result(meter, num_interactions)
+
+    output_dir = tempfile.mkdtemp(prefix='uv_benchmark_')
+    try:
+        # Created outside the meter so that importing openpyxl/pyarrow is not timed
+        if sink == 'xlsx':
+            output = ExcelSink(os.path.join(output_dir, 'benchmark.xlsx'))
+        else:
+            output = ParquetSink(output_dir)
+            import pyarrow.parquet  # noqa: F401
+        with StageMeter() as meter:
+            output.write_table(FACT_TABLE, aggregated, FACT_TABLE_COLUMNS)
+            output.close()
+        stages['write'] = _stage_result(meter, len(aggregated))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        'size': label,
+        'interactions': num_interactions,
+        'employees': num_employees,
+        'pages': num_pages,
+        'sites': num_sites,
+        'output_rows': len(aggregated),
+        'stages': stages,
+    }
+
+
+def scaling_exponents(results):
+    """log(time ratio) / log(interaction ratio) per stage between consecutive sizes"""
+    ordered = sorted(results, key=lambda result: result['interactions'])
+    exponents = []
+    for smaller, larger in zip(ordered, ordered[1:]):
+        if larger['interactions'] == smaller['interactions']:
+            continue
+        size_ratio = math.log(larger['interactions'] / smaller['interactions'])
+        entry = {'from': smaller['size'], 'to': larger['size']}
+        for stage in STAGES:
+            before = smaller['stages'][stage]['seconds']
+            after = larger['stages'][stage]['seconds']
+            entry[stage] = math.log(after / before) / size_ratio if before > 0 and after > 0 else None
+        exponents.append(entry)
+    return exponents
+
+
+def baseline_mismatches(report, baseline):
+    """(meta entry, baseline value, current value) for each COMPARABLE_META entry that differs"""
+    return [(key, baseline['meta'].get(key), report['meta'].get(key)) for key in COMPARABLE_META
+            if baseline['meta'].get(key) != report['meta'].get(key)]
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Stages whose wall time or process peak RSS grew by more than threshold over the baseline
+
+    Raises ValueError when the baseline was recorded with another engine, sink,
+    visitor_sets, seed or generator.
+    """
+    mismatches = baseline_mismatches(report, baseline)
+    if mismatches:
+        raise ValueError("Baseline is not comparable: " + ', '.join(
+            f"{key} {before!r} in the baseline, {current!r} now" for key, before, current in mismatches))
+    baseline_sizes = {result['size']: result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        previous = baseline_sizes.get(result['size'])
+        if previous is None:
+            continue
+        for stage in STAGES:
+            current = result['stages'][stage]
+            before = previous['stages'].get(stage)
+            if before is None:
+                continue
+            for metric in ('seconds', 'peak_rss_mb'):
+                if metric == 'seconds' and before[metric] < MIN_COMPARABLE_SECONDS:
+                    continue
+                if current[metric] > before[metric] * (1 + threshold):
+                    regressions.append({
+                        'size': result['size'],
+                        'stage': stage,
+                        'metric': metric,
+                        'baseline': before[metric],
+                        'current': current[metric],
+                        'change': current[metric] / before[metric] - 1,
+                    })
+    return regressions
+
+
+def run_benchmark(sizes, engine='python', visitor_sets='set', sink='parquet', seed=42, workers=None):
+    """Run every size in its own worker process and collect the report"""
+    results = []
+    for size in sizes:
+        print(f"Running {size[0]}: {size[1]:,} interactions, {size[2]:,} employees, {size[3]:,} pages, "
+              f"{size[4]:,} sites...", flush=True)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.append(pool.submit(run_size, size, engine, visitor_sets, sink, seed, workers).result())
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'engine': engine,
+            'visitor_sets': visitor_sets,
+            'sink': sink,
+            'seed': seed,
+            'generator': GENERATOR,
+        },
+        'results': results,
+        'scaling': scaling_exponents(results),
+    }
+
+
+def print_report(report):
+    print(f"\n{'Size':<12} {'Stage':<10} {'Rows':>12} {'Time (s)':>10} {'Rows/s':>12} {'Process peak RSS (MB)':>22}")
+    for result in report['results']:
+        for stage in STAGES:
+            metrics = result['stages'][stage]
+            print(f"{result['size']:<12} {stage:<10} {metrics['rows']:>12,} {metrics['seconds']:>10.2f} "
+                  f"{metrics['rows_per_s'] or 0:>12,.0f} {metrics['peak_rss_mb']:>22.1f}")
+    if report['scaling']:
+        print("\nScaling exponent per stage (1 = linear, 2 = quadratic):")
+        for entry in report['scaling']:
+            values = '  '.join(f"{stage} {entry[stage]:.2f}" if entry[stage] is not None else f"{stage} -"
+                               for stage in STAGES)
+            print(f"   {entry['from']} -> {entry['to']}: {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark generate -> aggregate -> write at several sizes')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated presets ({', '.join(SIZE_PRESETS)}) or INTERACTIONSxEMPLOYEES[xPAGES[xSITES]]")
+    parser.add_argument('--engine', choices=['python', 'columnar', 'parallel'], default='python')
+    parser.add_argument('--visitor-sets', choices=['set', 'bitmap'], default='set')
+    parser.add_argument('--workers', type=int, help="worker processes for --engine parallel")
+    parser.add_argument('--sink', choices=['parquet', 'xlsx'], default='parquet')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='baseline report to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative growth of time and peak RSS over the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='write this run to --baseline instead of comparing')
+    args = parser.parse_args()
+    from generate_complete_sample import check_engine_options
+    try:
+        check_engine_options(args.engine, args.visitor_sets)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    sizes = [parse_size(spec) for spec in args.sizes.split(',')]
+    report = run_benchmark(sizes, engine=args.engine, visitor_sets=args.visitor_sets, sink=args.sink, seed=args.seed,
+                           workers=args.workers)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n   Report written to {args.json}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"   Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare_to_baseline(report, baseline, args.threshold)
+        except ValueError as exc:
+            print(f"\n❌ {exc}")
+            sys.exit(1)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}:")
+            for r in regressions:
+                metric = 'process peak RSS (MB)' if r['metric'] == 'peak_rss_mb' else r['metric']
+                print(f"   {r['size']} {r['stage']} {metric}: {r['baseline']:.2f} -> {r['current']:.2f} "
+                      f"(+{r['change']:.0%})")
+            sys.exit(1)
+        print(f"\n✅ No regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Columnar aggregation engine for generate_complete_output
+
+Holds interactions as integer-encoded NumPy arrays and computes the grain sums
+and all UV levels with grouped array operations instead of per-row Python sets.
+The output matches the dict-based reference implementation row for row.
+
+Interactions are dict rows, a RecordTable, or the NumPy column chunks of
+generate_scale_data.py (contact and page indices into employees and pages),
+which are aggregated without building any per-row Python objects.
+"""
+
+from collections.abc import Mapping
+from operator import itemgetter
+
+import numpy as np
+
+from compact_records import RecordTable
+from generate_complete_sample import (DEFAULT_LAUNCH_WINDOWS, OUTPUT_DIMENSIONS, PERIOD_MEASURES, DateOrdinals,
+                                      column_measures, period_columns, period_names, select_measures)
+
+# Interaction fields read from dict rows or a RecordTable, in the order they are unpacked
+ENCODED_COLUMNS = ['viewingcontactid', 'marketingPageId', 'visitdatekey', 'visit_date', 'views', 'visits',
+                   'comments', 'marketingPageIdliked']
+
+
+def _codes(values):
+    """Dictionary-encode a sequence of hashable values, returning (codes, uniques)"""
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(v, len(lookup)) for v in values), dtype=np.int64)
+    return codes, list(lookup)
+
+
+def _lookup(index, values, n):
+    """index[value] for every value, as an int64 array"""
+    return np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=n)
+
+
+def _column_values(interactions, names):
+    """One sequence of values per column, read in a single pass over dict rows"""
+    if isinstance(interactions, RecordTable):
+        return [interactions.column(name) for name in names]
+    return list(zip(*map(itemgetter(*names), interactions))) or [()] * len(names)
+
+
+def encode_dimensions(employees, pages, dates):
+    """Integer codes of the dimension tables, shared by both kinds of interaction input"""
+    emp_div, divisions = _codes(e['employeebusinessdivision'] or 'Unknown' for e in employees)
+    emp_reg, regions = _codes(e['employeeregion'] or 'Unknown' for e in employees)
+    page_site, websites = _codes(p['websitename'] for p in pages)
+    ordinals = DateOrdinals()
+    return {
+        'contact_index': {e['contactid']: i for i, e in enumerate(employees)},
+        'page_index': {p['marketingPageId']: i for i, p in enumerate(pages)},
+        'date_index': {d['date_key']: i for i, d in enumerate(dates)},
+        'emp_div': emp_div,
+        'emp_reg': emp_reg,
+        'page_site': page_site,
+        # Ordinal day number and current-year flag per row of dates
+        'date_ordinal': np.array([ordinals[d['date']] for d in dates], dtype=np.int64),
+        'date_is_ty': np.array([d['year'] == 2024 for d in dates], dtype=bool),
+        'ordinals': ordinals,
+        'num_contacts': len(employees),
+        'divisions': divisions,
+        'regions': regions,
+        'websites': websites,
+        'page_ids': [p['marketingPageId'] for p in pages],
+    }
+
+
+def _encode_rows(interactions, dims):
+    """Row columns of dict rows or a RecordTable, one lookup pass per id column"""
+    contact_ids, page_ids, date_keys, visit_dates, views, visits, comments, liked_ids = \
+        _column_values(interactions, ENCODED_COLUMNS)
+    n = len(contact_ids)
+
+    # Liked page ids are encoded separately; -1 marks "no like"
+    liked_index = {}
+    for value in set(liked_ids):
+        liked_index[value] = len(liked_index) if value else -1
+
+    date_row = _lookup(dims['date_index'], date_keys, n)
+    return {
+        'contact': _lookup(dims['contact_index'], contact_ids, n),
+        'page': _lookup(dims['page_index'], page_ids, n),
+        'views': np.array(views, dtype=np.int64),
+        'visits': np.array(visits, dtype=np.int64),
+        'comments': np.array(comments, dtype=np.int64),
+        'liked': _lookup(liked_index, liked_ids, n),
+        'num_liked': len(liked_index),
+        # mindate is taken from the interaction's own visit_date, as in the reference
+        'visit_ordinal': _lookup(dims['ordinals'], visit_dates, n),
+        'ordinal': dims['date_ordinal'][date_row],
+        'is_ty': dims['date_is_ty'][date_row],
+    }
+
+
+def _encode_arrays(chunk, dims):
+    """Row columns of a generate_scale_data chunk, whose likes are of the visited page"""
+    page = np.asarray(chunk['page'], dtype=np.int64)
+    keys = np.array(list(dims['date_index']), dtype=np.int64)
+    date_row = np.full(int(keys.max()) + 1 if len(keys) else 0, -1, dtype=np.int64)
+    date_row[keys] = np.fromiter(dims['date_index'].values(), dtype=np.int64, count=len(keys))
+    date_row = date_row[np.asarray(chunk['date_key'], dtype=np.int64)]
+    ordinal = dims['date_ordinal'][date_row]
+    return {
+        'contact': np.asarray(chunk['contact'], dtype=np.int64),
+        'page': page,
+        'views': np.asarray(chunk['views'], dtype=np.int64),
+        'visits': np.asarray(chunk['visits'], dtype=np.int64),
+        'comments': np.asarray(chunk['comments'], dtype=np.int64),
+        'liked': np.where(np.asarray(chunk['liked'], dtype=bool), page, -1),
+        'num_liked': len(dims['page_ids']),
+        # visit_date is the date of date_key in these chunks
+        'visit_ordinal': ordinal,
+        'ordinal': ordinal,
+        'is_ty': dims['date_is_ty'][date_row],
+    }
+
+
+def encode_interactions(interactions, employees, pages, dates):
+    """Encode interactions and their dimensions as integer NumPy columns
+
+    interactions is dict rows, a RecordTable, or a mapping of NumPy columns as
+    yielded by generate_scale_data.iter_interaction_chunks_np.
+    """
+    dims = encode_dimensions(employees, pages, dates)
+    if isinstance(interactions, Mapping):
+        cols = _encode_arrays(interactions, dims)
+    else:
+        cols = _encode_rows(interactions, dims)
+    cols.update(
+        division=dims['emp_div'][cols['contact']],
+        region=dims['emp_reg'][cols['contact']],
+        website=dims['page_site'][cols['page']],
+        num_contacts=dims['num_contacts'],
+        divisions=dims['divisions'],
+        regions=dims['regions'],
+        websites=dims['websites'],
+        page_ids=dims['page_ids'],
+    )
+    return cols
+
+
+def period_bits(cols, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Per-row bitmask of period membership; bit i is set when the row is in period_names()[i]"""
+    page = cols['page']
+    mindate = np.full(int(page.max()) + 1 if len(page) else 0, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(mindate, page, cols['visit_ordinal'])
+    days_since = cols['ordinal'] - mindate[page]
+
+    bits = np.ones(len(page), dtype=np.int64)
+    bits |= cols['is_ty'].astype(np.int64) << 1
+    for i, period in enumerate(period_names(launch_windows)[2:], start=2):
+        bits |= (days_since < int(period[1:])).astype(np.int64) << i
+    return bits
+
+
+def distinct_pairs(group, member, bits, num_members):
+    """Distinct (group, member) pairs among the rows, with the OR of their rows' period bits
+
+    Returns (pair group codes, pair member codes, pair period bits).
+    """
+    codes = group * num_members + member
+    if not len(codes):
+        return codes, codes, bits[:0]
+    order = np.argsort(codes)
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    pairs = codes[starts]
+    return pairs // num_members, pairs % num_members, np.bitwise_or.reduceat(bits[order], starts)
+
+
+def count_in_period(group, bits, index, num_groups):
+    """Pairs per group code whose period bits include bit index"""
+    return np.bincount(group[(bits >> index) & 1 == 1], minlength=num_groups)
+
+
+def _rank(names):
+    """Position of each name in sorted order, so that codes sort like the names they stand for"""
+    ranks = np.empty(len(names), dtype=np.int64)
+    ranks[sorted(range(len(names)), key=names.__getitem__)] = np.arange(len(names))
+    return ranks
+
+
+def generate_complete_output_columnar(interactions, employees, pages, dates, launch_windows=DEFAULT_LAUNCH_WINDOWS,
+                                      columns=None, compact=False):
+    """Columnar equivalent of generate_complete_output; columns computes only the selected output columns
+
+    compact=True returns a RecordTable built from the output columns, without per-row dicts.
+    """
+    if columns is None:
+        measures = {period: set(PERIOD_MEASURES) for period in period_names(launch_windows)}
+    else:
+        columns, measures = select_measures(columns, launch_windows)
+    cols = encode_interactions(interactions, employees, pages, dates)
+    periods = list(measures)
+
+    n_div = len(cols['divisions'])
+    n_reg = len(cols['regions'])
+    n_site = len(cols['websites'])
+    n_contacts = cols['num_contacts']
+    contact = cols['contact']
+
+    # Grain = (page, division, region); the website follows from the page
+    grain_code = (cols['page'] * n_div + cols['division']) * n_reg + cols['region']
+    grain_keys, grain = np.unique(grain_code, return_inverse=True)
+    n_grain = len(grain_keys)
+    grain_page = grain_keys // (n_div * n_reg)
+    grain_div = (grain_keys // n_reg) % n_div
+    grain_reg = grain_keys % n_reg
+    grain_site = np.empty(n_grain, dtype=np.int64)
+    grain_site[grain] = cols['website']
+
+    # Group code of every grain at each rollup level
+    level_rows = {
+        'div': (n_div, grain_div),
+        'reg': (n_reg, grain_reg),
+        'site': (n_site, grain_site),
+        'site_div': (n_site * n_div, grain_site * n_div + grain_div),
+        'site_reg': (n_site * n_reg, grain_site * n_reg + grain_reg),
+        'site_div_reg': (n_site * n_div * n_reg, (grain_site * n_div + grain_div) * n_reg + grain_reg),
+    }
+
+    # Every UV count is over distinct (grain, visitor) pairs, as the levels are functions of the grain;
+    # each set of pairs is deduplicated once, carrying the bits of the periods its rows are in
+    bits = period_bits(cols, launch_windows)
+    index = {period: i for i, period in enumerate(period_names(launch_windows))}
+    wanted_anywhere = set().union(*measures.values())
+    pair_grain, pair_contact, pair_bits = distinct_pairs(grain, contact, bits, n_contacts)
+    liked = cols['liked']
+    has_like = liked >= 0
+    like_grain, _, like_bits = distinct_pairs(grain[has_like], liked[has_like], bits[has_like],
+                                              max(cols['num_liked'], 1))
+    _, _, visitor_bits = distinct_pairs(np.zeros_like(pair_contact), pair_contact, pair_bits, n_contacts)
+    level_pairs = {level: distinct_pairs(grain_codes[pair_grain], pair_contact, pair_bits, n_contacts)[::2]
+                   for level, (_, grain_codes) in level_rows.items() if level in wanted_anywhere}
+
+    results = {}
+    for period, wanted in measures.items():
+        i = index[period]
+        mask = (bits >> i) & 1 == 1
+        metrics = {}
+        for name in ('views', 'visits', 'comments'):
+            if name in wanted:
+                metrics[name] = np.bincount(grain[mask], weights=cols[name][mask], minlength=n_grain).astype(np.int64)
+        if 'likes' in wanted:
+            metrics['likes'] = count_in_period(like_grain, like_bits, i, n_grain)
+        if 'uv' in wanted:
+            metrics['uv'] = count_in_period(pair_grain, pair_bits, i, n_grain)
+        if 'overall' in wanted:
+            metrics['overall'] = np.full(n_grain, np.count_nonzero((visitor_bits >> i) & 1), dtype=np.int64)
+        for level, (group, level_bits) in level_pairs.items():
+            if level in wanted:
+                n_groups, grain_codes = level_rows[level]
+                metrics[level] = count_in_period(group, level_bits, i, n_groups)[grain_codes]
+        results[period] = metrics
+
+    # Output order is (websitename, division, region, marketingPageId)
+    order = np.lexsort((_rank(cols['page_ids'])[grain_page], _rank(cols['regions'])[grain_reg],
+                        _rank(cols['divisions'])[grain_div], _rank(cols['websites'])[grain_site]))
+    page_ids = [cols['page_ids'][i] for i in grain_page[order].tolist()]
+    div_names = [cols['divisions'][i] for i in grain_div[order].tolist()]
+    reg_names = [cols['regions'][i] for i in grain_reg[order].tolist()]
+    site_names = [cols['websites'][i] for i in grain_site[order].tolist()]
+
+    # Every period's measures as per-column value lists, in output order
+    results = {period: {name: values[order].tolist() for name, values in metrics.items()}
+               for period, metrics in results.items()}
+    names = list(OUTPUT_DIMENSIONS)
+    values = [page_ids, div_names, reg_names, site_names]
+    if columns is None:
+        for period in periods:
+            names += period_columns(period)
+            values += [results[period][measure] for measure in PERIOD_MEASURES]
+    else:
+        measures_by_column = column_measures(launch_windows)
+        for column in columns:
+            period, measure = measures_by_column[column]
+            names.append(column)
+            values.append(results[period][measure])
+    if compact:
+        return RecordTable.from_columns(dict(zip(names, values)))
+    return [dict(zip(names, row)) for row in zip(*values)]
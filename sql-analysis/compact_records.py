@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Compact struct-of-arrays tables for the dimension, interaction and fact records
+
+Every record in the sample tooling is a dict, which costs a hash table per row
+plus a separate string object for every repeated value. A RecordTable keeps one
+array per column instead: integer and float columns as typed `array`s, and
+low-cardinality text columns (divisions, regions, websites, page names and
+URLs, dates) dictionary-encoded as small integer codes plus one list of
+distinct values. Near-unique text columns (ids, names, emails) stay plain lists.
+
+Rows are still available as read-only mappings (`table[i]['websitename']`,
+`record.get(column)`), so a RecordTable can be passed wherever a list of dicts
+is expected; column-wise consumers use table.column(name) or
+table.iter_rows(names) and skip the per-row lookups:
+
+    employees = RecordTable.from_records(generate_employee_contacts(130_000))
+    aggregated = generate_complete_output(interactions, employees, pages, dates, compact=True)
+    uv = aggregated.column('uniquevisitor')
+
+Usage:
+    python compact_records.py --employees 130000 --pages 40000 --interactions 1000000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from array import array
+from collections.abc import Mapping
+
+# A text column is dictionary-encoded when it has at most this share of distinct values
+MAX_CATEGORICAL_SHARE = 0.5
+
+
+def _code_typecode(num_categories):
+    if num_categories <= 2**8:
+        return 'B'
+    if num_categories <= 2**16:
+        return 'H'
+    return 'I'
+
+
+def _encode_column(values):
+    """(data, categories) for one column; categories is None unless the column is dictionary-encoded"""
+    if values and all(type(value) is int for value in values):
+        try:
+            return array('q', values), None
+        except OverflowError:
+            return list(values), None
+    if values and all(type(value) is float for value in values):
+        return array('d', values), None
+    if all(value is None or type(value) is str for value in values):
+        lookup = {}
+        codes = [lookup.setdefault(value, len(lookup)) for value in values]
+        if len(lookup) <= max(1, len(values) * MAX_CATEGORICAL_SHARE):
+            return array(_code_typecode(len(lookup)), codes), list(lookup)
+    return list(values), None
+
+
+class Record(Mapping):
+    """Read-only mapping view of one row of a RecordTable
+
+    A Record pickles as a plain dict of its row, not as its whole table.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, column):
+        return self._table._getters[column](self._index)
+
+    def __iter__(self):
+        return iter(self._table.columns)
+
+    def __len__(self):
+        return len(self._table.columns)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self):
+        return f'Record({dict(self)!r})'
+
+
+class RecordTable:
+    """Rows stored column by column, with dictionary-encoded text columns
+
+    A RecordTable pickles as its column storage; the row getters are rebuilt
+    when it is unpickled.
+    """
+
+    def __init__(self, columns, storage, length):
+        self.columns = list(columns)
+        self._storage = storage
+        self._length = length
+        self._getters = {}
+        for column, (data, categories) in storage.items():
+            if categories is None:
+                self._getters[column] = data.__getitem__
+            else:
+                self._getters[column] = lambda index, data=data, categories=categories: categories[data[index]]
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build from {column: list of values}, all of the same length"""
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        storage = {column: _encode_column(list(values)) for column, values in columns.items()}
+        return cls(columns, storage, lengths.pop() if lengths else 0)
+
+    @classmethod
+    def from_records(cls, records, columns=None):
+        """Build from a list of dicts; columns defaults to the keys of the first record"""
+        if columns is None:
+            columns = list(records[0]) if records else []
+        return cls.from_columns({column: [record.get(column) for record in records] for column in columns})
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """Build from value tuples in the given column order"""
+        values = list(zip(*rows)) if rows else [() for _ in columns]
+        return cls.from_columns(dict(zip(columns, values)))
+
+    def __reduce__(self):
+        return RecordTable, (self.columns, self._storage, self._length)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Record(self, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('RecordTable index out of range')
+        return Record(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield Record(self, index)
+
+    def column(self, name):
+        """All values of one column as a list"""
+        data, categories = self._storage[name]
+        if categories is None:
+            return list(data)
+        return [categories[code] for code in data]
+
+    def codes(self, name):
+        """(codes, categories) of a dictionary-encoded column; categories is None for other columns"""
+        return self._storage[name]
+
+    def iter_rows(self, columns=None):
+        """Value tuples in the given column order (default: all columns), decoded one row at a time"""
+        iterators = []
+        for name in columns or self.columns:
+            data, categories = self._storage[name]
+            iterators.append(iter(data) if categories is None else map(categories.__getitem__, data))
+        return zip(*iterators)
+
+    def to_records(self):
+        return [dict(zip(self.columns, values)) for values in self.iter_rows()]
+
+    def __repr__(self):
+        return f'RecordTable(<{self._length} rows x {len(self.columns)} columns>)'
+
+
+def column_values(records, column):
+    """One column of a RecordTable or a list of dicts, as a list"""
+    if isinstance(records, RecordTable):
+        return records.column(column)
+    return [record.get(column) for record in records]
+
+
+def iter_row_values(records, columns):
+    """Value tuples in column order from a RecordTable or a list of dicts"""
+    if isinstance(records, RecordTable):
+        return records.iter_rows(columns)
+    return (tuple(record.get(column) for column in columns) for record in records)
+
+
+def _measure(build):
+    """(result, bytes still allocated once build() returns) under tracemalloc"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def _timed(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def benchmark_records(num_employees, num_sites, num_pages, num_interactions, seed=0):
+    """Memory and iteration time of dict records against RecordTables, for dimensions, interactions and fact rows"""
+    from generate_complete_sample import generate_complete_output
+    from generate_scale_data import chunk_to_records, generate_dataset, iter_interaction_chunks_np
+
+    def generate():
+        dates, employees, pages = generate_dataset(num_employees, num_sites, num_pages, seed=seed)
+        interactions = []
+        for chunk in iter_interaction_chunks_np(num_interactions, len(employees), len(pages), len(dates), seed=seed):
+            interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+        return {'dates': dates, 'employees': employees, 'pages': pages, 'interactions': interactions}
+
+    def compact(tables):
+        result = {name: RecordTable.from_records(records) for name, records in tables.items()}
+        tables.clear()
+        return result
+
+    tracemalloc.start()
+    try:
+        dict_tables, dict_bytes = _measure(generate)
+        compact_tables, compact_bytes = _measure(lambda: compact(generate()))
+
+        args = [dict_tables[name] for name in ('interactions', 'employees', 'pages', 'dates')]
+        dict_output, dict_output_bytes = _measure(lambda: generate_complete_output(*args))
+        compact_args = [compact_tables[name] for name in ('interactions', 'employees', 'pages', 'dates')]
+        compact_output, compact_output_bytes = _measure(lambda: generate_complete_output(*compact_args, compact=True))
+    finally:
+        tracemalloc.stop()
+
+    if compact_output.to_records() != dict_output:
+        raise AssertionError("Compact fact output differs from the dict output")
+
+    employees, compact_employees = dict_tables['employees'], compact_tables['employees']
+    return {
+        'memory_mb': {
+            'inputs': (dict_bytes / 2**20, compact_bytes / 2**20),
+            'fact': (dict_output_bytes / 2**20, compact_output_bytes / 2**20),
+        },
+        'iteration_ms': {
+            # Building the employee lookup AggregationState uses, row by row and column-wise
+            'employee lookup (rows)': (
+                _timed(lambda: {e['contactid']: e['employeeregion'] for e in employees}) * 1000,
+                _timed(lambda: {e['contactid']: e['employeeregion'] for e in compact_employees}) * 1000),
+            'employee lookup (columns)': (
+                _timed(lambda: {e['contactid']: e['employeeregion'] for e in employees}) * 1000,
+                _timed(lambda: dict(compact_employees.iter_rows(['contactid', 'employeeregion']))) * 1000),
+            'fact UV column sum': (
+                _timed(lambda: sum(row['uniquevisitor'] for row in dict_output)) * 1000,
+                _timed(lambda: sum(compact_output.column('uniquevisitor'))) * 1000),
+        },
+        'rows': {name: len(records) for name, records in compact_tables.items()} | {'fact': len(compact_output)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dict records with compact RecordTables')
+    parser.add_argument('--employees', type=int, default=130_000)
+    parser.add_argument('--sites', type=int, default=774)
+    parser.add_argument('--pages', type=int, default=40_000)
+    parser.add_argument('--interactions', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    result = benchmark_records(args.employees, args.sites, args.pages, args.interactions, seed=args.seed)
+    print(', '.join(f"{rows:,} {name}" for name, rows in result['rows'].items()))
+    print(f"\n{'Memory (MB)':<28} {'dicts':>10} {'compact':>10} {'ratio':>7}")
+    for name, (dicts, compact) in result['memory_mb'].items():
+        print(f"{name:<28} {dicts:>10.1f} {compact:>10.1f} {compact / dicts:>7.0%}")
+    print(f"\n{'Iteration (ms)':<28} {'dicts':>10} {'compact':>10}")
+    for name, (dicts, compact) in result['iteration_ms'].items():
+        print(f"{name:<28} {dicts:>10.1f} {compact:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
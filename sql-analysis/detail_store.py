@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Contact-level detail store for the last N days, as memory-mapped column files
+
+Python counterpart of Overview_fact_table_90days_contact_level.sql: one row per
+interaction of the last `days` days, kept at contact level so that UV can be
+answered for any date range and filter. Each column is a fixed-width .npy file;
+pages and contacts are dictionary-encoded (their ids, websites, divisions and
+regions live in small lookup files) and the rows are sorted by (day, page). A
+per-day offset index turns a date range into a row range, so a query works on
+zero-copy slices of the memory-mapped columns:
+
+    DetailStore.build('detail_90d', interactions, employees, pages, dates, days=90)
+    store = DetailStore.open('detail_90d')
+    store.unique_visitors('2024-11-01', '2024-11-15', sites=['NewsPortal'], divisions=['IT'])
+
+Usage:
+    python detail_store.py build detail_90d --extract interactions.csv --dims sharepoint_analytics_sample_data.xlsx
+    python detail_store.py query detail_90d --start 2024-11-01 --end 2024-11-15 --sites NewsPortal
+    python detail_store.py benchmark --employees 5000 --interactions 200000 --queries 200
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from collections.abc import Mapping
+from datetime import date, datetime
+
+import numpy as np
+
+from compact_records import RecordTable
+
+DEFAULT_DAYS = 90
+FORMAT_VERSION = 1
+
+# Row columns and their on-disk types; day is the date's proleptic ordinal
+ROW_COLUMNS = {
+    'day': np.int32,
+    'page': np.int32,
+    'contact': np.int32,
+    'views': np.int32,
+    'visits': np.int32,
+    'comments': np.int32,
+    'liked': np.int8,
+}
+# Per-code lookups for the dictionary-encoded pages and contacts
+LOOKUP_COLUMNS = {
+    'page_site': np.int32,
+    'contact_division': np.int32,
+    'contact_region': np.int32,
+}
+
+
+def to_ordinal(value):
+    """Ordinal day number of a date, datetime or 'YYYY-MM-DD' string (ints are taken as ordinals)"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').toordinal()
+    return value.toordinal()
+
+
+def split_names(text):
+    """Names of a comma-separated command-line filter, or None for no filter"""
+    return text.split(',') if text else None
+
+
+def name_codes(names, dictionary):
+    """Codes of the names found in a dictionary-encoded column's list of values"""
+    index = {name: code for code, name in enumerate(dictionary)}
+    return np.array([index[name] for name in names if name in index], dtype=np.int32)
+
+
+def as_chunks(interactions):
+    """interactions as an iterable of tables of rows
+
+    One table (a RecordTable, or a list of dicts or Records) is wrapped in a
+    list; anything else is taken to be an iterable of tables already.
+    """
+    if isinstance(interactions, RecordTable) or (
+            isinstance(interactions, list) and interactions and isinstance(interactions[0], Mapping)):
+        return [interactions]
+    return interactions
+
+
+def _encode(values):
+    """Dictionary-encode values, returning (codes, uniques)"""
+    lookup = {}
+    codes = [lookup.setdefault(value, len(lookup)) for value in values]
+    return np.array(codes, dtype=np.int32), list(lookup)
+
+
+class DetailStore:
+    """Memory-mapped, contact-level interactions of one rolling window"""
+
+    def __init__(self, path, meta, columns):
+        self.path = path
+        self.meta = meta
+        self.columns = columns
+        self.first_day = meta['first_day']
+        self.last_day = meta['last_day']
+        self.num_contacts = len(meta['contacts'])
+
+    @classmethod
+    def build(cls, path, interactions, employees, pages, dates, days=DEFAULT_DAYS, as_of=None):
+        """Write the interactions of the `days` days up to as_of (default: the last date in dim_date) to path
+
+        interactions may be one table of rows (a RecordTable, or a list of dicts
+        or Records) or an iterable of such tables (e.g.
+        interaction_stream.iter_interaction_chunks), so the full extract never
+        has to be held in memory; only the rows in the window are kept.
+        """
+        date_ordinal = {d['date_key']: to_ordinal(d['date']) for d in dates}
+        last_day = to_ordinal(as_of) if as_of else max(date_ordinal.values())
+        first_day = last_day - days + 1
+
+        page_ids = [p['marketingPageId'] for p in pages]
+        page_code = {page_id: code for code, page_id in enumerate(page_ids)}
+        page_site, websites = _encode(p['websitename'] for p in pages)
+
+        # Contacts follow the employee table; ids missing from it are appended as 'Unknown'
+        contacts = [e['contactid'] for e in employees]
+        contact_code = {contact: code for code, contact in enumerate(contacts)}
+        divisions = [e['employeebusinessdivision'] or 'Unknown' for e in employees]
+        regions = [e['employeeregion'] or 'Unknown' for e in employees]
+
+        parts = {name: [] for name in ROW_COLUMNS}
+        for chunk in as_chunks(interactions):
+            rows = {name: [] for name in ROW_COLUMNS}
+            for interaction in chunk:
+                day = date_ordinal[interaction['visitdatekey']]
+                if not first_day <= day <= last_day:
+                    continue
+                contact = interaction['viewingcontactid']
+                if contact not in contact_code:
+                    contact_code[contact] = len(contacts)
+                    contacts.append(contact)
+                    divisions.append('Unknown')
+                    regions.append('Unknown')
+                rows['day'].append(day)
+                rows['page'].append(page_code[interaction['marketingPageId']])
+                rows['contact'].append(contact_code[contact])
+                rows['views'].append(interaction['views'] or 0)
+                rows['visits'].append(interaction['visits'] or 0)
+                rows['comments'].append(interaction['comments'] or 0)
+                rows['liked'].append(interaction['marketingPageIdliked'] is not None)
+            for name, dtype in ROW_COLUMNS.items():
+                parts[name].append(np.array(rows[name], dtype=dtype))
+
+        columns = {name: np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype)
+                   for name, dtype in ROW_COLUMNS.items()}
+        order = np.lexsort((columns['page'], columns['day']))
+        columns = {name: values[order] for name, values in columns.items()}
+
+        contact_division, division_names = _encode(divisions)
+        contact_region, region_names = _encode(regions)
+        lookups = {'page_site': page_site, 'contact_division': contact_division, 'contact_region': contact_region}
+        # day_offsets[i]:day_offsets[i + 1] are the rows of day first_day + i
+        day_offsets = np.searchsorted(columns['day'], np.arange(first_day, last_day + 2)).astype(np.int64)
+
+        os.makedirs(path, exist_ok=True)
+        for name, values in list(columns.items()) + list(lookups.items()) + [('day_offsets', day_offsets)]:
+            np.save(os.path.join(path, f'{name}.npy'), values)
+        meta = {
+            'version': FORMAT_VERSION,
+            'first_day': first_day,
+            'last_day': last_day,
+            'first_date': date.fromordinal(first_day).isoformat(),
+            'last_date': date.fromordinal(last_day).isoformat(),
+            'rows': int(len(order)),
+            'pages': page_ids,
+            'websites': websites,
+            'contacts': contacts,
+            'divisions': division_names,
+            'regions': region_names,
+        }
+        # Written last, so a store without meta.json is an interrupted build
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path} has detail store format {meta.get('version')}, expected {FORMAT_VERSION}")
+        names = list(ROW_COLUMNS) + list(LOOKUP_COLUMNS) + ['day_offsets']
+        columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
+        return cls(path, meta, columns)
+
+    def row_range(self, start=None, end=None):
+        """(lo, hi) rows of the days from start to end inclusive, clamped to the stored window"""
+        first = self.first_day if start is None else max(to_ordinal(start), self.first_day)
+        last = self.last_day if end is None else min(to_ordinal(end), self.last_day)
+        if first > last:
+            return 0, 0
+        offsets = self.columns['day_offsets']
+        return int(offsets[first - self.first_day]), int(offsets[last - self.first_day + 1])
+
+    def _mask(self, lo, hi, sites, divisions, regions, pages):
+        """Boolean mask over rows lo:hi for the filters, or None when nothing is filtered"""
+        mask = None
+        page = self.columns['page'][lo:hi]
+        contact = self.columns['contact'][lo:hi]
+        conditions = [
+            (pages, lambda: page, 'pages'),
+            (sites, lambda: self.columns['page_site'][page], 'websites'),
+            (divisions, lambda: self.columns['contact_division'][contact], 'divisions'),
+            (regions, lambda: self.columns['contact_region'][contact], 'regions'),
+        ]
+        for names, values, dictionary in conditions:
+            if names is None:
+                continue
+            matches = np.isin(values(), name_codes(names, self.meta[dictionary]))
+            mask = matches if mask is None else mask & matches
+        return mask
+
+    def _slice(self, name, lo, hi, mask):
+        values = self.columns[name][lo:hi]
+        return values if mask is None else values[mask]
+
+    def visitor_mask(self, start=None, end=None, sites=None, divisions=None, regions=None, pages=None):
+        """Boolean array over contact codes: True for contacts with a matching interaction
+
+        None means no filter on that dimension. Masks of separate queries (or
+        stores sharing the contact dictionary) combine with | for a union.
+        """
+        lo, hi = self.row_range(start, end)
+        mask = self._mask(lo, hi, sites, divisions, regions, pages)
+        seen = np.zeros(self.num_contacts, dtype=bool)
+        seen[self._slice('contact', lo, hi, mask)] = True
+        return seen
+
+    def unique_visitors(self, start=None, end=None, sites=None, divisions=None, regions=None, pages=None):
+        """Distinct contacts for a date range and any set of pages/sites x divisions x regions"""
+        return int(np.count_nonzero(self.visitor_mask(start, end, sites, divisions, regions, pages)))
+
+    def visitor_ids(self, start=None, end=None, sites=None, divisions=None, regions=None, pages=None):
+        contacts = self.meta['contacts']
+        mask = self.visitor_mask(start, end, sites, divisions, regions, pages)
+        return {contacts[code] for code in np.flatnonzero(mask).tolist()}
+
+    def scan(self, start=None, end=None, sites=None, divisions=None, regions=None, pages=None):
+        """(visitor mask over contact codes, metric sums) for a date range and filter"""
+        lo, hi = self.row_range(start, end)
+        mask = self._mask(lo, hi, sites, divisions, regions, pages)
+        seen = np.zeros(self.num_contacts, dtype=bool)
+        seen[self._slice('contact', lo, hi, mask)] = True
+        totals = {'rows': (hi - lo) if mask is None else int(np.count_nonzero(mask))}
+        for name, metric in (('views', 'views'), ('visits', 'visits'), ('comments', 'comments'), ('liked', 'likes')):
+            totals[metric] = int(self._slice(name, lo, hi, mask).sum(dtype=np.int64))
+        return seen, totals
+
+    def query(self, start=None, end=None, sites=None, divisions=None, regions=None, pages=None):
+        """Rows, UV and metric sums for a date range and filter"""
+        seen, totals = self.scan(start, end, sites, divisions, regions, pages)
+        return {'rows': totals['rows'], 'uv': int(np.count_nonzero(seen)), 'views': totals['views'],
+                'visits': totals['visits'], 'comments': totals['comments'], 'likes': totals['likes']}
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+
+def recompute_query(interactions, employees, pages, dates, start, end, sites=None, divisions=None, regions=None):
+    """Reference answer by rescanning the raw interaction dicts"""
+    emp_lookup = {e['contactid']: e for e in employees}
+    page_lookup = {p['marketingPageId']: p for p in pages}
+    date_ordinal = {d['date_key']: to_ordinal(d['date']) for d in dates}
+    first, last = to_ordinal(start), to_ordinal(end)
+
+    visitors = set()
+    result = {'rows': 0, 'uv': 0, 'views': 0, 'visits': 0, 'comments': 0, 'likes': 0}
+    for interaction in interactions:
+        if not first <= date_ordinal[interaction['visitdatekey']] <= last:
+            continue
+        emp = emp_lookup.get(interaction['viewingcontactid'], {})
+        if sites is not None and page_lookup[interaction['marketingPageId']]['websitename'] not in sites:
+            continue
+        if divisions is not None and (emp.get('employeebusinessdivision') or 'Unknown') not in divisions:
+            continue
+        if regions is not None and (emp.get('employeeregion') or 'Unknown') not in regions:
+            continue
+        visitors.add(interaction['viewingcontactid'])
+        result['rows'] += 1
+        result['views'] += interaction['views'] or 0
+        result['visits'] += interaction['visits'] or 0
+        result['comments'] += interaction['comments'] or 0
+        result['likes'] += interaction['marketingPageIdliked'] is not None
+    result['uv'] = len(visitors)
+    return result
+
+
+def random_query(rng, store, employees, pages):
+    """A random date range inside the store's window plus a dashboard-style filter"""
+    from generate_complete_sample import random_filter
+
+    first = rng.randint(store.first_day, store.last_day)
+    last = rng.randint(first, store.last_day)
+    return {'start': date.fromordinal(first).isoformat(), 'end': date.fromordinal(last).isoformat(),
+            **random_filter(rng, employees, pages)}
+
+
+def benchmark_store(path, interactions, employees, pages, dates, days=DEFAULT_DAYS, num_queries=100, seed=0):
+    """Time building and querying the store against rescanning the raw interactions"""
+    start = time.perf_counter()
+    DetailStore.build(path, interactions, employees, pages, dates, days=days)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = DetailStore.open(path)
+    open_seconds = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    queries = [random_query(rng, store, employees, pages) for _ in range(num_queries)]
+
+    start = time.perf_counter()
+    store_answers = [store.query(**q) for q in queries]
+    store_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw_answers = [recompute_query(interactions, employees, pages, dates, **q) for q in queries]
+    raw_seconds = time.perf_counter() - start
+
+    if store_answers != raw_answers:
+        raise AssertionError("Detail store answers differ from the raw recomputation")
+
+    return {
+        'rows': store.meta['rows'],
+        'size_mb': store.size_bytes() / 2**20,
+        'queries': num_queries,
+        'build_s': build_seconds,
+        'open_ms': open_seconds * 1000,
+        'store_ms_per_query': store_seconds * 1000 / num_queries,
+        'raw_ms_per_query': raw_seconds * 1000 / num_queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Contact-level detail store of the last N days')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='write a store from an interactions extract')
+    build.add_argument('store')
+    build.add_argument('--extract', required=True, help='interactions extract (.csv or .parquet, or a directory of them)')
+    build.add_argument('--dims', required=True, help='workbook or directory with the dimension tables')
+    build.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    build.add_argument('--as-of', help='last day of the window (default: last date in dim_date)')
+
+    query = commands.add_parser('query', help='UV and metrics for a date range and filter')
+    query.add_argument('store')
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--sites', help='comma-separated website names')
+    query.add_argument('--divisions')
+    query.add_argument('--regions')
+    query.add_argument('--pages', help='comma-separated marketingPageIds')
+
+    bench = commands.add_parser('benchmark', help='check and time random queries on generated data')
+    bench.add_argument('--employees', type=int, default=200)
+    bench.add_argument('--pages', type=int, default=50)
+    bench.add_argument('--interactions', type=int, default=1000)
+    bench.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    bench.add_argument('--queries', type=int, default=100)
+    bench.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from interaction_stream import iter_interaction_chunks, load_dimensions
+
+        dates, employees, pages = load_dimensions(args.dims)
+        store = DetailStore.build(args.store, iter_interaction_chunks(args.extract), employees, pages, dates,
+                                  days=args.days, as_of=args.as_of)
+        print(f"Wrote {store.meta['rows']:,} rows ({store.meta['first_date']} to {store.meta['last_date']}) "
+              f"to {args.store} ({store.size_bytes() / 2**20:.1f} MB)")
+
+    elif args.command == 'query':
+        store = DetailStore.open(args.store)
+        result = store.query(args.start, args.end, sites=split_names(args.sites),
+                             divisions=split_names(args.divisions), regions=split_names(args.regions),
+                             pages=split_names(args.pages))
+        for name, value in result.items():
+            print(f"{name:<10} {value:>12,}")
+
+    else:
+        import tempfile
+
+        from generate_complete_sample import generate_sample_data
+
+        interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                     seed=args.seed)
+
+        with tempfile.TemporaryDirectory(prefix='detail_store_') as path:
+            result = benchmark_store(path, interactions, employees, pages, dates, days=args.days,
+                                     num_queries=args.queries, seed=args.seed)
+        print(f"Detail store of {result['rows']:,} rows ({result['size_mb']:.1f} MB) built in {result['build_s']:.2f}s, "
+              f"opened in {result['open_ms']:.1f} ms")
+        print(f"   Store query: {result['store_ms_per_query']:.3f} ms/query")
+        print(f"   Raw recompute: {result['raw_ms_per_query']:.1f} ms/query "
+              f"({result['raw_ms_per_query'] / max(result['store_ms_per_query'], 1e-9):.0f}x slower)")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,22 @@
 Generate complete sample data matching the exact SQL structure with all 93 columns
 """
 
+import argparse
 import random
+from copy import copy
 from datetime import datetime, timedelta
 from collections import defaultdict
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from itertools import islice
+from operator import itemgetter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
 from openpyxl.utils import get_column_letter
 
+import instrumentation
+from compact_records import RecordTable, iter_row_values
+from visitor_sets import visitor_set_factory
+
 # Sample data pools
 divisions = ['Sales', 'Marketing', 'IT', 'Finance', 'HR', 'Operations']
 regions = ['North America', 'EMEA', 'APAC', 'LATAM']
@@ -58,8 +67,7 @@ def generate_website_page_inventory(num_pages=50):
             'websitename': website,
             'pagename': page,
             'page_url': f'https://{website.lower()}.company.com/{page.lower().replace(" ", "-")}',
-            'created_date': created_date.strftime('%Y-%m-%d'),
-            'created_date_obj': created_date  # Keep for mindate calculation
+            'created_date': created_date.strftime('%Y-%m-%d')
         })
     return data
 
@@ -72,6 +80,7 @@ def generate_interactions(num_interactions=1000, employees=None, pages=None, dat
     # 2. Multiple interactions from same employee to same page
 
     popular_pages = random.sample(pages, k=max(1, len(pages) // 5))
+    launch_dates = [d for d in dates if d['date_key'] <= 30]
 
     for i in range(num_interactions):
         # 60% chance to pick a popular page
@@ -85,7 +94,7 @@ def generate_interactions(num_interactions=1000, employees=None, pages=None, dat
         # Pick dates with clustering (some pages more active on certain days)
         if random.random() < 0.3:
             # Cluster interactions within first 30 days
-            date = random.choice([d for d in dates if d['date_key'] <= 30])
+            date = random.choice(launch_dates)
         else:
             date = random.choice(dates)
 
@@ -108,220 +117,632 @@ def generate_interactions(num_interactions=1000, employees=None, pages=None, dat
 
     return data
 
+def generate_sample_data(num_employees=200, num_pages=50, num_interactions=1000, seed=None, num_days=365):
+    """(interactions, employees, pages, dates) from the generators above, after random.seed(seed)"""
+    random.seed(seed)
+    dates = generate_dim_date(num_days)
+    employees = generate_employee_contacts(num_employees)
+    pages = generate_website_page_inventory(num_pages)
+    interactions = generate_interactions(num_interactions, employees, pages, dates)
+    return interactions, employees, pages, dates
+
+def random_filter(rng, employees, pages, shares=(0.6, 0.4, 0.3)):
+    """A random dashboard-style filter: a few sites, divisions and/or regions, or None for no filter
+
+    shares are the chances of filtering on sites, divisions and regions.
+    """
+    choices = [sorted({p['websitename'] for p in pages}),
+               sorted({e['employeebusinessdivision'] or 'Unknown' for e in employees}),
+               sorted({e['employeeregion'] or 'Unknown' for e in employees})]
+    return {name: rng.sample(values, rng.randint(1, len(values))) if rng.random() < share else None
+            for name, values, share in zip(('sites', 'divisions', 'regions'), choices, shares)}
+
 def calculate_days_since_first(interaction_date_str, mindate_str):
     """Calculate days between interaction and first page date"""
     interaction_date = datetime.strptime(interaction_date_str, '%Y-%m-%d')
     mindate = datetime.strptime(mindate_str, '%Y-%m-%d')
     return (interaction_date - mindate).days
 
-def generate_complete_output(interactions, employees, pages, dates):
-    """Generate complete output with ALL 93 columns"""
-
-    emp_lookup = {e['contactid']: e for e in employees}
-    page_lookup = {p['marketingPageId']: p for p in pages}
-    date_lookup = {d['date_key']: d for d in dates}
-
-    # Calculate mindate for each page
-    page_mindates = {}
-    for interaction in interactions:
-        page_id = interaction['marketingPageId']
-        date_str = interaction['visit_date']
+# Launch windows in days: a row is in the N-day window when days_since_first <= N - 1
+DEFAULT_LAUNCH_WINDOWS = (28, 21, 14, 7)
+
+# Grain dimensions of the output rows, in the column order of the final SELECT
+OUTPUT_DIMENSIONS = ['marketingPageId', 'employeebusinessdivision', 'employeeregion', 'websitename']
+
+# Output measures of each period, in the column order of the final SELECT: the
+# grain's own sums and UV, then the UV of each rollup level
+GRAIN_MEASURES = ['views', 'visits', 'comments', 'likes', 'uv']
+LEVEL_MEASURES = ['div', 'reg', 'overall', 'site', 'site_div', 'site_reg', 'site_div_reg']
+PERIOD_MEASURES = GRAIN_MEASURES + LEVEL_MEASURES
+UV_MEASURES = ['uv'] + LEVEL_MEASURES
+
+def check_launch_windows(launch_windows):
+    """Launch windows as distinct day counts, largest first; every window must be a positive int"""
+    invalid = [days for days in launch_windows if not isinstance(days, int) or isinstance(days, bool) or days < 1]
+    if invalid:
+        raise ValueError(f"Launch windows must be positive whole days, got {', '.join(map(repr, invalid))}")
+    return sorted(set(launch_windows), reverse=True)
+
+def parse_launch_windows(text):
+    """Launch windows from a comma-separated command line value such as '28,21,14,7'"""
+    try:
+        launch_windows = [int(days) for days in text.split(',')]
+    except ValueError:
+        raise ValueError(f"Launch windows must be comma-separated whole days, got {text!r}")
+    check_launch_windows(launch_windows)
+    return launch_windows
+
+def period_names(launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Periods in output order: all-time, this year, then one 'd<N>' per launch window, largest first"""
+    return ['all', 'ty'] + [f'd{days}' for days in check_launch_windows(launch_windows)]
+
+def period_columns(period):
+    """Output column names of one period, one per PERIOD_MEASURES entry"""
+    if period == 'all':
+        suffix, site_suffix, views = '', '', 'views'
+    elif period == 'ty':
+        suffix, site_suffix, views = 'ty', 'TY', 'viewty'
+    else:
+        suffix = site_suffix = period[1:]
+        views = f'views{suffix}'
+    return [f'div_reg_{views}', f'div_reg_visits{suffix}', f'div_reg_comments{suffix}', f'div_reg_likes{suffix}',
+            f'div_reg_uniquevisitor{suffix}', f'div_uniquevisitor{suffix}', f'reg_uniquevisitor{suffix}',
+            f'uniquevisitor{suffix}', f'site_uniquevisitor{site_suffix}', f'site_div_uniquevisitor{site_suffix}',
+            f'site_reg_uniquevisitor{site_suffix}', f'site_div_reg_uniquevisitor{site_suffix}']
+
+def output_columns(launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Column names of the output rows: the dimensions, then PERIOD_MEASURES for each period"""
+    columns = list(OUTPUT_DIMENSIONS)
+    for period in period_names(launch_windows):
+        columns += period_columns(period)
+    return columns
+
+def column_measures(launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """{output column: (period, measure)} for every measure column of the output"""
+    return {column: (period, measure)
+            for period in period_names(launch_windows)
+            for column, measure in zip(period_columns(period), PERIOD_MEASURES)}
+
+def select_measures(columns, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """(measure columns, {period: measures}) needed for a selection of output columns
+
+    Dimension columns are always part of the output and may be left out of the
+    selection. Periods are in output order and only those with a selected
+    measure are included.
+    """
+    measures_by_column = column_measures(launch_windows)
+    unknown = [column for column in columns if column not in measures_by_column and column not in OUTPUT_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown output column(s): {', '.join(unknown)}")
+    selected = list(dict.fromkeys(column for column in columns if column in measures_by_column))
+    needed = {}
+    for column in selected:
+        period, measure = measures_by_column[column]
+        needed.setdefault(period, set()).add(measure)
+    return selected, {period: needed[period] for period in period_names(launch_windows) if period in needed}
+
+def excel_layout(launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """(columns, uv_col_indices, collapse_groups) of the output sheet
+
+    Dimensions first, then the UV columns of every period, then the other
+    metrics of each period as one collapsed column group per period.
+    """
+    periods = period_names(launch_windows)
+    uv_positions = [PERIOD_MEASURES.index(measure) for measure in UV_MEASURES]
+    other_positions = [i for i in range(len(PERIOD_MEASURES)) if i not in uv_positions]
+
+    columns = list(OUTPUT_DIMENSIONS)
+    for period in periods:
+        names = period_columns(period)
+        columns += [names[i] for i in uv_positions]
+    uv_col_indices = set(range(len(OUTPUT_DIMENSIONS) + 1, len(columns) + 1))
+
+    collapse_groups = []
+    for period in periods:
+        names = period_columns(period)
+        start = len(columns) + 1
+        columns += [names[i] for i in other_positions]
+        collapse_groups.append((start, len(columns)))
+    return columns, uv_col_indices, collapse_groups
+
+def period_label(period):
+    if period == 'all':
+        return 'All-time'
+    if period == 'ty':
+        return 'This year'
+    return f'First {period[1:]} days'
+
+def period_membership_table(launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Periods of a row, indexed by [is_current_year][min(max(days_since_first, 0), horizon)]
+
+    horizon is the largest launch window; rows at or beyond it are in no window.
+    """
+    windows = check_launch_windows(launch_windows)
+    horizon = windows[0] if windows else 0
+    table = []
+    for is_current_year in (False, True):
+        base = ('all', 'ty') if is_current_year else ('all',)
+        table.append([base + tuple(f'd{n}' for n in windows if days < n) for days in range(horizon + 1)])
+    return table
+
+class DateOrdinals(dict):
+    """'%Y-%m-%d' date string -> ordinal day number, each distinct date parsed once"""
+
+    def __missing__(self, date_str):
+        ordinal = self[date_str] = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+        return ordinal
+
+# Visitor-set kinds each engine can aggregate with; the columnar engine counts exact distinct codes in NumPy
+ENGINE_VISITOR_SETS = {
+    'python': ('set', 'bitmap', 'hll'),
+    'columnar': ('set',),
+    'parallel': ('set', 'bitmap', 'hll'),
+}
+
+def check_engine_options(engine, visitor_sets):
+    """Raise ValueError for an unknown engine or a visitor-set kind the engine does not support"""
+    if engine not in ENGINE_VISITOR_SETS:
+        raise ValueError(f"Unknown engine: {engine!r}")
+    if visitor_sets not in ENGINE_VISITOR_SETS[engine]:
+        raise ValueError(f"engine={engine!r} does not support visitor_sets={visitor_sets!r}; "
+                         f"use one of {', '.join(ENGINE_VISITOR_SETS[engine])}")
+
+def generate_complete_output(interactions, employees, pages, dates, engine='python', visitor_sets='set',
+                             hll_precision=None, workers=None, launch_windows=DEFAULT_LAUNCH_WINDOWS, compact=False,
+                             columns=None):
+    """Generate complete output with ALL 93 columns
+
+    engine='columnar' runs the NumPy-backed engine in columnar_engine.py, which
+    produces identical rows but scales to production-size interaction volumes.
+    It also takes interactions as the NumPy column chunks of generate_scale_data.py.
+    engine='parallel' aggregates websites in a pool of `workers` processes
+    (parallel_aggregation.py), also with identical rows.
+    visitor_sets='bitmap' stores every UV set as a VisitorBitmap of encoded
+    contacts instead of a Python set of contact id strings; visitor_sets='hll'
+    makes the UV columns HyperLogLog estimates with the given hll_precision.
+    launch_windows sets the 'd<N>' periods (default 28, 21, 14 and 7 days).
+    compact=True returns the rows as a RecordTable (compact_records.py) instead
+    of a list of dicts. The inputs may be RecordTables or lists of dicts.
+    columns selects output columns, e.g. ['site_uniquevisitor7']: rows then
+    hold the grain dimensions plus those columns, and only the periods and
+    aggregation levels they need are accumulated.
+    Unsupported engine and visitor_sets combinations raise ValueError.
+    """
+    check_engine_options(engine, visitor_sets)
+    if engine == 'columnar':
+        from columnar_engine import generate_complete_output_columnar
+        return generate_complete_output_columnar(interactions, employees, pages, dates, launch_windows=launch_windows,
+                                                 columns=columns, compact=compact)
+    if engine == 'parallel':
+        from parallel_aggregation import generate_complete_output_parallel
+        return generate_complete_output_parallel(interactions, employees, pages, dates, workers=workers,
+                                                 visitor_sets=visitor_sets, hll_precision=hll_precision,
+                                                 launch_windows=launch_windows, compact=compact, columns=columns)
+
+    with instrumentation.stage('mindate'):
+        page_mindates = compute_page_mindates(interactions)
+    state = AggregationState(employees, pages, dates, page_mindates, visitor_sets=visitor_sets,
+                             hll_precision=hll_precision, launch_windows=launch_windows, columns=columns)
+    with instrumentation.stage('fold'):
+        state.fold(interactions)
+    instrumentation.record_level_sizes(state)
+    if instrumentation.is_enabled():
+        # Per-(level, period) costs come from a separate run into a throwaway state
+        AggregationState(employees, pages, dates, page_mindates, visitor_sets=visitor_sets,
+                         hll_precision=hll_precision, launch_windows=launch_windows,
+                         columns=columns).fold_by_level(interactions)
+    return state.output_rows(compact=compact)
+
+def compute_page_mindates(interactions, page_mindates=None):
+    """Calculate mindate for each page; pass page_mindates to fold in further chunks"""
+    if page_mindates is None:
+        page_mindates = {}
+    if isinstance(interactions, RecordTable):
+        rows = interactions.iter_rows(['marketingPageId', 'visit_date'])
+    else:
+        rows = map(itemgetter('marketingPageId', 'visit_date'), interactions)
+    for page_id, date_str in rows:
         if page_id not in page_mindates or date_str < page_mindates[page_id]:
             page_mindates[page_id] = date_str
-
-    # Track aggregations at grain level and all other levels
-    grain_data = defaultdict(lambda: {
-        'all': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-        'ty': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-        'd28': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-        'd21': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-        'd14': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-        'd7': {'uv': set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0},
-    })
-
-    # Aggregations by dimension combinations for each time period
-    agg_levels = {}
-    for period in ['all', 'ty', 'd28', 'd21', 'd14', 'd7']:
-        agg_levels[period] = {
-            'overall': set(),
-            'div': defaultdict(set),
-            'reg': defaultdict(set),
-            'site': defaultdict(set),
-            'site_div': defaultdict(set),
-            'site_reg': defaultdict(set),
-            'site_div_reg': defaultdict(set),
-        }
-
-    # Process interactions
-    for interaction in interactions:
-        emp = emp_lookup[interaction['viewingcontactid']]
-        page = page_lookup[interaction['marketingPageId']]
-        date = date_lookup[interaction['visitdatekey']]
-
-        division = emp['employeebusinessdivision'] or 'Unknown'
-        region = emp['employeeregion'] or 'Unknown'
-        website = page['websitename']
-        page_id = interaction['marketingPageId']
-        visitor = interaction['viewingcontactid']
-        is_current_year = date['year'] == 2024
-
-        # Calculate days since first interaction for this page
-        mindate = page_mindates.get(page_id)
-        if mindate:
-            days_since = calculate_days_since_first(date['date'], mindate)
+    return page_mindates
+
+# Interaction fields read by AggregationState.resolve, in the order it unpacks them
+FOLD_COLUMNS = ['viewingcontactid', 'marketingPageId', 'visitdatekey', 'views', 'visits', 'comments',
+                'marketingPageIdliked']
+
+class FoldRows(list):
+    """Interactions as plain value tuples in FOLD_COLUMNS order, e.g. a shard sent to a worker process"""
+
+# Key of each rollup level, taken from the grain key (page_id, division, region, website)
+LEVEL_KEYS = {
+    'div': itemgetter(1),
+    'reg': itemgetter(2),
+    'site': itemgetter(3),
+    'site_div': itemgetter(3, 1),
+    'site_reg': itemgetter(3, 2),
+    'site_div_reg': itemgetter(3, 1, 2),
+}
+
+# Resolved rows per pass of the per-level fold used while profiling
+PROFILE_CHUNK_ROWS = 100_000
+
+# Grain metrics of a period whose grain measures are not accumulated
+EMPTY_GRAIN_METRICS = {'uv': frozenset(), 'likes': frozenset(), 'views': 0, 'visits': 0, 'comments': 0}
+
+class AggregationState:
+    """Grain and rollup accumulators that interactions are folded into chunk by chunk
+
+    Memory is bounded by the number of distinct grain and level keys, not by the
+    number of interactions, so in-memory lists and streamed extracts share it.
+    page_mindates must already cover every page that will be folded in.
+    With columns, only the periods and levels those output columns need are
+    accumulated (see select_measures).
+    """
+
+    def __init__(self, employees, pages, dates, page_mindates, visitor_sets='set', hll_precision=None,
+                 launch_windows=DEFAULT_LAUNCH_WINDOWS, columns=None):
+        self.new_set, self.encode = visitor_set_factory(visitor_sets, hll_precision)
+        self.emp_lookup = {e['contactid']: e for e in employees}
+        self.page_lookup = {p['marketingPageId']: p for p in pages}
+        self.date_lookup = {d['date_key']: d for d in dates}
+        self.page_mindates = page_mindates
+        self.launch_windows = launch_windows
+        if columns is None:
+            self.columns = None
+            self.measures = {period: set(PERIOD_MEASURES) for period in period_names(launch_windows)}
         else:
-            days_since = 0
-
-        # Main grain key
-        key = (page_id, division, region, website)
-
-        # Accumulate metrics for all time periods
-        periods_to_update = ['all']
-        if is_current_year:
-            periods_to_update.append('ty')
-        if days_since <= 27:
-            periods_to_update.append('d28')
-        if days_since <= 20:
-            periods_to_update.append('d21')
-        if days_since <= 13:
-            periods_to_update.append('d14')
-        if days_since <= 6:
-            periods_to_update.append('d7')
-
-        for period in periods_to_update:
-            # Grain level
-            grain_data[key][period]['uv'].add(visitor)
-            grain_data[key][period]['views'] += interaction['views']
-            grain_data[key][period]['visits'] += interaction['visits']
-            grain_data[key][period]['comments'] += interaction['comments']
-            if interaction['marketingPageIdliked']:
-                grain_data[key][period]['likes'].add(interaction['marketingPageIdliked'])
-
-            # Other aggregation levels
-            agg_levels[period]['overall'].add(visitor)
-            agg_levels[period]['div'][division].add(visitor)
-            agg_levels[period]['reg'][region].add(visitor)
-            agg_levels[period]['site'][website].add(visitor)
-            agg_levels[period]['site_div'][(website, division)].add(visitor)
-            agg_levels[period]['site_reg'][(website, region)].add(visitor)
-            agg_levels[period]['site_div_reg'][(website, division, region)].add(visitor)
-
-    # Build output rows with all 93 columns
-    output = []
-    for key, metrics in grain_data.items():
-        page_id, division, region, website = key
-        page = page_lookup[page_id]
-
-        row = {
-            # Dimensions (4 columns)
-            'marketingPageId': page_id,
-            'employeebusinessdivision': division,
-            'employeeregion': region,
-            'websitename': website,
-
-            # All-time metrics (div_reg level) - 9 columns
-            'div_reg_views': metrics['all']['views'],
-            'div_reg_visits': metrics['all']['visits'],
-            'div_reg_comments': metrics['all']['comments'],
-            'div_reg_likes': len(metrics['all']['likes']),
-            'div_reg_uniquevisitor': len(metrics['all']['uv']),
-            'div_uniquevisitor': len(agg_levels['all']['div'][division]),
-            'reg_uniquevisitor': len(agg_levels['all']['reg'][region]),
-            'uniquevisitor': len(agg_levels['all']['overall']),
-            'site_uniquevisitor': len(agg_levels['all']['site'][website]),
-            'site_div_uniquevisitor': len(agg_levels['all']['site_div'][(website, division)]),
-            'site_reg_uniquevisitor': len(agg_levels['all']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitor': len(agg_levels['all']['site_div_reg'][(website, division, region)]),
-
-            # This year metrics - 13 columns
-            'div_reg_viewty': metrics['ty']['views'],
-            'div_reg_visitsty': metrics['ty']['visits'],
-            'div_reg_commentsty': metrics['ty']['comments'],
-            'div_reg_likesty': len(metrics['ty']['likes']),
-            'div_reg_uniquevisitorty': len(metrics['ty']['uv']),
-            'div_uniquevisitorty': len(agg_levels['ty']['div'][division]),
-            'reg_uniquevisitorty': len(agg_levels['ty']['reg'][region]),
-            'uniquevisitorty': len(agg_levels['ty']['overall']),
-            'site_uniquevisitorTY': len(agg_levels['ty']['site'][website]),
-            'site_div_uniquevisitorTY': len(agg_levels['ty']['site_div'][(website, division)]),
-            'site_reg_uniquevisitorTY': len(agg_levels['ty']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitorTY': len(agg_levels['ty']['site_div_reg'][(website, division, region)]),
-
-            # 28 days metrics - 13 columns
-            'div_reg_views28': metrics['d28']['views'],
-            'div_reg_visits28': metrics['d28']['visits'],
-            'div_reg_comments28': metrics['d28']['comments'],
-            'div_reg_likes28': len(metrics['d28']['likes']),
-            'div_reg_uniquevisitor28': len(metrics['d28']['uv']),
-            'div_uniquevisitor28': len(agg_levels['d28']['div'][division]),
-            'reg_uniquevisitor28': len(agg_levels['d28']['reg'][region]),
-            'uniquevisitor28': len(agg_levels['d28']['overall']),
-            'site_uniquevisitor28': len(agg_levels['d28']['site'][website]),
-            'site_div_uniquevisitor28': len(agg_levels['d28']['site_div'][(website, division)]),
-            'site_reg_uniquevisitor28': len(agg_levels['d28']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitor28': len(agg_levels['d28']['site_div_reg'][(website, division, region)]),
-
-            # 21 days metrics - 13 columns
-            'div_reg_views21': metrics['d21']['views'],
-            'div_reg_visits21': metrics['d21']['visits'],
-            'div_reg_comments21': metrics['d21']['comments'],
-            'div_reg_likes21': len(metrics['d21']['likes']),
-            'div_reg_uniquevisitor21': len(metrics['d21']['uv']),
-            'div_uniquevisitor21': len(agg_levels['d21']['div'][division]),
-            'reg_uniquevisitor21': len(agg_levels['d21']['reg'][region]),
-            'uniquevisitor21': len(agg_levels['d21']['overall']),
-            'site_uniquevisitor21': len(agg_levels['d21']['site'][website]),
-            'site_div_uniquevisitor21': len(agg_levels['d21']['site_div'][(website, division)]),
-            'site_reg_uniquevisitor21': len(agg_levels['d21']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitor21': len(agg_levels['d21']['site_div_reg'][(website, division, region)]),
-
-            # 14 days metrics - 13 columns
-            'div_reg_views14': metrics['d14']['views'],
-            'div_reg_visits14': metrics['d14']['visits'],
-            'div_reg_comments14': metrics['d14']['comments'],
-            'div_reg_likes14': len(metrics['d14']['likes']),
-            'div_reg_uniquevisitor14': len(metrics['d14']['uv']),
-            'div_uniquevisitor14': len(agg_levels['d14']['div'][division]),
-            'reg_uniquevisitor14': len(agg_levels['d14']['reg'][region]),
-            'uniquevisitor14': len(agg_levels['d14']['overall']),
-            'site_uniquevisitor14': len(agg_levels['d14']['site'][website]),
-            'site_div_uniquevisitor14': len(agg_levels['d14']['site_div'][(website, division)]),
-            'site_reg_uniquevisitor14': len(agg_levels['d14']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitor14': len(agg_levels['d14']['site_div_reg'][(website, division, region)]),
-
-            # 7 days metrics - 13 columns
-            'div_reg_views7': metrics['d7']['views'],
-            'div_reg_visits7': metrics['d7']['visits'],
-            'div_reg_comments7': metrics['d7']['comments'],
-            'div_reg_likes7': len(metrics['d7']['likes']),
-            'div_reg_uniquevisitor7': len(metrics['d7']['uv']),
-            'div_uniquevisitor7': len(agg_levels['d7']['div'][division]),
-            'reg_uniquevisitor7': len(agg_levels['d7']['reg'][region]),
-            'uniquevisitor7': len(agg_levels['d7']['overall']),
-            'site_uniquevisitor7': len(agg_levels['d7']['site'][website]),
-            'site_div_uniquevisitor7': len(agg_levels['d7']['site_div'][(website, division)]),
-            'site_reg_uniquevisitor7': len(agg_levels['d7']['site_reg'][(website, region)]),
-            'site_div_reg_uniquevisitor7': len(agg_levels['d7']['site_div_reg'][(website, division, region)]),
-        }
-
-        output.append(row)
-
-    return sorted(output, key=lambda x: (x['websitename'], x['employeebusinessdivision'], x['employeeregion'], x['marketingPageId']))
+            self.columns, self.measures = select_measures(columns, launch_windows)
+        self.periods = list(self.measures)
+        self.memberships = [[tuple(period for period in periods if period in self.measures) for periods in row]
+                            for row in period_membership_table(launch_windows)]
+        self.ordinals = DateOrdinals()
+
+        # Track aggregations at grain level and all other levels
+        self.grain_periods = [period for period, measures in self.measures.items()
+                              if not measures.isdisjoint(GRAIN_MEASURES)]
+        self.grain_data = defaultdict(self._new_grain_metrics)
+
+        # Aggregations by dimension combinations for each time period
+        self.agg_levels = {}
+        for period, measures in self.measures.items():
+            levels = {}
+            if 'overall' in measures:
+                levels['overall'] = self.new_set()
+            for level in LEVEL_KEYS:
+                if level in measures:
+                    levels[level] = defaultdict(self.new_set)
+            self.agg_levels[period] = levels
+
+    def _new_grain_metrics(self):
+        new_set = self.new_set
+        if self.columns is None:
+            return {period: {'uv': new_set(), 'likes': set(), 'views': 0, 'visits': 0, 'comments': 0}
+                    for period in self.periods}
+        metrics = {}
+        for period in self.grain_periods:
+            measures = self.measures[period]
+            metrics[period] = {'uv': new_set() if 'uv' in measures else frozenset(),
+                               'likes': set() if 'likes' in measures else frozenset(),
+                               'views': 0, 'visits': 0, 'comments': 0}
+        return metrics
+
+    def resolve(self, interactions):
+        """Yield (grain key, visitor, periods, (views, visits, comments, liked)) for each interaction
+
+        The grain key is (page_id, division, region, website), visitor is encoded
+        for the visitor-set kind, and periods are the periods the row counts in.
+        interactions is a list of dicts, a RecordTable (read column-wise) or FoldRows.
+        """
+        emp_lookup = self.emp_lookup
+        page_lookup = self.page_lookup
+        date_lookup = self.date_lookup
+        page_mindates = self.page_mindates
+        encode = self.encode
+        memberships = self.memberships
+        horizon = len(memberships[0]) - 1
+        ordinals = self.ordinals
+
+        if isinstance(interactions, FoldRows):
+            rows = interactions
+        elif isinstance(interactions, RecordTable):
+            rows = interactions.iter_rows(FOLD_COLUMNS)
+        else:
+            rows = map(itemgetter(*FOLD_COLUMNS), interactions)
+
+        for visitor, page_id, date_key, views, visits, comments, liked in rows:
+            emp = emp_lookup[visitor]
+            page = page_lookup[page_id]
+            date = date_lookup[date_key]
+
+            division = emp['employeebusinessdivision'] or 'Unknown'
+            region = emp['employeeregion'] or 'Unknown'
+            website = page['websitename']
+            if encode:
+                visitor = encode(visitor)
+            is_current_year = date['year'] == 2024
+
+            # Days since first interaction for this page, as integer day offsets
+            mindate = page_mindates.get(page_id)
+            if mindate:
+                days_since = ordinals[date['date']] - ordinals[mindate]
+            else:
+                days_since = 0
+
+            # Main grain key
+            key = (page_id, division, region, website)
+
+            # All time periods the row belongs to
+            yield key, visitor, memberships[is_current_year][min(max(days_since, 0), horizon)], \
+                (views, visits, comments, liked)
+
+    def fold(self, interactions):
+        """Accumulate a chunk of interactions into the grain and level aggregates"""
+        if self.columns is not None:
+            return self._fold_selected(interactions)
+
+        grain_data = self.grain_data
+        agg_levels = self.agg_levels
+
+        for key, visitor, periods_to_update, (views, visits, comments, liked) in self.resolve(interactions):
+            page_id, division, region, website = key
+
+            grain = grain_data[key]
+
+            # Accumulate metrics for all time periods the row belongs to
+            for period in periods_to_update:
+                # Grain level
+                metrics = grain[period]
+                metrics['uv'].add(visitor)
+                metrics['views'] += views
+                metrics['visits'] += visits
+                metrics['comments'] += comments
+                if liked:
+                    metrics['likes'].add(liked)
+
+                # Other aggregation levels
+                levels = agg_levels[period]
+                levels['overall'].add(visitor)
+                levels['div'][division].add(visitor)
+                levels['reg'][region].add(visitor)
+                levels['site'][website].add(visitor)
+                levels['site_div'][(website, division)].add(visitor)
+                levels['site_reg'][(website, region)].add(visitor)
+                levels['site_div_reg'][(website, division, region)].add(visitor)
+
+    def _fold_plans(self):
+        """Per period: (grain?, grain uv?, grain likes?, overall set or None, [(level sets, level key)])"""
+        plans = {}
+        for period, measures in self.measures.items():
+            levels = self.agg_levels[period]
+            plans[period] = (period in self.grain_periods, 'uv' in measures, 'likes' in measures,
+                             levels.get('overall'),
+                             [(levels[level], level_key) for level, level_key in LEVEL_KEYS.items() if level in levels])
+        return plans
+
+    def _fold_selected(self, interactions):
+        """fold() for a column selection, touching only the accumulators it needs"""
+        grain_data = self.grain_data
+        plans = self._fold_plans()
+
+        for key, visitor, periods_to_update, (views, visits, comments, liked) in self.resolve(interactions):
+            grain = grain_data[key]
+            for period in periods_to_update:
+                has_grain, wants_uv, wants_likes, overall, level_sets = plans[period]
+                if has_grain:
+                    metrics = grain[period]
+                    metrics['views'] += views
+                    metrics['visits'] += visits
+                    metrics['comments'] += comments
+                    if wants_uv:
+                        metrics['uv'].add(visitor)
+                    if wants_likes and liked:
+                        metrics['likes'].add(liked)
+                if overall is not None:
+                    overall.add(visitor)
+                for sets, level_key in level_sets:
+                    sets[level_key(key)].add(visitor)
+
+    def fold_by_level(self, interactions):
+        """fold() as separately timed 'breakdown/...' stages: period bucketing, then each (level, period)
+
+        The result is the same as fold(), but the passes are not the single
+        pass fold() makes, so the --profile breakdown runs it on a throwaway
+        state after the timed fold. The passes run over chunks of
+        PROFILE_CHUNK_ROWS resolved rows, so it holds one chunk at a time.
+        """
+        plans = self._fold_plans()
+        resolved = self.resolve(interactions)
+        while True:
+            with instrumentation.stage('breakdown/periods'):
+                chunk = list(islice(resolved, PROFILE_CHUNK_ROWS))
+                # Every grain key gets a row, whichever periods it is in
+                for row in chunk:
+                    self.grain_data[row[0]]
+            if not chunk:
+                break
+            instrumentation.count('interactions', len(chunk))
+            self._fold_chunk_by_level(chunk, plans)
+
+    def _fold_chunk_by_level(self, resolved, plans):
+        """The timed (level, period) passes over one chunk of resolve() rows"""
+        for period in self.periods:
+            rows = [row for row in resolved if period in row[2]]
+            instrumentation.count(f'rows in period {period}', len(rows))
+
+            grain_data = self.grain_data
+            has_grain, wants_uv, wants_likes, overall, _ = plans[period]
+            if has_grain:
+                with instrumentation.stage(f'breakdown/grain/{period}'):
+                    for key, visitor, _, (views, visits, comments, liked) in rows:
+                        metrics = grain_data[key][period]
+                        if wants_uv:
+                            metrics['uv'].add(visitor)
+                        metrics['views'] += views
+                        metrics['visits'] += visits
+                        metrics['comments'] += comments
+                        if liked and wants_likes:
+                            metrics['likes'].add(liked)
+
+            levels = self.agg_levels[period]
+            if overall is not None:
+                with instrumentation.stage(f'breakdown/overall/{period}'):
+                    for _, visitor, _, _ in rows:
+                        overall.add(visitor)
+            for level, level_key in LEVEL_KEYS.items():
+                if level not in levels:
+                    continue
+                with instrumentation.stage(f'breakdown/{level}/{period}'):
+                    sets = levels[level]
+                    for key, visitor, _, _ in rows:
+                        sets[level_key(key)].add(visitor)
+
+    def partial(self):
+        """Accumulators as plain dicts, to ship from a worker process and merge()"""
+        agg_levels = {period: {level: values if level == 'overall' else dict(values)
+                               for level, values in levels.items()}
+                      for period, levels in self.agg_levels.items()}
+        return dict(self.grain_data), agg_levels
+
+    def merge(self, partial):
+        """Union another state's partial() into this one
+
+        Visitors must be encoded the same way on both sides (string ids, HLL
+        hashes, or bitmap codes from a shared pre-encoding of the employees).
+        """
+        grain_data, agg_levels = partial
+        for key, metrics in grain_data.items():
+            if key not in self.grain_data:
+                self.grain_data[key] = metrics
+                continue
+            for period, values in metrics.items():
+                target = self.grain_data[key][period]
+                target['uv'] |= values['uv']
+                target['likes'] |= values['likes']
+                target['views'] += values['views']
+                target['visits'] += values['visits']
+                target['comments'] += values['comments']
+
+        for period, levels in agg_levels.items():
+            for level, values in levels.items():
+                if level == 'overall':
+                    self.agg_levels[period]['overall'] |= values
+                    continue
+                target = self.agg_levels[period][level]
+                for key, visitors in values.items():
+                    if key in target:
+                        target[key] |= visitors
+                    else:
+                        target[key] = visitors
+
+    def output_columns(self):
+        """Column names of the output rows: the dimensions, then PERIOD_MEASURES for each period
+
+        With a column selection: the dimensions, then the selected columns.
+        """
+        if self.columns is not None:
+            return OUTPUT_DIMENSIONS + self.columns
+        return output_columns(self.launch_windows)
+
+    def level_cardinalities(self):
+        """Distinct visitors per rollup key, frozen into plain dicts: {period: {level: {level key: count}}}
+
+        The overall count is stored under the key (). Lookups into the result
+        never insert into the defaultdict accumulators.
+        """
+        tables = {}
+        for period, levels in self.agg_levels.items():
+            table = {}
+            if 'overall' in levels:
+                table['overall'] = {(): len(levels['overall'])}
+            for level in LEVEL_KEYS:
+                if level in levels:
+                    table[level] = {key: len(visitors) for key, visitors in levels[level].items()}
+            tables[period] = table
+        return tables
+
+    def output_rows(self, keys=None, compact=False):
+        """Build output rows with all output columns, optionally only for the given grain keys
+
+        Rows are dicts, or one RecordTable with compact=True.
+        """
+        grain_data = self.grain_data
+        items = grain_data.items() if keys is None else ((key, grain_data[key]) for key in keys)
+        with instrumentation.stage('freeze'):
+            cardinalities = self.level_cardinalities()
+        with instrumentation.stage('rows'):
+            output = self._materialise_rows(items, cardinalities)
+        with instrumentation.stage('sort'):
+            # (websitename, division, region, marketingPageId)
+            output.sort(key=itemgetter(3, 1, 2, 0))
+        columns = self.output_columns()
+        if compact:
+            return RecordTable.from_rows(columns, output)
+        return [dict(zip(columns, values)) for values in output]
+
+    def _materialise_rows(self, items, cardinalities):
+        """Value tuples in output_columns() order"""
+        periods = self.periods
+        # Levels that are not accumulated count as 0
+        level_tables = [[(cardinalities[period].get(level, {}), LEVEL_KEYS.get(level, lambda key: ()))
+                         for level in LEVEL_MEASURES] for period in periods]
+        project = None
+        if self.columns is not None:
+            # Rows are built with every column of the accumulated periods, then projected
+            measures_by_column = column_measures(self.launch_windows)
+            full_columns = [column for column in output_columns(self.launch_windows)
+                            if column in OUTPUT_DIMENSIONS or measures_by_column[column][0] in periods]
+            project = itemgetter(*(full_columns.index(column) for column in self.output_columns()))
+        # Level counts of each period depend only on (division, region, website), shared by its pages
+        cell_counts = {}
+        output = []
+        for key, metrics in items:
+            cell = key[1:]
+            counts = cell_counts.get(cell)
+            if counts is None:
+                counts = cell_counts[cell] = [tuple(table.get(level_key(key), 0) for table, level_key in tables)
+                                              for tables in level_tables]
+
+            # Dimensions, then PERIOD_MEASURES per period: grain sums and UV, then the level UVs
+            row = list(key)
+            for period, level_counts in zip(periods, counts):
+                grain = metrics.get(period, EMPTY_GRAIN_METRICS)
+                row += (grain['views'], grain['visits'], grain['comments'], len(grain['likes']), len(grain['uv']))
+                row += level_counts
+            output.append(project(row) if project else tuple(row))
+        return output
+
+# Header colors: dimensions, prominent UV colors and muted colors for other metrics
+DIMENSION_COLOR = '4472C4'
+UV_ALLTIME_COLOR = '00B050'  # Bright green
+UV_THISYEAR_COLOR = 'FF6600'  # Bright orange
+UV_DAYS_COLOR = '0099CC'  # Bright blue
+OTHER_ALLTIME_COLOR = 'A9D08E'  # Pale green
+OTHER_THISYEAR_COLOR = 'FFD966'  # Pale orange
+OTHER_DAYS_COLOR = 'B4C7E7'  # Pale blue
+HEADER_COLORS = [DIMENSION_COLOR, UV_ALLTIME_COLOR, UV_THISYEAR_COLOR, UV_DAYS_COLOR,
+                 OTHER_ALLTIME_COLOR, OTHER_THISYEAR_COLOR, OTHER_DAYS_COLOR]
+
+def header_fill_color(col_num, column_name, uv_col_indices):
+    """Header color for a column of the output sheet - UV columns get special treatment"""
+    if col_num <= 4:
+        # Dimensions
+        return DIMENSION_COLOR
+    is_this_year = 'ty' in column_name.lower() or 'TY' in column_name
+    # Launch-window columns end in their day count (div_reg_uniquevisitor28, div_reg_likes7, ...)
+    is_days = column_name[-1:].isdigit()
+    if col_num in uv_col_indices:
+        # UV columns - prominent colors
+        if is_this_year:
+            return UV_THISYEAR_COLOR
+        return UV_DAYS_COLOR if is_days else UV_ALLTIME_COLOR
+    # Non-UV columns - muted colors
+    if is_this_year:
+        return OTHER_THISYEAR_COLOR
+    return OTHER_DAYS_COLOR if is_days else OTHER_ALLTIME_COLOR
 
 def format_header(ws, columns, uv_col_indices):
     """Format header with color coding - UV columns get special treatment"""
-    dimension_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-
-    # UV-specific colors (more vibrant/prominent)
-    uv_alltime_fill = PatternFill(start_color='00B050', end_color='00B050', fill_type='solid')  # Bright green
-    uv_thisyear_fill = PatternFill(start_color='FF6600', end_color='FF6600', fill_type='solid')  # Bright orange
-    uv_days_fill = PatternFill(start_color='0099CC', end_color='0099CC', fill_type='solid')  # Bright blue
-
-    # Non-UV colors (muted)
-    other_alltime_fill = PatternFill(start_color='A9D08E', end_color='A9D08E', fill_type='solid')  # Pale green
-    other_thisyear_fill = PatternFill(start_color='FFD966', end_color='FFD966', fill_type='solid')  # Pale orange
-    other_days_fill = PatternFill(start_color='B4C7E7', end_color='B4C7E7', fill_type='solid')  # Pale blue
-
+    fills = {}
     header_font = Font(bold=True, color='FFFFFF', size=9)
 
     for col_num, column_name in enumerate(columns, 1):
@@ -330,48 +751,39 @@ def format_header(ws, columns, uv_col_indices):
         cell.font = header_font
         cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
 
-        if col_num <= 4:
-            # Dimensions
-            cell.fill = dimension_fill
-        elif col_num in uv_col_indices:
-            # UV columns - prominent colors
-            if 'ty' in column_name.lower() or 'TY' in column_name:
-                cell.fill = uv_thisyear_fill
-            elif any(d in column_name for d in ['28', '21', '14', '7']):
-                cell.fill = uv_days_fill
-            else:
-                cell.fill = uv_alltime_fill
-        else:
-            # Non-UV columns - muted colors
-            if 'ty' in column_name.lower() or 'TY' in column_name:
-                cell.fill = other_thisyear_fill
-            elif any(d in column_name for d in ['28', '21', '14', '7']):
-                cell.fill = other_days_fill
-            else:
-                cell.fill = other_alltime_fill
+        color = header_fill_color(col_num, column_name, uv_col_indices)
+        if color not in fills:
+            fills[color] = PatternFill(start_color=color, end_color=color, fill_type='solid')
+        cell.fill = fills[color]
+
+def column_width(max_length):
+    """Column width used by auto_size_columns for the longest value in a column"""
+    return min(max(max_length + 2, 10), 35)
 
 def auto_size_columns(ws):
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max(max_length + 2, 10), 35)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    with instrumentation.stage('auto_size_columns'):
+        for column in ws.columns:
+            max_length = 0
+            column_letter = get_column_letter(column[0].column)
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            adjusted_width = column_width(max_length)
+            ws.column_dimensions[column_letter].width = adjusted_width
 
 def add_data_to_sheet(ws, data, columns, uv_col_indices=None, collapse_groups=None):
-    for row_num, record in enumerate(data, 2):
-        for col_num, column in enumerate(columns, 1):
-            cell = ws.cell(row=row_num, column=col_num)
-            cell.value = record.get(column)
-            if isinstance(record.get(column), (int, float)):
-                cell.alignment = Alignment(horizontal='right')
-            else:
-                cell.alignment = Alignment(horizontal='left')
+    with instrumentation.stage('add_data_to_sheet'):
+        for row_num, record in enumerate(data, 2):
+            for col_num, column in enumerate(columns, 1):
+                cell = ws.cell(row=row_num, column=col_num)
+                cell.value = record.get(column)
+                if isinstance(record.get(column), (int, float)):
+                    cell.alignment = Alignment(horizontal='right')
+                else:
+                    cell.alignment = Alignment(horizontal='left')
 
     if uv_col_indices:
         format_header(ws, columns, uv_col_indices)
@@ -394,45 +806,191 @@ def add_data_to_sheet(ws, data, columns, uv_col_indices=None, collapse_groups=No
         for start_col, end_col in collapse_groups:
             ws.column_dimensions.group(get_column_letter(start_col), get_column_letter(end_col), outline_level=1, hidden=True)
 
+def register_named_styles(wb):
+    """Register the shared header and data cell styles once per workbook"""
+    if 'data_right' in wb.named_styles:
+        return
+    wb.add_named_style(NamedStyle(name='data_right', font=copy(DEFAULT_FONT), alignment=Alignment(horizontal='right')))
+    wb.add_named_style(NamedStyle(name='data_left', font=copy(DEFAULT_FONT), alignment=Alignment(horizontal='left')))
+    for color in HEADER_COLORS:
+        for wrap_text in (False, True):
+            wb.add_named_style(NamedStyle(
+                name=f'header_{color}_wrap' if wrap_text else f'header_{color}',
+                font=Font(bold=True, color='FFFFFF', size=9),
+                fill=PatternFill(start_color=color, end_color=color, fill_type='solid'),
+                alignment=Alignment(horizontal='center', vertical='center', wrap_text=wrap_text or None)))
+
+def write_data_sheet(wb, title, data, columns, uv_col_indices=None, collapse_groups=None):
+    """Write-only equivalent of add_data_to_sheet for a Workbook(write_only=True)
+
+    Cells share cached named styles instead of a new Alignment each. Column
+    widths are measured in a first pass over the data and the rows are streamed
+    out in a second, so no copy of the row values is held and the worksheet is
+    not re-walked by auto_size_columns.
+    """
+    register_named_styles(wb)
+    ws = wb.create_sheet(title)
+
+    # Measure column widths first (str(None) counts as 'None')
+    max_lengths = [len(str(column)) for column in columns]
+    with instrumentation.stage('write_data_sheet/measure'):
+        for values in iter_row_values(data, columns):
+            for i, value in enumerate(values):
+                length = len(str(value))
+                if length > max_lengths[i]:
+                    max_lengths[i] = length
+
+    # Column dimensions have to be in place before the first row is streamed
+    for col_num, max_length in enumerate(max_lengths, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = column_width(max_length)
+    ws.freeze_panes = 'A2'
+    if collapse_groups:
+        for start_col, end_col in collapse_groups:
+            ws.column_dimensions.group(get_column_letter(start_col), get_column_letter(end_col), outline_level=1, hidden=True)
+
+    header = []
+    for col_num, column_name in enumerate(columns, 1):
+        cell = WriteOnlyCell(ws, value=column_name)
+        if uv_col_indices:
+            cell.style = f'header_{header_fill_color(col_num, column_name, uv_col_indices)}_wrap'
+        else:
+            cell.style = f'header_{DIMENSION_COLOR}'
+        header.append(cell)
+    ws.append(header)
+
+    with instrumentation.stage('write_data_sheet/stream'):
+        for values in iter_row_values(data, columns):
+            row = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = 'data_right' if isinstance(value, (int, float)) else 'data_left'
+                row.append(cell)
+            ws.append(row)
+    return ws
+
+# Overview rows (1-based) set in the section heading font
+OVERVIEW_SECTION_ROWS = [3, 6, 12]
+
+def write_overview_sheet(wb, title, overview_data):
+    """Write the overview sheet into a Workbook(write_only=True)"""
+    ws = wb.create_sheet(title)
+    ws.column_dimensions['A'].width = 30
+    ws.column_dimensions['B'].width = 80
+
+    title_font = Font(size=16, bold=True, color='366092')
+    section_font = Font(bold=True, size=11)
+    for row_num, row_data in enumerate(overview_data, 1):
+        row = []
+        for value in row_data:
+            cell = WriteOnlyCell(ws, value=value)
+            if row_num == 1:
+                cell.font = title_font
+            elif row_num in OVERVIEW_SECTION_ROWS:
+                cell.font = section_font
+            row.append(cell)
+        ws.append(row)
+    return ws
+
+DEFAULT_XLSX_PATH = '/Users/micha/Documents/Fabric/sharepoint_analytics_sample_data.xlsx'
+
+# Input tables in workbook order, with the columns written for each
+INPUT_TABLES = {
+    'dim_date': ['date_key', 'date', 'year', 'month', 'day', 'day_of_week'],
+    'employeecontact': ['contactid', 'employeename', 'employeebusinessdivision', 'employeeregion', 'email'],
+    'website_page_inventory': ['marketingPageId', 'websitename', 'pagename', 'page_url', 'created_date'],
+    'interactions_metrics': ['interaction_id', 'viewingcontactid', 'marketingPageId', 'visitdatekey', 'visit_date', 'views', 'visits', 'comments', 'marketingPageIdliked'],
+}
+
 def main():
-    print("Generating complete sample data with all time periods...")
+    from output_sinks import FACT_TABLE, ExcelSink, ParallelExcelSink, ParquetSink
+
+    parser = argparse.ArgumentParser(description='Generate complete sample data with all 93 output columns')
+    parser.add_argument('--xlsx', help=f'workbook to write (default: {DEFAULT_XLSX_PATH} unless --parquet is given)')
+    parser.add_argument('--parquet', help='directory for Parquet copies of the input and fact tables')
+    parser.add_argument('--xlsx-workers', type=int, metavar='N',
+                        help='render the workbook sheets in N worker processes (parallel_workbook.py)')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, help='seed for reproducible data')
+    parser.add_argument('--generator', choices=['random', 'numpy'], default='random',
+                        help="'numpy' uses the vectorised generator from generate_scale_data.py")
+    parser.add_argument('--launch-windows', default=','.join(map(str, DEFAULT_LAUNCH_WINDOWS)),
+                        help='comma-separated launch windows in days, e.g. 3,7,28,60')
+    parser.add_argument('--compact', action='store_true',
+                        help='hold the input tables and the fact output as compact RecordTables (compact_records.py)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print time per stage, with counters and set sizes, and a per-(level, period) breakdown '
+                             'from a separate run of the fold')
+    parser.add_argument('--profile-allocations', action='store_true',
+                        help='like --profile, also tracing allocations per stage with tracemalloc (slower)')
+    parser.add_argument('--cprofile', metavar='FILE', help="run under cProfile and write the stats to FILE ('-' prints them)")
+    args = parser.parse_args()
+    try:
+        launch_windows = parse_launch_windows(args.launch_windows)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if args.profile or args.profile_allocations:
+        instrumentation.enable(trace_allocations=args.profile_allocations)
+    if args.cprofile:
+        instrumentation.start_cprofile()
+
+    sinks = []
+    if args.xlsx or not args.parquet:
+        if args.xlsx_workers:
+            sinks.append(ParallelExcelSink(args.xlsx or DEFAULT_XLSX_PATH, workers=args.xlsx_workers))
+        else:
+            sinks.append(ExcelSink(args.xlsx or DEFAULT_XLSX_PATH))
+    if args.parquet:
+        sinks.append(ParquetSink(args.parquet, launch_windows=launch_windows))
 
-    dates = generate_dim_date(365)
-    employees = generate_employee_contacts(200)
-    pages = generate_website_page_inventory(50)
-    interactions = generate_interactions(1000, employees, pages, dates)
-    aggregated = generate_complete_output(interactions, employees, pages, dates)
+    print("Generating complete sample data with all time periods...")
 
-    print(f"Generated {len(aggregated)} output rows with 93 columns")
+    if args.generator == 'numpy':
+        from generate_scale_data import chunk_to_records, generate_dataset, iter_interaction_chunks_np
 
-    wb = Workbook()
-    wb.remove(wb.active)
+        seed = args.seed or 0
+        dates, employees, pages = generate_dataset(args.employees, len(websites), args.pages, seed=seed)
+        interactions = []
+        for chunk in iter_interaction_chunks_np(args.interactions, len(employees), len(pages), len(dates), seed=seed):
+            interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+    else:
+        interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                     seed=args.seed)
+    if args.compact:
+        dates, employees, pages, interactions = (RecordTable.from_records(records)
+                                                 for records in (dates, employees, pages, interactions))
+    aggregated = generate_complete_output(interactions, employees, pages, dates, launch_windows=launch_windows,
+                                          compact=args.compact)
+
+    output_columns, uv_col_indices, collapse_groups = excel_layout(launch_windows)
+    print(f"Generated {len(aggregated)} output rows with {len(output_columns)} columns")
+    periods = period_names(launch_windows)
+    num_dimensions = len(OUTPUT_DIMENSIONS)
+    num_uv = len(uv_col_indices)
+    num_other = len(output_columns) - num_dimensions - num_uv
+    windows = '/'.join(period[1:] for period in periods[2:])
 
     # Overview sheet
-    ws_overview = wb.create_sheet("📊 Overview", 0)
     overview_data = [
         ['SharePoint Analytics - Complete Data Model'],
         [''],
         ['Purpose', 'Demonstrate the complete SQL output with ALL time periods and aggregation levels'],
         ['Created', datetime.now().strftime('%Y-%m-%d %H:%M')],
         [''],
-        ['Output Structure (76 columns total):'],
-        ['1. Dimensions (4 cols)', 'PageID, Division, Region, Website - the grain of the table'],
-        ['2. UV Columns (48 cols)', 'ALL Unique Visitor metrics across all time periods - MOST IMPORTANT'],
-        ['3. Other Metrics (24 cols)', 'Views, Visits, Comments, Likes - collapsed by default'],
+        [f'Output Structure ({len(output_columns)} columns total):'],
+        [f'1. Dimensions ({num_dimensions} cols)', 'PageID, Division, Region, Website - the grain of the table'],
+        [f'2. UV Columns ({num_uv} cols)', 'ALL Unique Visitor metrics across all time periods - MOST IMPORTANT'],
+        [f'3. Other Metrics ({num_other} cols)', 'Views, Visits, Comments, Likes - collapsed by default'],
         [''],
         ['Column Organization:'],
-        ['• Columns 1-4: Dimensions (Blue headers)'],
-        ['• Columns 5-52: UV metrics (Bright colors - Green/Orange/Blue)'],
-        ['• Columns 53-76: Other metrics (Pale colors - COLLAPSED for focus)'],
+        [f'• Columns 1-{num_dimensions}: Dimensions (Blue headers)'],
+        [f'• Columns {num_dimensions + 1}-{num_dimensions + num_uv}: UV metrics (Bright colors - Green/Orange/Blue)'],
+        [f'• Columns {num_dimensions + num_uv + 1}-{len(output_columns)}: Other metrics (Pale colors - COLLAPSED for focus)'],
         [''],
-        ['UV Metrics Breakdown (48 columns):'],
-        ['• All-time UV: 8 aggregation levels'],
-        ['• This year UV: 8 aggregation levels'],
-        ['• First 28 days UV: 8 aggregation levels'],
-        ['• First 21 days UV: 8 aggregation levels'],
-        ['• First 14 days UV: 8 aggregation levels'],
-        ['• First 7 days UV: 8 aggregation levels'],
+        [f'UV Metrics Breakdown ({num_uv} columns):'],
+        *[[f'• {period_label(period)} UV: {len(UV_MEASURES)} aggregation levels'] for period in periods],
         [''],
         ['UV Aggregation Levels (repeated for each time period):'],
         ['1. div_reg_uniquevisitor', 'Page + Division + Region'],
@@ -448,109 +1006,29 @@ def main():
         ['• Blue = Dimensions'],
         ['• Bright Green = UV all-time (most important)'],
         ['• Bright Orange = UV this year'],
-        ['• Bright Blue = UV first N days (28/21/14/7)'],
+        [f'• Bright Blue = UV first N days ({windows})'],
         ['• Pale colors = Other metrics (views, visits, comments, likes)'],
         [''],
         ['💡 Tip: The other metrics columns are collapsed - expand the groups to see them'],
     ]
 
-    for row_num, row_data in enumerate(overview_data, 1):
-        for col_num, value in enumerate(row_data, 1):
-            cell = ws_overview.cell(row=row_num, column=col_num)
-            cell.value = value
-            if row_num == 1:
-                cell.font = Font(size=16, bold=True, color='366092')
-            elif row_num in [3, 6, 12]:
-                cell.font = Font(bold=True, size=11)
-
-    ws_overview.column_dimensions['A'].width = 30
-    ws_overview.column_dimensions['B'].width = 80
-
-    # Input data sheets
-    ws_dates = wb.create_sheet("dim_date")
-    add_data_to_sheet(ws_dates, dates, ['date_key', 'date', 'year', 'month', 'day', 'day_of_week'])
-
-    ws_employees = wb.create_sheet("employeecontact")
-    add_data_to_sheet(ws_employees, employees, ['contactid', 'employeename', 'employeebusinessdivision', 'employeeregion', 'email'])
-
-    ws_pages = wb.create_sheet("website_page_inventory")
-    add_data_to_sheet(ws_pages, pages, ['marketingPageId', 'websitename', 'pagename', 'page_url', 'created_date'])
-
-    ws_interactions = wb.create_sheet("interactions_metrics")
-    add_data_to_sheet(ws_interactions, interactions, ['interaction_id', 'viewingcontactid', 'marketingPageId', 'visitdatekey', 'visit_date', 'views', 'visits', 'comments', 'marketingPageIdliked'])
-
-    # Output sheet with reorganized columns: Dimensions -> All UV columns -> Other metrics (collapsed)
-    ws_output = wb.create_sheet("⭐ COMPLETE OUTPUT (93 cols)")
-
-    output_columns = [
-        # === DIMENSIONS (4 cols) ===
-        'marketingPageId', 'employeebusinessdivision', 'employeeregion', 'websitename',
-
-        # === ALL UV COLUMNS (48 cols) - MOST IMPORTANT ===
-        # All-time UV (8 cols)
-        'div_reg_uniquevisitor', 'div_uniquevisitor', 'reg_uniquevisitor', 'uniquevisitor',
-        'site_uniquevisitor', 'site_div_uniquevisitor', 'site_reg_uniquevisitor', 'site_div_reg_uniquevisitor',
-
-        # This year UV (8 cols)
-        'div_reg_uniquevisitorty', 'div_uniquevisitorty', 'reg_uniquevisitorty', 'uniquevisitorty',
-        'site_uniquevisitorTY', 'site_div_uniquevisitorTY', 'site_reg_uniquevisitorTY', 'site_div_reg_uniquevisitorTY',
-
-        # 28 days UV (8 cols)
-        'div_reg_uniquevisitor28', 'div_uniquevisitor28', 'reg_uniquevisitor28', 'uniquevisitor28',
-        'site_uniquevisitor28', 'site_div_uniquevisitor28', 'site_reg_uniquevisitor28', 'site_div_reg_uniquevisitor28',
-
-        # 21 days UV (8 cols)
-        'div_reg_uniquevisitor21', 'div_uniquevisitor21', 'reg_uniquevisitor21', 'uniquevisitor21',
-        'site_uniquevisitor21', 'site_div_uniquevisitor21', 'site_reg_uniquevisitor21', 'site_div_reg_uniquevisitor21',
-
-        # 14 days UV (8 cols)
-        'div_reg_uniquevisitor14', 'div_uniquevisitor14', 'reg_uniquevisitor14', 'uniquevisitor14',
-        'site_uniquevisitor14', 'site_div_uniquevisitor14', 'site_reg_uniquevisitor14', 'site_div_reg_uniquevisitor14',
-
-        # 7 days UV (8 cols)
-        'div_reg_uniquevisitor7', 'div_uniquevisitor7', 'reg_uniquevisitor7', 'uniquevisitor7',
-        'site_uniquevisitor7', 'site_div_uniquevisitor7', 'site_reg_uniquevisitor7', 'site_div_reg_uniquevisitor7',
-
-        # === OTHER METRICS (28 cols) - COLLAPSED BY DEFAULT ===
-        # All-time other metrics (4 cols)
-        'div_reg_views', 'div_reg_visits', 'div_reg_comments', 'div_reg_likes',
-
-        # This year other metrics (4 cols)
-        'div_reg_viewty', 'div_reg_visitsty', 'div_reg_commentsty', 'div_reg_likesty',
-
-        # 28 days other metrics (4 cols)
-        'div_reg_views28', 'div_reg_visits28', 'div_reg_comments28', 'div_reg_likes28',
-
-        # 21 days other metrics (4 cols)
-        'div_reg_views21', 'div_reg_visits21', 'div_reg_comments21', 'div_reg_likes21',
-
-        # 14 days other metrics (4 cols)
-        'div_reg_views14', 'div_reg_visits14', 'div_reg_comments14', 'div_reg_likes14',
-
-        # 7 days other metrics (4 cols)
-        'div_reg_views7', 'div_reg_visits7', 'div_reg_comments7', 'div_reg_likes7',
-    ]
-
-    # UV column indices (after dimensions, columns 5-52)
-    uv_col_indices = set(range(5, 53))  # Columns 5 through 52 are UV columns
-
-    # Collapse groups for other metrics (columns 53-76)
-    collapse_groups = [
-        (53, 56),   # All-time other metrics
-        (57, 60),   # This year other metrics
-        (61, 64),   # 28 days other metrics
-        (65, 68),   # 21 days other metrics
-        (69, 72),   # 14 days other metrics
-        (73, 76),   # 7 days other metrics
-    ]
-
-    add_data_to_sheet(ws_output, aggregated, output_columns, uv_col_indices=uv_col_indices, collapse_groups=collapse_groups)
-
-    filename = '/Users/micha/Documents/Fabric/sharepoint_analytics_sample_data.xlsx'
-    wb.save(filename)
-    print(f"\n✅ Complete Excel file created: {filename}")
+    input_data = {'dim_date': dates, 'employeecontact': employees, 'website_page_inventory': pages,
+                  'interactions_metrics': interactions}
+    for sink in sinks:
+        sink.write_overview(overview_data)
+        for table, columns in INPUT_TABLES.items():
+            with instrumentation.stage(f'write/{table}'):
+                sink.write_table(table, input_data[table], columns)
+        with instrumentation.stage(f'write/{FACT_TABLE}'):
+            sink.write_table(FACT_TABLE, aggregated, output_columns, uv_col_indices=uv_col_indices, collapse_groups=collapse_groups)
+        with instrumentation.stage('write/close'):
+            sink.close()
     print(f"   Total columns in output: {len(output_columns)}")
-    print(f"   Total sheets: {len(wb.sheetnames)}")
+
+    if args.profile or args.profile_allocations:
+        instrumentation.print_summary()
+    if args.cprofile:
+        instrumentation.stop_cprofile(args.cprofile)
 
 if __name__ == '__main__':
     main()
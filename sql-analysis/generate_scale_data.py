@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Production-size synthetic data for load tests (NumPy, seeded, chunked, multi-core)
+
+Keeps the shape of generate_complete_sample.py -- 20% of pages get 60% of the
+traffic, 30% of interactions fall in the first 30 days, ~5% unknown
+divisions/regions -- but draws each chunk with vectorised NumPy calls. Every
+chunk has its own seed spawned from the run seed and chunk number, so a given
+seed and chunk size produce the same files whatever the number of workers.
+
+Usage:
+    python generate_scale_data.py --employees 130000 --sites 774 --pages 40000 \\
+        --interactions 20000000 --workers 8 --output-dir scale_data --format parquet
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from generate_complete_sample import divisions, generate_dim_date, page_names, regions, websites
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+POPULAR_PAGE_SHARE = 0.2
+POPULAR_TRAFFIC_SHARE = 0.6
+LAUNCH_CLUSTER_SHARE = 0.3
+LAUNCH_CLUSTER_DAYS = 30
+
+
+def site_names(num_sites):
+    """The sample website names, extended with numbered sites for larger runs"""
+    return websites[:num_sites] + [f'Site{i:03d}' for i in range(len(websites) + 1, num_sites + 1)]
+
+
+def generate_employee_contacts_np(num_employees, seed=0):
+    rng = np.random.default_rng([seed, 1])
+    division_idx = rng.integers(len(divisions), size=num_employees)
+    region_idx = rng.integers(len(regions), size=num_employees)
+    has_division = rng.random(num_employees) > 0.05
+    has_region = rng.random(num_employees) > 0.05
+    data = []
+    for i in range(num_employees):
+        data.append({
+            'contactid': f'EMP{i + 1:05d}',
+            'employeename': f'Employee {i + 1}',
+            'employeebusinessdivision': divisions[division_idx[i]] if has_division[i] else None,
+            'employeeregion': regions[region_idx[i]] if has_region[i] else None,
+            'email': f'employee{i + 1}@company.com'
+        })
+    return data
+
+
+def generate_website_page_inventory_np(num_pages, num_sites=len(websites), seed=0):
+    rng = np.random.default_rng([seed, 2])
+    sites = site_names(num_sites)
+    site_idx = rng.integers(len(sites), size=num_pages)
+    name_idx = rng.integers(len(page_names), size=num_pages)
+    created_offset = rng.integers(0, 91, size=num_pages)
+    data = []
+    for i in range(num_pages):
+        website = sites[site_idx[i]]
+        page = page_names[name_idx[i]]
+        created_date = datetime(2024, 1, 1) + timedelta(days=int(created_offset[i]))
+        data.append({
+            'marketingPageId': f'PAGE{i + 1:04d}',
+            'websitename': website,
+            'pagename': page,
+            'page_url': f'https://{website.lower()}.company.com/{page.lower().replace(" ", "-")}',
+            'created_date': created_date.strftime('%Y-%m-%d')
+        })
+    return data
+
+
+def popular_page_indices(num_pages, seed=0):
+    """The fixed set of "popular" pages shared by every chunk of a run"""
+    rng = np.random.default_rng([seed, 3])
+    return np.sort(rng.choice(num_pages, size=max(1, int(num_pages * POPULAR_PAGE_SHARE)), replace=False))
+
+
+def generate_interaction_chunk(chunk_index, start, size, num_employees, num_pages, num_days, popular, seed=0):
+    """One chunk of interactions as integer columns (employee/page indices are 0-based)"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+
+    use_popular = rng.random(size) < POPULAR_TRAFFIC_SHARE
+    page = np.where(use_popular, popular[rng.integers(len(popular), size=size)], rng.integers(num_pages, size=size))
+
+    clustered = rng.random(size) < LAUNCH_CLUSTER_SHARE
+    date_key = np.where(clustered,
+                        rng.integers(1, min(LAUNCH_CLUSTER_DAYS, num_days) + 1, size=size),
+                        rng.integers(1, num_days + 1, size=size))
+
+    views = rng.integers(1, 11, size=size)
+    visits = rng.integers(1, np.minimum(5, views) + 1)
+    comments = np.where(rng.random(size) > 0.7, rng.integers(0, 4, size=size), 0)
+
+    return {
+        'interaction_index': np.arange(start, start + size),
+        'contact': rng.integers(num_employees, size=size),
+        'page': page,
+        'date_key': date_key,
+        'views': views,
+        'visits': visits,
+        'comments': comments,
+        'liked': rng.random(size) > 0.85,
+    }
+
+
+def chunk_to_records(chunk, employees, pages, dates):
+    """Convert a columnar chunk to the interaction dicts used by generate_complete_output"""
+    date_strings = {d['date_key']: d['date'] for d in dates}
+    records = []
+    for index, contact, page, date_key, views, visits, comments, liked in zip(
+            chunk['interaction_index'].tolist(), chunk['contact'].tolist(), chunk['page'].tolist(),
+            chunk['date_key'].tolist(), chunk['views'].tolist(), chunk['visits'].tolist(),
+            chunk['comments'].tolist(), chunk['liked'].tolist()):
+        page_id = pages[page]['marketingPageId']
+        records.append({
+            'interaction_id': f'INT{index:06d}',
+            'viewingcontactid': employees[contact]['contactid'],
+            'marketingPageId': page_id,
+            'visitdatekey': date_key,
+            'visit_date': date_strings[date_key],
+            'views': views,
+            'visits': visits,
+            'comments': comments,
+            'marketingPageIdliked': page_id if liked else None
+        })
+    return records
+
+
+def concatenate_chunks(chunks):
+    """One columnar chunk holding every row of the given chunks, in order"""
+    chunks = list(chunks)
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+
+def chunk_bounds(num_interactions, chunk_size):
+    return [(i, start, min(chunk_size, num_interactions - start))
+            for i, start in enumerate(range(0, num_interactions, chunk_size))]
+
+
+def iter_interaction_chunks_np(num_interactions, num_employees, num_pages, num_days=365, chunk_size=DEFAULT_CHUNK_SIZE,
+                               seed=0):
+    """Yield columnar interaction chunks in order, in this process"""
+    popular = popular_page_indices(num_pages, seed)
+    for chunk_index, start, size in chunk_bounds(num_interactions, chunk_size):
+        yield generate_interaction_chunk(chunk_index, start, size, num_employees, num_pages, num_days, popular, seed)
+
+
+# Dimension tables and run parameters, shipped once per worker process
+_worker_context = {}
+
+
+def _init_worker(employees, pages, dates, params):
+    _worker_context.update(employees=employees, pages=pages, dates=dates, params=params)
+
+
+def _write_chunk(args):
+    chunk_index, start, size, path, fmt = args
+    params = _worker_context['params']
+    chunk = generate_interaction_chunk(chunk_index, start, size, params['num_employees'], params['num_pages'],
+                                       params['num_days'], params['popular'], params['seed'])
+    records = chunk_to_records(chunk, _worker_context['employees'], _worker_context['pages'], _worker_context['dates'])
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(column, pa.int64() if column in ('visitdatekey', 'views', 'visits', 'comments')
+                             else pa.string()) for column in records[0]])
+        pq.write_table(pa.Table.from_pylist(records, schema=schema), path)
+    else:
+        from interaction_stream import write_interactions_csv
+        write_interactions_csv(records, path)
+    return path
+
+
+def write_interaction_files(output_dir, num_interactions, employees, pages, dates, chunk_size=DEFAULT_CHUNK_SIZE,
+                            seed=0, workers=None, fmt='parquet'):
+    """Generate interactions in parallel, one extract file per chunk"""
+    os.makedirs(output_dir, exist_ok=True)
+    params = {
+        'num_employees': len(employees),
+        'num_pages': len(pages),
+        'num_days': len(dates),
+        'popular': popular_page_indices(len(pages), seed),
+        'seed': seed,
+    }
+    tasks = [(chunk_index, start, size, os.path.join(output_dir, f'interactions_{chunk_index:05d}.{fmt}'), fmt)
+             for chunk_index, start, size in chunk_bounds(num_interactions, chunk_size)]
+    context = (employees, pages, dates, params)
+    if workers == 1:
+        _init_worker(*context)
+        return [_write_chunk(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=context) as pool:
+        return list(pool.map(_write_chunk, tasks))
+
+
+def write_dimension_csvs(output_dir, employees, pages, dates):
+    """Write dim_date, employeecontact and website_page_inventory as CSV files"""
+    from generate_complete_sample import INPUT_TABLES
+
+    os.makedirs(output_dir, exist_ok=True)
+    for table, rows in [('dim_date', dates), ('employeecontact', employees), ('website_page_inventory', pages)]:
+        with open(os.path.join(output_dir, f'{table}.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=INPUT_TABLES[table], extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def generate_dataset(num_employees, num_sites, num_pages, num_days=365, seed=0):
+    """Dimension tables for a scale run: (dates, employees, pages)"""
+    dates = generate_dim_date(num_days)
+    employees = generate_employee_contacts_np(num_employees, seed)
+    pages = generate_website_page_inventory_np(num_pages, num_sites, seed)
+    return dates, employees, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate production-size synthetic interaction extracts')
+    parser.add_argument('--employees', type=int, default=130_000)
+    parser.add_argument('--sites', type=int, default=774)
+    parser.add_argument('--pages', type=int, default=40_000)
+    parser.add_argument('--interactions', type=int, default=10_000_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--output-dir', required=True)
+    args = parser.parse_args()
+
+    dates, employees, pages = generate_dataset(args.employees, args.sites, args.pages, args.days, args.seed)
+    write_dimension_csvs(args.output_dir, employees, pages, dates)
+    paths = write_interaction_files(args.output_dir, args.interactions, employees, pages, dates,
+                                    chunk_size=args.chunk_size, seed=args.seed, workers=args.workers, fmt=args.format)
+    print(f"✅ Wrote {args.interactions:,} interactions in {len(paths)} {args.format} files "
+          f"and dimension CSVs to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Count-min sketches for finding heavy-hitter keys in skewed interaction data
+
+20% of the pages get 60% of the traffic, and in production a few news articles
+and sites dominate. Sharded aggregation (parallel_aggregation.py) keeps whole
+websites together, so one hot website or page makes one shard, and its visitor
+sets, much bigger than the rest, so the sharding splits just the hot keys into
+sub-partitions that are merged back with AggregationState.merge. It has the
+exact per-page row counts in memory and picks the hot keys from those
+(parallel_aggregation.hot_keys). For a stream of keys too large to count
+exactly, a CountMinSketch counts them in fixed memory and find_heavy_hitters
+returns the keys whose estimated count reaches a threshold.
+
+`benchmark_partitions` folds every shard of website sharding and of skew-aware
+sharding on the popular-page distribution and compares per-shard fold times.
+Both are run at the same shard count, capped at the number of websites so that
+website sharding can fill every shard. The default sizes give the popular
+pages more rows than a shard's limit, so hot pages are dealt round-robin as
+well as hot websites split by page.
+
+Usage:
+    python heavy_hitters.py --sites 48 --pages 120 --interactions 400000 --shards 32
+"""
+
+import argparse
+import gc
+import math
+import statistics
+import time
+from collections import Counter
+from collections.abc import Mapping
+from itertools import islice
+
+import numpy as np
+
+from hyperloglog import hash64
+
+DEFAULT_WIDTH = 2048
+DEFAULT_DEPTH = 4
+# Keys counted per chunk before their distinct hashes are added to the sketch
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+class CountMinSketch:
+    """depth x width counters; estimates never undercount and overcount by at most ~e/width of the total w.h.p."""
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, seed=0):
+        # Multiply-shift hashing needs a power-of-two width
+        self.bits = max(1, math.ceil(math.log2(width)))
+        self.width = 1 << self.bits
+        self.depth = depth
+        rng = np.random.default_rng(seed)
+        self._multipliers = rng.integers(1, 2**63, size=depth, dtype=np.uint64) | np.uint64(1)
+        self._offsets = rng.integers(0, 2**63, size=depth, dtype=np.uint64)
+        self.table = np.zeros((depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _buckets(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        products = self._multipliers[:, None] * hashes[None, :] + self._offsets[:, None]
+        return (products >> np.uint64(64 - self.bits)).astype(np.int64)
+
+    def add(self, hashes, counts=1):
+        """Count an array of 64-bit key hashes (see hash64)"""
+        buckets = self._buckets(hashes)
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), buckets.shape[1:])
+        for row in range(self.depth):
+            np.add.at(self.table[row], buckets[row], counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, hashes):
+        buckets = self._buckets(hashes)
+        return np.min(self.table[np.arange(self.depth)[:, None], buckets], axis=0)
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth) or \
+                not np.array_equal(self._multipliers, other._multipliers):
+            raise ValueError("Only sketches with the same width, depth and seed can be merged")
+        self.table += other.table
+        self.total += other.total
+
+
+def key_hashes(keys):
+    """Stable 64-bit hashes of a sequence of keys, each distinct key hashed once"""
+    cache = {}
+    hashes = np.empty(len(keys), dtype=np.uint64)
+    for i, key in enumerate(keys):
+        h = cache.get(key)
+        if h is None:
+            h = cache[key] = hash64(key)
+        hashes[i] = h
+    return hashes
+
+
+def _count_chunks(keys, chunk_size):
+    """{key: count} of each chunk of chunk_size keys"""
+    keys = iter(keys)
+    while True:
+        counts = Counter(islice(keys, chunk_size))
+        if not counts:
+            return
+        yield counts
+
+
+def find_heavy_hitters(keys, threshold, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """{key: count} for the keys whose count is at least threshold
+
+    keys is a mapping of distinct keys to their exact counts, which are
+    filtered directly, or an iterable of keys, read once in chunks of
+    chunk_size and counted in a count-min sketch; counts are then estimates,
+    which never undercount. Only the distinct keys of a chunk are hashed and
+    added to the sketch, with their counts, so memory is the sketch, one chunk
+    and the keys that have reached the threshold. Estimates only grow, so
+    every key that reaches it is seen doing so.
+    """
+    if isinstance(keys, Mapping):
+        return {key: count for key, count in sorted(keys.items(), key=lambda item: repr(item[0]))
+                if count >= threshold}
+    sketch = CountMinSketch(width, depth)
+    candidates = set()
+    for counts in _count_chunks(keys, chunk_size):
+        distinct = list(counts)
+        hashes = key_hashes(distinct)
+        sketch.add(hashes, np.fromiter(counts.values(), dtype=np.int64, count=len(distinct)))
+        estimates = sketch.estimate(hashes)
+        candidates.update(distinct[i] for i in np.flatnonzero(estimates >= threshold).tolist())
+    candidates = sorted(candidates, key=repr)
+    if not candidates:
+        return {}
+    estimates = sketch.estimate(key_hashes(candidates)).tolist()
+    return {key: estimate for key, estimate in zip(candidates, estimates)}
+
+
+def benchmark_partitions(num_employees, num_sites, num_pages, num_interactions, num_shards, seed=0):
+    """Per-shard fold seconds of website sharding and skew-aware sharding, merged outputs checked for equality
+
+    Returns ({sharding: figures}, {'shards', 'limit', 'hot_pages', 'hot_sites'}).
+    """
+    from generate_complete_sample import compute_page_mindates, generate_complete_output
+    from generate_scale_data import chunk_to_records, generate_dataset, iter_interaction_chunks_np
+    from parallel_aggregation import (SUBPARTITION_SHARE, hot_keys, new_state, page_row_counts, shard_by_website,
+                                      shard_skew_aware)
+
+    dates, employees, pages = generate_dataset(num_employees, num_sites, num_pages, seed=seed)
+    interactions = []
+    for chunk in iter_interaction_chunks_np(num_interactions, len(employees), len(pages), len(dates), seed=seed):
+        interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+    page_mindates = compute_page_mindates(interactions)
+    expected = generate_complete_output(interactions, employees, pages, dates)
+
+    # Website sharding cannot make more shards than there are websites with rows
+    page_website = {p['marketingPageId']: p['websitename'] for p in pages}
+    page_counts = page_row_counts(interactions)
+    num_shards = min(num_shards, len({page_website[page_id] for page_id in page_counts}))
+    limit = max(1, len(interactions) * SUBPARTITION_SHARE / num_shards)
+    page_splits, site_splits = hot_keys(page_counts, page_website, limit)
+    setup = {'shards': num_shards, 'limit': limit, 'hot_pages': len(page_splits), 'hot_sites': len(site_splits)}
+
+    results = {}
+    for name, shard in (('website', shard_by_website), ('skew-aware', shard_skew_aware)):
+        start = time.perf_counter()
+        shards = shard(interactions, pages, num_shards)
+        shard_seconds = time.perf_counter() - start
+
+        state = new_state(employees, pages, dates, {})
+        fold_seconds = []
+        merge_seconds = 0.0
+        for rows in shards:
+            # A worker process has only its shard on the heap; keep collections of this
+            # process's much bigger heap out of the per-shard timings
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                partial_state = new_state(employees, pages, dates, page_mindates)
+                partial_state.fold(rows)
+                partial = partial_state.partial()
+                fold_seconds.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+            start = time.perf_counter()
+            state.merge(partial)
+            merge_seconds += time.perf_counter() - start
+        if state.output_rows() != expected:
+            raise AssertionError(f"{name} sharding output differs from the single-process output")
+        results[name] = {
+            'shards': len(shards),
+            'largest_shard_rows': max(len(rows) for rows in shards),
+            'shard_seconds': shard_seconds,
+            'max_fold_seconds': max(fold_seconds),
+            'median_fold_seconds': statistics.median(fold_seconds),
+            'merge_seconds': merge_seconds,
+        }
+    return results, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-shard latency of website and skew-aware sharding')
+    parser.add_argument('--employees', type=int, default=5_000)
+    parser.add_argument('--sites', type=int, default=48)
+    parser.add_argument('--pages', type=int, default=120)
+    parser.add_argument('--interactions', type=int, default=400_000)
+    parser.add_argument('--shards', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    results, setup = benchmark_partitions(args.employees, args.sites, args.pages, args.interactions, args.shards,
+                                          seed=args.seed)
+    print(f"{setup['shards']} shards, hot above {setup['limit']:,.0f} rows: {setup['hot_pages']} hot pages, "
+          f"{setup['hot_sites']} hot websites\n")
+    print(f"{'Sharding':<12} {'shards':>7} {'largest':>9} {'split (s)':>10} {'max fold':>9} {'median':>8} "
+          f"{'max/median':>11} {'merge (s)':>10}")
+    for name, result in results.items():
+        ratio = result['max_fold_seconds'] / result['median_fold_seconds']
+        print(f"{name:<12} {result['shards']:>7} {result['largest_shard_rows']:>9,} {result['shard_seconds']:>10.2f} "
+              f"{result['max_fold_seconds']:>9.2f} {result['median_fold_seconds']:>8.2f} {ratio:>11.1f} "
+              f"{result['merge_seconds']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
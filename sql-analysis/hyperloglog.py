@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Approximate-distinct (HyperLogLog) visitor sets for the UV columns
+
+HyperLogLog plugs into the aggregation like the exact visitor sets
+(`generate_complete_output(..., visitor_sets='hll', hll_precision=12)`).
+Sketches use a stable 64-bit hash, so sketches built for different
+site/division/region combinations, runs or processes can be merged to answer
+arbitrary filters without rescanning. `uv_error_report` measures the observed
+error against the exact path.
+
+Usage:
+    python hyperloglog.py --precision 12 --employees 5000 --interactions 50000
+"""
+
+import argparse
+import math
+from hashlib import blake2b
+
+DEFAULT_PRECISION = 14
+
+
+def hash64(value):
+    """Stable 64-bit hash, identical across processes and runs"""
+    return int.from_bytes(blake2b(str(value).encode(), digest_size=8).digest(), 'little')
+
+
+class HashEncoder:
+    """Hashes each contact id once, so repeated adds across levels reuse the hash"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def encode(self, contact_id):
+        h = self.hashes.get(contact_id)
+        if h is None:
+            h = self.hashes[contact_id] = hash64(contact_id)
+        return h
+
+
+class HyperLogLog:
+    """HyperLogLog sketch over pre-hashed 64-bit values
+
+    Small sketches keep a sparse {register: rank} dict and switch to a dense
+    register array once that is smaller; the estimate is the same either way.
+    """
+
+    __slots__ = ('precision', '_sparse', '_dense', '_estimate')
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18, got {precision}")
+        self.precision = precision
+        self._sparse = {}
+        self._dense = None
+        self._estimate = 0
+
+    def add(self, h):
+        p = self.precision
+        index = h >> (64 - p)
+        rest = h & ((1 << (64 - p)) - 1)
+        rank = (64 - p) - rest.bit_length() + 1
+
+        if self._dense is None:
+            if rank > self._sparse.get(index, 0):
+                self._sparse[index] = rank
+                self._estimate = None
+                if len(self._sparse) > (1 << p) // 64:
+                    self._densify()
+        elif rank > self._dense[index]:
+            self._dense[index] = rank
+            self._estimate = None
+
+    def _densify(self):
+        dense = bytearray(1 << self.precision)
+        for index, rank in self._sparse.items():
+            dense[index] = rank
+        self._dense = dense
+        self._sparse = None
+
+    def update(self, other):
+        """Merge another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        if other._dense is None:
+            for index, rank in other._sparse.items():
+                if self._dense is None:
+                    if rank > self._sparse.get(index, 0):
+                        self._sparse[index] = rank
+                elif rank > self._dense[index]:
+                    self._dense[index] = rank
+            if self._dense is None and len(self._sparse) > (1 << self.precision) // 64:
+                self._densify()
+        else:
+            if self._dense is None:
+                self._densify()
+            self._dense = bytearray(map(max, self._dense, other._dense))
+        self._estimate = None
+        return self
+
+    __ior__ = update
+
+    def __or__(self, other):
+        return self.copy().update(other)
+
+    def copy(self):
+        result = HyperLogLog(self.precision)
+        result._sparse = None if self._sparse is None else dict(self._sparse)
+        result._dense = None if self._dense is None else bytearray(self._dense)
+        result._estimate = self._estimate
+        return result
+
+    def estimate(self):
+        """Cardinality estimate, with linear counting for the small range"""
+        if self._estimate is None:
+            m = 1 << self.precision
+            if self._dense is None:
+                zeros = m - len(self._sparse)
+                total = zeros + sum(2.0 ** -rank for rank in self._sparse.values())
+            else:
+                zeros = self._dense.count(0)
+                total = sum(2.0 ** -rank for rank in self._dense)
+            alpha = 0.7213 / (1 + 1.079 / m)
+            raw = alpha * m * m / total
+            if raw <= 2.5 * m and zeros:
+                raw = m * math.log(m / zeros)
+            self._estimate = raw
+        return self._estimate
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+    def relative_error(self):
+        """Standard error of the estimate for this precision"""
+        return 1.04 / math.sqrt(1 << self.precision)
+
+    def __getstate__(self):
+        return self.precision, self._sparse, self._dense, self._estimate
+
+    def __setstate__(self, state):
+        self.precision, self._sparse, self._dense, self._estimate = state
+
+    def __repr__(self):
+        return f'HyperLogLog(p={self.precision}, ~{len(self)} visitors)'
+
+
+def estimate_unique_visitors(state, period='all', sites=None, divisions=None, regions=None):
+    """Unique visitors for any site/division/region filter, merged from site_div_reg sketches
+
+    Works on an AggregationState built with any mergeable visitor set; None
+    means "no filter" for that dimension.
+    """
+    merged = None
+    for (website, division, region), visitors in state.agg_levels[period]['site_div_reg'].items():
+        if sites is not None and website not in sites:
+            continue
+        if divisions is not None and division not in divisions:
+            continue
+        if regions is not None and region not in regions:
+            continue
+        if merged is None:
+            merged = visitors.copy()
+        else:
+            merged |= visitors
+    return 0 if merged is None else len(merged)
+
+
+def uv_error_report(exact_rows, approx_rows):
+    """Observed relative error of each *_uniquevisitor* column, approximate vs exact"""
+    report = {}
+    for exact, approx in zip(exact_rows, approx_rows):
+        for column, value in exact.items():
+            if 'uniquevisitor' not in column:
+                continue
+            stats = report.setdefault(column, {'rows': 0, 'sum_error': 0.0, 'max_error': 0.0})
+            error = abs(approx[column] - value) / value if value else float(approx[column] != 0)
+            stats['rows'] += 1
+            stats['sum_error'] += error
+            stats['max_error'] = max(stats['max_error'], error)
+    for stats in report.values():
+        stats['mean_error'] = stats.pop('sum_error') / stats['rows'] if stats['rows'] else 0.0
+    return report
+
+
+def main():
+    from generate_complete_sample import generate_complete_output, generate_sample_data
+
+    parser = argparse.ArgumentParser(description='Compare HyperLogLog UV columns against the exact path')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION)
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                 seed=args.seed)
+
+    exact = generate_complete_output(interactions, employees, pages, dates, visitor_sets='bitmap')
+    approx = generate_complete_output(interactions, employees, pages, dates, visitor_sets='hll',
+                                      hll_precision=args.precision)
+    report = uv_error_report(exact, approx)
+
+    print(f"HyperLogLog p={args.precision} (expected standard error "
+          f"{HyperLogLog(args.precision).relative_error():.2%}) over {len(exact)} rows")
+    print(f"{'column':<32} {'mean error':>11} {'max error':>10}")
+    for column, stats in report.items():
+        print(f"{column:<32} {stats['mean_error']:>11.2%} {stats['max_error']:>10.2%}")
+
+
+if __name__ == '__main__':
+    main()
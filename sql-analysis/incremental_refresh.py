@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Incremental daily refresh of the aggregated output from a persisted aggregation state
+
+The state store holds everything generate_complete_output accumulates: per-page
+mindate, per-grain metric sums and the per-level visitor sets for each period.
+`init` builds it once from the full history; `apply` folds one day's delta into
+it and re-emits only the output rows whose grain or any referenced rollup changed.
+
+Note that every row carries the overall, division and region UV columns, so a
+delta that adds a new visitor to one of those rollups re-emits every row that
+references it. The saving is on the input side: only the delta is scanned.
+
+Usage:
+    python incremental_refresh.py init history.csv --dims sample.xlsx --state uv_state.pkl
+    python incremental_refresh.py apply 2024-06-01.csv --dims sample.xlsx --state uv_state.pkl --output changed.csv
+"""
+
+import argparse
+import csv
+import os
+import pickle
+
+from generate_complete_sample import (DEFAULT_LAUNCH_WINDOWS, AggregationState, compute_page_mindates,
+                                      parse_launch_windows)
+from interaction_stream import DEFAULT_CHUNK_SIZE, iter_interaction_chunks, load_dimensions
+
+
+def save_state(state, path):
+    """Persist an AggregationState, replacing the previous file atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_state(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def update_dimensions(state, employees, pages, dates):
+    """Register employees, pages and dates that appeared since the state was built"""
+    state.emp_lookup.update((e['contactid'], e) for e in employees)
+    state.page_lookup.update((p['marketingPageId'], p) for p in pages)
+    state.date_lookup.update((d['date_key'], d) for d in dates)
+
+
+def build_state(path, employees, pages, dates, chunk_size=DEFAULT_CHUNK_SIZE, visitor_sets='bitmap',
+                launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Build the initial state from a full-history extract; later deltas keep its launch windows"""
+    page_mindates = {}
+    for chunk in iter_interaction_chunks(path, chunk_size):
+        compute_page_mindates(chunk, page_mindates)
+
+    state = AggregationState(employees, pages, dates, page_mindates, visitor_sets=visitor_sets,
+                             launch_windows=launch_windows)
+    for chunk in iter_interaction_chunks(path, chunk_size):
+        state.fold(chunk)
+    return state
+
+
+def _grain_key(state, interaction):
+    emp = state.emp_lookup[interaction['viewingcontactid']]
+    page = state.page_lookup[interaction['marketingPageId']]
+    division = emp['employeebusinessdivision'] or 'Unknown'
+    region = emp['employeeregion'] or 'Unknown'
+    return (interaction['marketingPageId'], division, region, page['websitename'])
+
+
+def _level_keys(grain_key):
+    """(level, key) pairs of every rollup a grain row references"""
+    page_id, division, region, website = grain_key
+    return [
+        ('overall', None),
+        ('div', division),
+        ('reg', region),
+        ('site', website),
+        ('site_div', (website, division)),
+        ('site_reg', (website, region)),
+        ('site_div_reg', (website, division, region)),
+    ]
+
+
+def _level_sizes(state, level_keys):
+    sizes = {}
+    for period in state.periods:
+        levels = state.agg_levels[period]
+        for level, key in level_keys:
+            # .get() so that probing does not insert empty sets into the defaultdicts
+            visitors = levels['overall'] if level == 'overall' else levels[level].get(key, ())
+            sizes[(period, level, key)] = len(visitors)
+    return sizes
+
+
+def _grain_snapshot(state, keys):
+    snapshot = {}
+    for key in keys:
+        metrics = state.grain_data.get(key)
+        if metrics is not None:
+            snapshot[key] = tuple((m['views'], m['visits'], m['comments'], len(m['uv']), len(m['likes']))
+                                  for m in (metrics[p] for p in state.periods))
+    return snapshot
+
+
+def apply_delta(state, interactions):
+    """Fold one day's interactions into the state and return the output rows that changed
+
+    A delta may introduce new pages, but may not move an existing page's mindate
+    earlier: that would shift the launch-window periods of its whole history, so
+    the state has to be rebuilt from the full extract instead.
+    """
+    delta_mindates = compute_page_mindates(interactions)
+    late_pages = sorted(page_id for page_id, mindate in delta_mindates.items()
+                        if page_id in state.page_mindates and mindate < state.page_mindates[page_id])
+    if late_pages:
+        raise ValueError(f"Delta predates the first interaction of {len(late_pages)} page(s) "
+                         f"(e.g. {late_pages[0]}); rebuild the state with 'init'")
+    for page_id, mindate in delta_mindates.items():
+        state.page_mindates.setdefault(page_id, mindate)
+
+    touched_grains = {_grain_key(state, interaction) for interaction in interactions}
+    touched_levels = {level_key for key in touched_grains for level_key in _level_keys(key)}
+
+    grains_before = _grain_snapshot(state, touched_grains)
+    levels_before = _level_sizes(state, touched_levels)
+    state.fold(interactions)
+    grains_after = _grain_snapshot(state, touched_grains)
+    levels_after = _level_sizes(state, touched_levels)
+
+    changed_levels = {(level, key) for (period, level, key), size in levels_after.items()
+                      if size != levels_before[(period, level, key)]}
+    changed = {key for key in touched_grains if grains_before.get(key) != grains_after[key]}
+    if changed_levels:
+        for key in state.grain_data:
+            if key not in changed and any(level_key in changed_levels for level_key in _level_keys(key)):
+                changed.add(key)
+
+    rows = state.output_rows(keys=changed)
+    return rows
+
+
+def _write_rows(rows, path):
+    with open(path, 'w', newline='') as f:
+        if rows:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('command', choices=['init', 'apply'])
+    parser.add_argument('extract', help='full-history extract (init) or one day of interactions (apply)')
+    parser.add_argument('--dims', required=True, help='workbook with dim_date, employeecontact and website_page_inventory sheets')
+    parser.add_argument('--state', required=True, help='state file to create or update')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--visitor-sets', choices=['set', 'bitmap'], default='bitmap')
+    parser.add_argument('--launch-windows', default=','.join(map(str, DEFAULT_LAUNCH_WINDOWS)),
+                        help='comma-separated launch windows in days for init, e.g. 3,7,28,60')
+    parser.add_argument('--output', help='CSV file for the emitted rows')
+    args = parser.parse_args()
+    try:
+        launch_windows = parse_launch_windows(args.launch_windows)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    dates, employees, pages = load_dimensions(args.dims)
+
+    if args.command == 'init':
+        state = build_state(args.extract, employees, pages, dates,
+                            chunk_size=args.chunk_size, visitor_sets=args.visitor_sets, launch_windows=launch_windows)
+        rows = state.output_rows() if args.output else None
+        print(f"Built state with {len(state.grain_data)} grain rows")
+    else:
+        state = load_state(args.state)
+        update_dimensions(state, employees, pages, dates)
+        delta = [interaction for chunk in iter_interaction_chunks(args.extract, args.chunk_size)
+                 for interaction in chunk]
+        rows = apply_delta(state, delta)
+        print(f"Applied {len(delta)} interactions: {len(rows)} of {len(state.grain_data)} rows changed")
+
+    save_state(state, args.state)
+    if args.output:
+        _write_rows(rows, args.output)
+        print(f"   Written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
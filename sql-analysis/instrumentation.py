@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Stage timing, counters and optional cProfile/tracemalloc capture
+
+Hooks are placed around each stage of generate_complete_output and the
+workbook export. They do nothing until enable() is called, so the normal run
+pays one flag check per stage, not per interaction:
+
+    import instrumentation
+    instrumentation.enable(trace_allocations=True)
+    generate_complete_output(...)
+    instrumentation.print_summary()
+
+The 'fold' stage times the single-pass fold that normal runs use. While
+enabled, generate_complete_output then folds the interactions a second time
+into a throwaway state, as a period bucketing pass and one accumulation pass
+per (level, period) ('breakdown/...' stages), so the summary can show which
+level and which period the time and allocations go to. Those figures come
+from that separate run, not from the timed fold.
+`python generate_complete_sample.py --profile` turns all of this on.
+"""
+
+import cProfile
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_enabled = False
+_trace_allocations = False
+_started = None
+_stages = {}
+_counters = {}
+_level_sizes = {}
+_profiler = None
+# Open stages, innermost last: the running peak of traced memory of each, in absolute bytes
+_open_stages = []
+
+
+def enable(trace_allocations=False):
+    """Start recording stages; trace_allocations also measures allocated bytes per stage"""
+    global _enabled, _trace_allocations, _started
+    _enabled = True
+    _trace_allocations = trace_allocations
+    _started = time.perf_counter()
+    if trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled, _trace_allocations
+    _enabled = False
+    if _trace_allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_allocations = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    _stages.clear()
+    _counters.clear()
+    _level_sizes.clear()
+    _open_stages.clear()
+
+
+@contextmanager
+def stage(name):
+    """Time a stage (and its net allocations when tracing); nested stages are recorded separately
+
+    The tracemalloc peak is reset when a stage starts, so the peak reached so far
+    is first folded into the enclosing stage, and a nested stage's peak is folded
+    into it again when the nested stage ends.
+    """
+    if not _enabled:
+        yield
+        return
+    if _trace_allocations:
+        allocated_before, peak = tracemalloc.get_traced_memory()
+        if _open_stages:
+            _open_stages[-1] = max(_open_stages[-1], peak)
+        tracemalloc.reset_peak()
+        _open_stages.append(allocated_before)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        record = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'allocated_bytes': 0, 'peak_bytes': 0})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        if _trace_allocations and _open_stages:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(_open_stages.pop(), peak)
+            if _open_stages:
+                _open_stages[-1] = max(_open_stages[-1], peak)
+            record['allocated_bytes'] += current - allocated_before
+            record['peak_bytes'] = max(record['peak_bytes'], peak - allocated_before)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def count(name, value=1):
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record_level_sizes(state):
+    """Number of keys and total set members per (period, level) of an AggregationState"""
+    if not _enabled:
+        return
+    for period, levels in state.agg_levels.items():
+        for level, values in levels.items():
+            if level == 'overall':
+                _level_sizes[(period, level)] = {'keys': 1, 'members': len(values)}
+            else:
+                _level_sizes[(period, level)] = {'keys': len(values),
+                                                 'members': sum(len(visitors) for visitors in values.values())}
+        _level_sizes[(period, 'grain')] = {
+            'keys': len(state.grain_data),
+            'members': sum(len(metrics[period]['uv']) for metrics in state.grain_data.values() if period in metrics),
+        }
+
+
+def summary():
+    """Recorded stages, counters and level sizes as plain dicts"""
+    return {
+        'stages': {name: dict(record) for name, record in _stages.items()},
+        'counters': dict(_counters),
+        'level_sizes': {f'{period}/{level}': dict(sizes) for (period, level), sizes in _level_sizes.items()},
+    }
+
+
+def _level_period(name):
+    """('div', 'd28') for a 'breakdown/div/d28' stage, None for other stages"""
+    parts = name.split('/')
+    if len(parts) == 3 and parts[0] == 'breakdown':
+        return parts[1], parts[2]
+    return None
+
+
+def print_summary():
+    """Stage table (share of wall time since enable()), then time and allocations per level and period"""
+    elapsed = (time.perf_counter() - _started) if _started else 0
+    print(f"\n{'Stage':<36} {'Calls':>6} {'Time (s)':>10} {'Share':>7} {'Alloc (MB)':>11} {'Peak (MB)':>10}")
+    for name, record in _stages.items():
+        if _level_period(name):
+            continue
+        alloc = f"{record['allocated_bytes'] / 2**20:>11.1f}" if _trace_allocations else f"{'-':>11}"
+        peak = f"{record['peak_bytes'] / 2**20:>10.1f}" if _trace_allocations else f"{'-':>10}"
+        share = record['seconds'] / elapsed if elapsed else 0
+        print(f"{name:<36} {record['calls']:>6} {record['seconds']:>10.3f} {share:>7.1%} {alloc} {peak}")
+
+    cells = {_level_period(name): record for name, record in _stages.items() if _level_period(name)}
+    if cells:
+        levels = list(dict.fromkeys(level for level, _ in cells))
+        periods = list(dict.fromkeys(period for _, period in cells))
+        metrics = [('seconds', 'Accumulation time (s)', 1)]
+        if _trace_allocations:
+            metrics.append(('allocated_bytes', 'Allocated (MB)', 2**20))
+        print("\nBreakdown from a separate per-level run of the fold, not the timed 'fold' stage:")
+        for metric, title, scale in metrics:
+            print(f"\n{title + ' by level and period':<36}" + ''.join(f"{period:>9}" for period in periods)
+                  + f"{'total':>10}")
+            for level in levels:
+                values = [cells.get((level, period), {}).get(metric, 0) / scale for period in periods]
+                print(f"   {level:<33}" + ''.join(f"{value:>9.3f}" for value in values) + f"{sum(values):>10.3f}")
+
+    if _counters:
+        print(f"\n{'Counter':<36} {'Value':>14}")
+        for name, value in _counters.items():
+            print(f"{name:<36} {value:>14,}")
+
+    if _level_sizes:
+        print(f"\n{'Period':<8} {'Level':<14} {'Keys':>10} {'Set members':>14}")
+        for (period, level), sizes in _level_sizes.items():
+            print(f"{period:<8} {level:<14} {sizes['keys']:>10,} {sizes['members']:>14,}")
+
+
+def start_cprofile():
+    global _profiler
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+
+def stop_cprofile(path=None, limit=25):
+    """Stop cProfile; print the top functions, or dump the stats to path (None or '-' prints)"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    profiler.disable()
+    if path and path != '-':
+        profiler.dump_stats(path)
+        print(f"\n   cProfile stats written to {path}")
+    else:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(limit)
+
+
+@contextmanager
+def profile(path=None, limit=25):
+    """Run the block under cProfile, see stop_cprofile()"""
+    start_cprofile()
+    try:
+        yield
+    finally:
+        stop_cprofile(path, limit)
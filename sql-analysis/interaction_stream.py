@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Stream an interactions extract (CSV or Parquet) through the aggregation in fixed-size chunks
+
+The extract has the same columns as the `interactions_metrics` sheet. It is read
+twice: once to collect each page's mindate, once to fold chunks into an
+AggregationState. Memory is bounded by the number of distinct grain and level
+keys, so the 50-100M row production extract can be validated on a laptop.
+
+Usage:
+    python interaction_stream.py interactions.csv --dims sharepoint_analytics_sample_data.xlsx
+"""
+
+import argparse
+import csv
+import os
+
+from generate_complete_sample import (DEFAULT_LAUNCH_WINDOWS, AggregationState, compute_page_mindates,
+                                      parse_launch_windows)
+
+INTERACTION_COLUMNS = ['interaction_id', 'viewingcontactid', 'marketingPageId', 'visitdatekey', 'visit_date',
+                       'views', 'visits', 'comments', 'marketingPageIdliked']
+INT_COLUMNS = ['visitdatekey', 'views', 'visits', 'comments']
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def _parse_csv_row(row):
+    for column in INT_COLUMNS:
+        row[column] = int(row[column])
+    row['marketingPageIdliked'] = row['marketingPageIdliked'] or None
+    return row
+
+
+def iter_csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of interaction dicts from a CSV extract"""
+    with open(path, newline='') as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(_parse_csv_row(row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_parquet_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of interaction dicts from a Parquet extract (requires pyarrow)"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet extracts requires pyarrow: pip install pyarrow")
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=INTERACTION_COLUMNS):
+        yield batch.to_pylist()
+
+
+def iter_interaction_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield interaction chunks from a CSV or Parquet extract, chosen by file extension
+
+    path may also be a directory of interactions_*.csv / interactions_*.parquet
+    files (as written by generate_scale_data.py), read in name order.
+    """
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path)
+                       if name.startswith('interactions_') and name.endswith(('.csv', '.parquet', '.pq')))
+        for name in names:
+            yield from iter_interaction_chunks(os.path.join(path, name), chunk_size)
+    elif os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        yield from iter_parquet_chunks(path, chunk_size)
+    else:
+        yield from iter_csv_chunks(path, chunk_size)
+
+
+def write_interactions_csv(interactions, path):
+    """Write interactions in the extract layout, e.g. to build local test files"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=INTERACTION_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(interactions)
+
+
+def _read_dimension_csv(path):
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        for column, value in row.items():
+            if value == '':
+                row[column] = None
+            elif column in ('date_key', 'year', 'month', 'day'):
+                row[column] = int(value)
+    return rows
+
+
+def load_dimensions(workbook_path):
+    """Read dim_date, employeecontact and website_page_inventory from a sample workbook
+
+    A directory holding dim_date.csv, employeecontact.csv and
+    website_page_inventory.csv (see generate_scale_data.py) works as well.
+    """
+    if os.path.isdir(workbook_path):
+        return tuple(_read_dimension_csv(os.path.join(workbook_path, f'{table}.csv'))
+                     for table in ('dim_date', 'employeecontact', 'website_page_inventory'))
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(workbook_path, read_only=True)
+    tables = []
+    for sheet_name in ('dim_date', 'employeecontact', 'website_page_inventory'):
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows)
+        tables.append([dict(zip(header, values)) for values in rows])
+    wb.close()
+    dates, employees, pages = tables
+    return dates, employees, pages
+
+
+def generate_complete_output_streaming(path, employees, pages, dates, chunk_size=DEFAULT_CHUNK_SIZE,
+                                       visitor_sets='bitmap', launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Streaming equivalent of generate_complete_output over an extract file"""
+    page_mindates = {}
+    for chunk in iter_interaction_chunks(path, chunk_size):
+        compute_page_mindates(chunk, page_mindates)
+
+    state = AggregationState(employees, pages, dates, page_mindates, visitor_sets=visitor_sets,
+                             launch_windows=launch_windows)
+    for chunk in iter_interaction_chunks(path, chunk_size):
+        state.fold(chunk)
+    return state.output_rows()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('extract', help='interactions extract (.csv or .parquet, or a directory of them)')
+    parser.add_argument('--dims', required=True, help='workbook with dim_date, employeecontact and website_page_inventory sheets, or a directory of their CSVs')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--visitor-sets', choices=['set', 'bitmap'], default='bitmap')
+    parser.add_argument('--launch-windows', default=','.join(map(str, DEFAULT_LAUNCH_WINDOWS)),
+                        help='comma-separated launch windows in days, e.g. 3,7,28,60')
+    parser.add_argument('--output', help='optional CSV file for the aggregated rows')
+    args = parser.parse_args()
+    try:
+        launch_windows = parse_launch_windows(args.launch_windows)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    dates, employees, pages = load_dimensions(args.dims)
+    aggregated = generate_complete_output_streaming(args.extract, employees, pages, dates,
+                                                    chunk_size=args.chunk_size, visitor_sets=args.visitor_sets,
+                                                    launch_windows=launch_windows)
+    print(f"Aggregated {args.extract} into {len(aggregated)} output rows")
+
+    if args.output and aggregated:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(aggregated[0]))
+            writer.writeheader()
+            writer.writerows(aggregated)
+        print(f"   Written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
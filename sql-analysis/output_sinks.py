@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Output sinks for the generated tables
+
+Every sink takes the same calls (`write_overview`, `write_table`, `close`), so
+main() can write the xlsx workbook, a columnar Parquet copy, or both:
+
+- ExcelSink: the validation workbook, one sheet per table (capped at ~1M rows)
+- ParallelExcelSink: the same workbook with every sheet rendered in a worker
+  process (parallel_workbook.py), splitting tables over Excel's row limit
+- ParquetSink: one Parquet dataset per table, named and laid out like the
+  sharepoint_gold tables, with the fact table partitioned by `websitename`
+  so Power BI and Spark test loads read only the columns and sites they need
+"""
+
+import os
+from datetime import date
+
+from compact_records import RecordTable, column_values
+from generate_complete_sample import DEFAULT_LAUNCH_WINDOWS, OUTPUT_DIMENSIONS, output_columns
+
+FACT_TABLE = 'overview_fact'
+
+# Target table names, as in Overview_fact_table_FIXED.sql (including the 'investory' spelling)
+PARQUET_TABLE_NAMES = {
+    'dim_date': 'pbi_db_dim_date',
+    'employeecontact': 'pbi_db_employeecontact',
+    'website_page_inventory': 'pbi_db_website_page_investory',
+    'interactions_metrics': 'pbi_db_interactions_metrics',
+    FACT_TABLE: 'pbi_db_overview_fact_tbl',
+}
+
+# Column order of sharepoint_gold.pbi_db_overview_fact_tbl (final SELECT of Overview_fact_table_FIXED.sql)
+FACT_TABLE_COLUMNS = output_columns()
+
+# Columns that are not plain strings; everything else is written as a string column
+INT_COLUMNS = {'date_key', 'year', 'month', 'day', 'visitdatekey', 'views', 'visits', 'comments'}
+DATE_COLUMNS = {'date', 'visit_date', 'created_date'}
+
+
+def fact_sheet_title(columns):
+    """Workbook sheet title of the fact table, with its number of columns"""
+    return f"⭐ COMPLETE OUTPUT ({len(columns)} cols)"
+
+
+class ExcelSink:
+    """The validation workbook, written with the write-only sheet writers"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.wb = Workbook(write_only=True)
+
+    def write_overview(self, overview_data):
+        from generate_complete_sample import write_overview_sheet
+
+        write_overview_sheet(self.wb, "📊 Overview", overview_data)
+
+    def write_table(self, name, rows, columns, uv_col_indices=None, collapse_groups=None):
+        from generate_complete_sample import write_data_sheet
+
+        title = fact_sheet_title(columns) if name == FACT_TABLE else name
+        write_data_sheet(self.wb, title, rows, columns, uv_col_indices=uv_col_indices, collapse_groups=collapse_groups)
+
+    def close(self):
+        self.wb.save(self.path)
+        print(f"\n✅ Complete Excel file created: {self.path}")
+        print(f"   Total sheets: {len(self.wb.sheetnames)}")
+
+
+class ParallelExcelSink:
+    """The validation workbook, with the sheets rendered in parallel when the sink is closed"""
+
+    def __init__(self, path, workers=None):
+        from parallel_workbook import EXCEL_MAX_ROWS
+
+        self.path = path
+        self.workers = workers
+        self.max_rows = EXCEL_MAX_ROWS
+        self.overview = None
+        self.tables = []
+        self.sheet_seconds = {}
+
+    def write_overview(self, overview_data):
+        self.overview = ("📊 Overview", overview_data)
+
+    def write_table(self, name, rows, columns, uv_col_indices=None, collapse_groups=None):
+        title = fact_sheet_title(columns) if name == FACT_TABLE else name
+        self.tables.append((title, rows, columns, {'uv_col_indices': uv_col_indices, 'collapse_groups': collapse_groups}))
+
+    def close(self):
+        from parallel_workbook import write_workbook
+
+        self.sheet_seconds = write_workbook(self.path, self.overview, self.tables, workers=self.workers,
+                                            max_rows=self.max_rows)
+        print(f"\n✅ Complete Excel file created: {self.path}")
+        print(f"   Total sheets: {len(self.sheet_seconds)}")
+
+
+class ParquetSink:
+    """One Parquet dataset per table under a directory, fact table partitioned by websitename"""
+
+    def __init__(self, directory, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("The Parquet sink requires pyarrow: pip install pyarrow")
+        self.directory = directory
+        self.launch_windows = launch_windows
+        self.tables = []
+        os.makedirs(directory, exist_ok=True)
+
+    def write_overview(self, overview_data):
+        """The overview sheet is workbook documentation; there is no Parquet equivalent"""
+
+    def write_table(self, name, rows, columns, **excel_options):
+        import pyarrow.parquet as pq
+
+        table = arrow_table(name, rows, columns, self.launch_windows)
+        path = os.path.join(self.directory, PARQUET_TABLE_NAMES.get(name, name))
+        if name == FACT_TABLE:
+            pq.write_to_dataset(table, path, partition_cols=['websitename'], existing_data_behavior='delete_matching')
+        else:
+            pq.write_table(table, path + '.parquet')
+        self.tables.append(path)
+
+    def close(self):
+        print(f"\n✅ Parquet tables written to {self.directory}: "
+              f"{', '.join(os.path.basename(path) for path in self.tables)}")
+
+
+def arrow_table(name, rows, columns, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """A pyarrow Table of one generated table, typed as in the sharepoint_gold tables"""
+    import pyarrow as pa
+
+    if name == FACT_TABLE:
+        # Aggregated rows are built in the final SELECT order of their launch windows
+        if isinstance(rows, RecordTable):
+            columns = rows.columns
+        else:
+            columns = list(rows[0]) if rows else output_columns(launch_windows)
+    arrays = []
+    for column in columns:
+        values = column_values(rows, column)
+        if column in DATE_COLUMNS:
+            arrays.append(pa.array([_to_date(value) for value in values], type=pa.date32()))
+        elif column in INT_COLUMNS or (name == FACT_TABLE and column not in OUTPUT_DIMENSIONS):
+            arrays.append(pa.array(values, type=pa.int64()))
+        else:
+            arrays.append(pa.array(values, type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def _to_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Process-pool aggregation sharded by websitename
+
+The grain key and the site, site_div, site_reg and site_div_reg levels all
+contain the website, so each website can be aggregated on its own. Interactions
+are split into shards of whole websites, held as plain value tuples (FoldRows)
+so they pickle cheaply, every shard is folded into an AggregationState in a
+worker, and the partial states are merged: site-keyed entries are disjoint
+across shards, and the cross-site `overall`, `div` and `reg` levels are unions
+of the shards' visitor sets.
+
+On skewed data a few websites or pages would make one shard far bigger than the
+rest, so by default (skew_aware=True) heavy-hitter websites and pages, picked
+from the exact per-page row counts, are split into sub-partitions that may land
+in different shards. Their grain and site-keyed sets are then unions
+of several shards' sets, which merge() already handles; page mindates are
+computed once over all interactions instead of per shard.
+
+The result is identical to the single-process generate_complete_output:
+
+    generate_complete_output(interactions, employees, pages, dates, engine='parallel', workers=8)
+
+Usage:
+    python parallel_aggregation.py --employees 20000 --interactions 1000000 --workers 8
+"""
+
+import argparse
+import math
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from compact_records import column_values, iter_row_values
+from generate_complete_sample import (DEFAULT_LAUNCH_WINDOWS, FOLD_COLUMNS, AggregationState, FoldRows,
+                                      compute_page_mindates)
+from hyperloglog import hash64
+
+# Shards per worker, so a few very large sites do not leave workers idle
+SHARDS_PER_WORKER = 4
+
+# With skew-aware sharding, websites and pages with more rows than this share
+# of a shard are hot and split into sub-partitions of at most that size
+SUBPARTITION_SHARE = 0.5
+
+
+def _assign(unit_rows, num_shards):
+    """{unit: shard} for {unit: rows}, largest unit first to the currently smallest shard"""
+    sizes = [0] * num_shards
+    shard_of = {}
+    for unit, count in sorted(unit_rows.items(), key=lambda item: (-item[1], repr(item[0]))):
+        shard = sizes.index(min(sizes))
+        shard_of[unit] = shard
+        sizes[shard] += count
+    return shard_of
+
+
+def page_row_counts(interactions):
+    """Rows per page, the only per-key counts sharding needs (one entry per distinct page)"""
+    return Counter(column_values(interactions, 'marketingPageId'))
+
+
+def _distribute(interactions, num_shards, page_shard, hot_page_shards=None):
+    """Interactions split into FoldRows shards: by page_shard, or round-robin over a hot page's shards
+
+    The shards hold plain value tuples, so they pickle cheaply to the workers
+    whether the interactions are dicts or a RecordTable.
+    """
+    shards = [FoldRows() for _ in range(num_shards)]
+    hot_page_shards = hot_page_shards or {}
+    seen = Counter()
+    page_index = FOLD_COLUMNS.index('marketingPageId')
+    for row in iter_row_values(interactions, FOLD_COLUMNS):
+        page_id = row[page_index]
+        shard = page_shard.get(page_id)
+        if shard is None:
+            targets = hot_page_shards[page_id]
+            shard = targets[seen[page_id] % len(targets)]
+            seen[page_id] += 1
+        shards[shard].append(row)
+    return [shard for shard in shards if shard]
+
+
+def shard_by_website(interactions, pages, num_shards):
+    """Split interactions into up to num_shards lists, never splitting a website
+
+    Websites are assigned largest first to the currently smallest shard.
+    """
+    page_website = {p['marketingPageId']: p['websitename'] for p in pages}
+    page_counts = page_row_counts(interactions)
+    site_rows = Counter()
+    for page_id, count in page_counts.items():
+        site_rows[page_website[page_id]] += count
+    site_shard = _assign(site_rows, num_shards)
+    return _distribute(interactions, num_shards,
+                       {page_id: site_shard[page_website[page_id]] for page_id in page_counts})
+
+
+def hot_keys(page_counts, page_website, limit):
+    """({hot page: sub-partitions}, {hot website: sub-partitions}) for keys with at least limit rows
+
+    The counts are exact, so a hot key gets ceil(rows / limit) sub-partitions.
+    """
+    site_rows = Counter()
+    for page_id, count in page_counts.items():
+        site_rows[page_website[page_id]] += count
+    page_splits = {page_id: math.ceil(count / limit) for page_id, count in page_counts.items() if count >= limit}
+    site_splits = {site: math.ceil(count / limit) for site, count in site_rows.items() if count >= limit}
+    return page_splits, site_splits
+
+
+def shard_skew_aware(interactions, pages, num_shards):
+    """Split interactions into up to num_shards lists of similar size, splitting only hot websites and pages
+
+    Rows of a hot page are dealt round-robin over its sub-partitions; the
+    other pages of a hot website are spread over its sub-partitions whole, by
+    page hash; every other website stays one unit. Units are sized from the
+    per-page row counts, so no per-row state is kept besides the shards.
+    """
+    page_website = {p['marketingPageId']: p['websitename'] for p in pages}
+    page_counts = page_row_counts(interactions)
+    limit = max(1, len(interactions) * SUBPARTITION_SHARE / num_shards)
+    page_splits, site_splits = hot_keys(page_counts, page_website, limit)
+
+    page_unit = {}
+    unit_rows = Counter()
+    for page_id, count in page_counts.items():
+        website = page_website[page_id]
+        if page_id in page_splits:
+            splits = page_splits[page_id]
+            for part in range(splits):
+                unit_rows['page', page_id, part] = count // splits + (part < count % splits)
+        else:
+            unit = ('site', website, hash64(page_id) % site_splits[website]) if website in site_splits else website
+            page_unit[page_id] = unit
+            unit_rows[unit] += count
+
+    shard_of = _assign(unit_rows, num_shards)
+    page_shard = {page_id: shard_of[unit] for page_id, unit in page_unit.items()}
+    hot_page_shards = {page_id: [shard_of['page', page_id, part] for part in range(splits)]
+                       for page_id, splits in page_splits.items()}
+    return _distribute(interactions, num_shards, page_shard, hot_page_shards)
+
+
+# Dimension tables, page mindates and settings, handed to each worker once. The
+# shards are not part of it: each is pickled to the one worker that folds it, so
+# a worker holds one shard at a time whichever start method the pool uses.
+_worker_context = {}
+
+
+def _init_worker(employees, pages, dates, page_mindates, visitor_sets, hll_precision, launch_windows, columns):
+    _worker_context.update(employees=employees, pages=pages, dates=dates, page_mindates=page_mindates,
+                           visitor_sets=visitor_sets, hll_precision=hll_precision, launch_windows=launch_windows,
+                           columns=columns)
+
+
+def new_state(employees, pages, dates, page_mindates, visitor_sets='set', hll_precision=None,
+              launch_windows=DEFAULT_LAUNCH_WINDOWS, columns=None):
+    """An AggregationState whose visitor encoding is the same in every process
+
+    Bitmap codes are assigned on first sight, so the employees are encoded up
+    front in table order; string ids and HLL hashes are already stable.
+    """
+    state = AggregationState(employees, pages, dates, page_mindates, visitor_sets=visitor_sets,
+                             hll_precision=hll_precision, launch_windows=launch_windows, columns=columns)
+    if visitor_sets == 'bitmap':
+        for employee in employees:
+            state.encode(employee['contactid'])
+    return state
+
+
+def _aggregate_shard(shard):
+    context = _worker_context
+    state = new_state(context['employees'], context['pages'], context['dates'], context['page_mindates'],
+                      context['visitor_sets'], context['hll_precision'], context['launch_windows'], context['columns'])
+    state.fold(shard)
+    return state.partial()
+
+
+def generate_complete_output_parallel(interactions, employees, pages, dates, workers=None, visitor_sets='set',
+                                      hll_precision=None, launch_windows=DEFAULT_LAUNCH_WINDOWS, compact=False,
+                                      columns=None, skew_aware=True):
+    """generate_complete_output with the websites aggregated in a process pool
+
+    skew_aware=False keeps every website in a single shard.
+    """
+    workers = workers or os.cpu_count()
+    shard = shard_skew_aware if skew_aware else shard_by_website
+    shards = shard(interactions, pages, workers * SHARDS_PER_WORKER)
+
+    state = new_state(employees, pages, dates, {}, visitor_sets, hll_precision, launch_windows, columns)
+    context = (employees, pages, dates, compute_page_mindates(interactions), visitor_sets, hll_precision,
+               launch_windows, columns)
+    if workers == 1:
+        _init_worker(*context)
+        for rows in shards:
+            state.merge(_aggregate_shard(rows))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=context) as pool:
+            for partial in pool.map(_aggregate_shard, shards):
+                state.merge(partial)
+    return state.output_rows(compact=compact)
+
+
+def main():
+    from generate_complete_sample import generate_complete_output, generate_sample_data
+
+    parser = argparse.ArgumentParser(description='Compare parallel and single-process aggregation')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--visitor-sets', choices=['set', 'bitmap'], default='set')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                 seed=args.seed)
+
+    start = time.perf_counter()
+    single = generate_complete_output(interactions, employees, pages, dates, visitor_sets=args.visitor_sets)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = generate_complete_output_parallel(interactions, employees, pages, dates, workers=args.workers,
+                                                 visitor_sets=args.visitor_sets)
+    parallel_seconds = time.perf_counter() - start
+
+    if parallel != single:
+        raise AssertionError("Parallel output differs from the single-process output")
+    print(f"Aggregated {len(interactions):,} interactions into {len(single):,} rows")
+    print(f"   Single process: {single_seconds:.2f}s")
+    print(f"   Parallel ({args.workers or os.cpu_count()} workers): {parallel_seconds:.2f}s "
+          f"({single_seconds / parallel_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Parallel xlsx export: every sheet rendered in its own worker process
+
+openpyxl builds a workbook one sheet after another, so exporting the validation
+workbook takes as long as all sheets together, and interactions_metrics is far
+bigger than the rest. Here each sheet's worksheet XML is generated and deflated
+in a worker of a process pool, and the main process only assembles the
+package: workbook, styles and relationship parts plus the precompressed sheet
+parts, written straight into the zip container. Export time drops to roughly
+that of the largest sheet.
+
+Sheets keep the look of write_data_sheet/write_overview_sheet (header colors,
+frozen header row, column widths, collapsed metric groups). Cells are written
+as inline strings and numbers with a fixed style table, so no shared string
+table has to be merged across workers. A table with more rows than an Excel
+sheet holds (1,048,576 including the header) is split over numbered sheets:
+
+    write_workbook('out.xlsx', ('📊 Overview', overview_data),
+                   [('interactions_metrics', interactions, columns, {})], workers=8)
+
+Usage:
+    python parallel_workbook.py --employees 20000 --pages 5000 --interactions 500000 --workers 8
+"""
+
+import argparse
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+
+from compact_records import RecordTable, iter_row_values
+from generate_complete_sample import (DIMENSION_COLOR, HEADER_COLORS, OVERVIEW_SECTION_ROWS, column_width,
+                                      header_fill_color)
+
+# Rows per sheet in Excel, including the header row
+EXCEL_MAX_ROWS = 1_048_576
+MAX_SHEET_TITLE = 31
+
+# Rows rendered into one XML string at a time
+RENDER_CHUNK_ROWS = 10_000
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Cell style ids (cellXfs) of STYLES_XML
+STYLE_DATA_RIGHT = 1
+STYLE_DATA_LEFT = 2
+STYLE_TITLE = 3
+STYLE_SECTION = 4
+HEADER_STYLES = {(color, wrap_text): 5 + 2 * i + wrap_text
+                 for i, color in enumerate(HEADER_COLORS) for wrap_text in (False, True)}
+
+
+def _styles_xml():
+    """Fonts, fills and cell formats matching the named styles of register_named_styles"""
+    fonts = ['<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>',
+             '<font><b/><sz val="9"/><color rgb="00FFFFFF"/><name val="Calibri"/><family val="2"/></font>',
+             '<font><b/><sz val="16"/><color rgb="00366092"/><name val="Calibri"/><family val="2"/></font>',
+             '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>']
+    fills = ['<fill><patternFill/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+    fills += [f'<fill><patternFill patternType="solid"><fgColor rgb="00{color}"/><bgColor rgb="00{color}"/>'
+              f'</patternFill></fill>' for color in HEADER_COLORS]
+    formats = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>',
+               '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+               '<alignment horizontal="right"/></xf>',
+               '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+               '<alignment horizontal="left"/></xf>',
+               '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1"/>',
+               '<xf numFmtId="0" fontId="3" fillId="0" borderId="0" xfId="0" applyFont="1"/>']
+    for (color, wrap_text), style in sorted(HEADER_STYLES.items(), key=lambda item: item[1]):
+        wrap = ' wrapText="1"' if wrap_text else ''
+        formats.append(f'<xf numFmtId="0" fontId="1" fillId="{2 + HEADER_COLORS.index(color)}" borderId="0" xfId="0" '
+                       f'applyFont="1" applyFill="1" applyAlignment="1">'
+                       f'<alignment horizontal="center" vertical="center"{wrap}/></xf>')
+    return (f'{XML_DECLARATION}<styleSheet xmlns="{MAIN_NS}">'
+            f'<fonts count="{len(fonts)}">{"".join(fonts)}</fonts>'
+            f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+            f'<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            f'<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            f'<cellXfs count="{len(formats)}">{"".join(formats)}</cellXfs>'
+            f'<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            f'</styleSheet>')
+
+
+STYLES_XML = _styles_xml()
+
+
+def _cell_xml(value, style):
+    """One <c> element; cells carry no reference, so every column is written in order"""
+    if value is None or value == '':
+        # openpyxl also writes empty strings as empty cells
+        return f'<c s="{style}"/>'
+    if value is True or value is False:
+        return f'<c t="b" s="{style}"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c s="{style}"><v>{value!r}</v></c>'
+    text = escape(str(value))
+    space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() else ''
+    return f'<c t="inlineStr" s="{style}"><is><t{space}>{text}</t></is></c>'
+
+
+def _data_row_xml(row_num, values):
+    cells = ''.join(_cell_xml(value, STYLE_DATA_RIGHT if isinstance(value, (int, float)) else STYLE_DATA_LEFT)
+                    for value in values)
+    return f'<row r="{row_num}">{cells}</row>'
+
+
+def _cols_xml(widths, collapse_groups=None):
+    collapsed = set()
+    for start_col, end_col in collapse_groups or ():
+        collapsed.update(range(start_col, end_col + 1))
+    cols = []
+    for col_num, width in enumerate(widths, 1):
+        group = ' outlineLevel="1" hidden="1"' if col_num in collapsed else ''
+        cols.append(f'<col min="{col_num}" max="{col_num}" width="{width}" customWidth="1"{group}/>')
+    return f'<cols>{"".join(cols)}</cols>'
+
+
+class _DeflatedPart:
+    """A zip entry deflated incrementally: crc, sizes and the compressed bytes"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        self._chunks = []
+        self.crc = 0
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self._chunks.append(self._compressor.compress(data))
+
+    def finish(self):
+        self._chunks.append(self._compressor.flush())
+        return self.crc, self.size, b''.join(self._chunks)
+
+
+def render_table_sheet(rows, columns, uv_col_indices=None, collapse_groups=None):
+    """(crc, size, deflated worksheet XML) of one data sheet, laid out as write_data_sheet lays it out
+
+    rows is read twice: once for the column widths, which precede the rows in
+    the XML, then to render and deflate RENDER_CHUNK_ROWS rows at a time.
+    """
+    max_lengths = [len(str(column)) for column in columns]
+    num_rows = 0
+    for values in rows:
+        num_rows += 1
+        for i, value in enumerate(values):
+            length = len(str(value))
+            if length > max_lengths[i]:
+                max_lengths[i] = length
+
+    header = []
+    for col_num, column_name in enumerate(columns, 1):
+        if uv_col_indices:
+            style = HEADER_STYLES[header_fill_color(col_num, column_name, uv_col_indices), True]
+        else:
+            style = HEADER_STYLES[DIMENSION_COLOR, False]
+        header.append(_cell_xml(column_name, style))
+
+    part = _DeflatedPart()
+    outline = '<sheetFormatPr defaultRowHeight="15" outlineLevelCol="1"/>' if collapse_groups else ''
+    part.write(f'{XML_DECLARATION}<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+               f'<dimension ref="A1:{get_column_letter(max(len(columns), 1))}{num_rows + 1}"/>'
+               f'<sheetViews><sheetView workbookViewId="0">'
+               f'<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+               f'<selection pane="bottomLeft"/></sheetView></sheetViews>{outline}'
+               f'{_cols_xml([column_width(length) for length in max_lengths], collapse_groups)}'
+               f'<sheetData><row r="1">{"".join(header)}</row>')
+    row_num = 1
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, RENDER_CHUNK_ROWS))
+        if not batch:
+            break
+        part.write(''.join(_data_row_xml(row_num + offset, values) for offset, values in enumerate(batch, 1)))
+        row_num += len(batch)
+    part.write('</sheetData></worksheet>')
+    return part.finish()
+
+
+def render_overview_sheet(overview_data):
+    """(crc, size, deflated worksheet XML) of the overview sheet, as write_overview_sheet lays it out"""
+    rows = []
+    for row_num, row_data in enumerate(overview_data, 1):
+        style = STYLE_TITLE if row_num == 1 else STYLE_SECTION if row_num in OVERVIEW_SECTION_ROWS else 0
+        rows.append(f'<row r="{row_num}">{"".join(_cell_xml(value, style) for value in row_data)}</row>')
+    part = _DeflatedPart()
+    part.write(f'{XML_DECLARATION}<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+               f'{_cols_xml([30, 80])}<sheetData>{"".join(rows)}</sheetData></worksheet>')
+    return part.finish()
+
+
+def sheet_parts(title, num_rows, max_rows=EXCEL_MAX_ROWS):
+    """(title, start, end) of the sheets a table of num_rows rows is written to, each within max_rows with its header"""
+    rows_per_sheet = max_rows - 1
+    if num_rows <= rows_per_sheet:
+        return [(title, 0, num_rows)]
+    parts = []
+    for part, start in enumerate(range(0, num_rows, rows_per_sheet), 1):
+        suffix = f' ({part})'
+        parts.append((title[:MAX_SHEET_TITLE - len(suffix)] + suffix, start, min(start + rows_per_sheet, num_rows)))
+    return parts
+
+
+class _TableRows:
+    """Value tuples of rows start:end of a table, re-iterable without copying the table"""
+
+    def __init__(self, records, columns, start, end):
+        self.records, self.columns, self.start, self.end = records, columns, start, end
+
+    def __iter__(self):
+        if isinstance(self.records, RecordTable):
+            return islice(self.records.iter_rows(self.columns), self.start, self.end)
+        return iter_row_values(islice(self.records, self.start, self.end), self.columns)
+
+
+def _render_job(job):
+    """Render one sheet; job is ('overview', rows) or ('table', rows, columns, options)"""
+    started = time.perf_counter()
+    if job[0] == 'overview':
+        result = render_overview_sheet(job[1])
+    else:
+        _, rows, columns, options = job
+        result = render_table_sheet(rows, columns, **options)
+    return result, time.perf_counter() - started
+
+
+def _dos_timestamp(timestamp):
+    t = time.localtime(timestamp)
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def write_package(path, entries):
+    """Write a zip file from (name, crc, size, deflated bytes) entries, deflated elsewhere"""
+    dos_time, dos_date = _dos_timestamp(time.time())
+    central = []
+    offset = 0
+    with open(path, 'wb') as f:
+        for name, crc, size, data in entries:
+            if size > 0xFFFFFFFF or len(data) > 0xFFFFFFFF or offset > 0xFFFFFFFF:
+                raise ValueError(f"{name} does not fit a zip without ZIP64 extensions; write fewer rows per sheet")
+            encoded = name.encode('utf-8')
+            # Version 2.0, UTF-8 names (flag bit 11), deflate
+            header = struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, 0x800, 8, dos_time, dos_date,
+                                 crc, len(data), size, len(encoded), 0)
+            f.write(header + encoded)
+            f.write(data)
+            central.append(struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, 0x800, 8, dos_time, dos_date,
+                                       crc, len(data), size, len(encoded), 0, 0, 0, 0, 0, offset) + encoded)
+            offset += len(header) + len(encoded) + len(data)
+        directory = b''.join(central)
+        if offset > 0xFFFFFFFF:
+            raise ValueError("The workbook is over 4 GB, which needs ZIP64 extensions; write fewer rows")
+        f.write(directory)
+        f.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central), len(directory), offset, 0))
+
+
+def _deflated(text):
+    part = _DeflatedPart()
+    part.write(text)
+    return part.finish()
+
+
+def _package_entries(titles, sheets):
+    """Zip entries of the whole package; sheets are the (crc, size, data) of each worksheet in order"""
+    overrides = ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/'
+                        f'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                        for i in range(1, len(titles) + 1))
+    content_types = (f'{XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     f'<Default Extension="xml" ContentType="application/xml"/>'
+                     f'<Override PartName="/xl/workbook.xml" ContentType="application/'
+                     f'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                     f'<Override PartName="/xl/styles.xml" ContentType="application/'
+                     f'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>{overrides}</Types>')
+    root_rels = (f'{XML_DECLARATION}<Relationships xmlns="{PACKAGE_REL_NS}">'
+                 f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+    sheet_list = ''.join(f'<sheet name={quoteattr(title)} sheetId="{i}" r:id="rId{i}"/>'
+                         for i, title in enumerate(titles, 1))
+    workbook = (f'{XML_DECLARATION}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+                f'<bookViews><workbookView/></bookViews><sheets>{sheet_list}</sheets></workbook>')
+    workbook_rels = ''.join(f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                            for i in range(1, len(titles) + 1))
+    workbook_rels = (f'{XML_DECLARATION}<Relationships xmlns="{PACKAGE_REL_NS}">{workbook_rels}'
+                     f'<Relationship Id="rId{len(titles) + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>'
+                     f'</Relationships>')
+
+    entries = [('[Content_Types].xml', *_deflated(content_types)),
+               ('_rels/.rels', *_deflated(root_rels)),
+               ('xl/workbook.xml', *_deflated(workbook)),
+               ('xl/_rels/workbook.xml.rels', *_deflated(workbook_rels)),
+               ('xl/styles.xml', *_deflated(STYLES_XML))]
+    entries += [(f'xl/worksheets/sheet{i}.xml', *sheet) for i, sheet in enumerate(sheets, 1)]
+    return entries
+
+
+def _sheet_rows(job):
+    return len(job[1]) if job[0] == 'overview' else job[1].end - job[1].start
+
+
+def _render_in_pool(jobs, workers):
+    """_render_job results of every job, rendered in a pool of worker processes
+
+    Each worker receives only the rows of the sheet it renders, copied out of
+    the table when the job is submitted. At most `workers` jobs are in flight,
+    so the main process holds a copy of at most that many sheets.
+    """
+    # Largest sheets first, so the longest render starts right away
+    order = sorted(range(len(jobs)), key=lambda i: -_sheet_rows(jobs[i]))
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        for i in order:
+            if len(running) >= workers:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+            job = jobs[i]
+            if job[0] == 'table':
+                job = ('table', list(job[1]), job[2], job[3])
+            running[pool.submit(_render_job, job)] = i
+        for future in as_completed(running):
+            results[running[future]] = future.result()
+    return results
+
+
+def write_workbook(path, overview, tables, workers=None, max_rows=EXCEL_MAX_ROWS):
+    """Write an xlsx with the overview sheet and one sheet per table, rendering sheets in parallel
+
+    overview is (title, rows) or None; tables are (title, records, columns,
+    options) with records a list of dicts or a RecordTable and options the
+    uv_col_indices/collapse_groups of write_data_sheet. Tables over max_rows
+    rows (header included) are split over several sheets. Returns the render
+    seconds of every sheet, by title.
+    """
+    titles, jobs = [], []
+    if overview is not None:
+        titles.append(overview[0])
+        jobs.append(('overview', overview[1]))
+    for title, records, columns, options in tables:
+        for part_title, start, end in sheet_parts(title, len(records), max_rows):
+            titles.append(part_title)
+            jobs.append(('table', _TableRows(records, columns, start, end), columns, options))
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        results = [_render_job(job) for job in jobs]
+    else:
+        results = _render_in_pool(jobs, workers)
+
+    write_package(path, _package_entries(titles, [sheet for sheet, _ in results]))
+    return {title: seconds for title, (_, seconds) in zip(titles, results)}
+
+
+def benchmark_export(num_employees, num_sites, num_pages, num_interactions, workers=None, seed=0):
+    """Seconds to export the validation workbook with openpyxl and in parallel, plus the slowest sheet"""
+    from generate_complete_sample import INPUT_TABLES, excel_layout, generate_complete_output
+    from generate_scale_data import chunk_to_records, generate_dataset, iter_interaction_chunks_np
+    from output_sinks import FACT_TABLE, ExcelSink, ParallelExcelSink
+
+    dates, employees, pages = generate_dataset(num_employees, num_sites, num_pages, seed=seed)
+    interactions = []
+    for chunk in iter_interaction_chunks_np(num_interactions, len(employees), len(pages), len(dates), seed=seed):
+        interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+    aggregated = generate_complete_output(interactions, employees, pages, dates)
+    output_columns, uv_col_indices, collapse_groups = excel_layout()
+    input_data = {'dim_date': dates, 'employeecontact': employees, 'website_page_inventory': pages,
+                  'interactions_metrics': interactions}
+    overview_data = [['SharePoint Analytics - Complete Data Model'], [''], ['Benchmark export']]
+
+    seconds = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark_export_') as path:
+        for name, sink in (('openpyxl', ExcelSink(os.path.join(path, 'openpyxl.xlsx'))),
+                           ('parallel', ParallelExcelSink(os.path.join(path, 'parallel.xlsx'), workers=workers))):
+            start = time.perf_counter()
+            sink.write_overview(overview_data)
+            for table, columns in INPUT_TABLES.items():
+                sink.write_table(table, input_data[table], columns)
+            sink.write_table(FACT_TABLE, aggregated, output_columns, uv_col_indices=uv_col_indices,
+                             collapse_groups=collapse_groups)
+            sink.close()
+            seconds[name] = time.perf_counter() - start
+    return seconds, sink.sheet_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the openpyxl and the parallel xlsx export')
+    parser.add_argument('--employees', type=int, default=20_000)
+    parser.add_argument('--sites', type=int, default=774)
+    parser.add_argument('--pages', type=int, default=5_000)
+    parser.add_argument('--interactions', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    seconds, sheet_seconds = benchmark_export(args.employees, args.sites, args.pages, args.interactions,
+                                              workers=args.workers, seed=args.seed)
+    print(f"\n{'Sheet':<32} {'render (s)':>10}")
+    for title, render in sheet_seconds.items():
+        print(f"{title:<32} {render:>10.2f}")
+    print(f"\nopenpyxl export: {seconds['openpyxl']:.2f}s")
+    print(f"parallel export: {seconds['parallel']:.2f}s with {args.workers} workers "
+          f"(slowest sheet {max(sheet_seconds.values()):.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Precomputed rollup cube for unique visitors over (website, division, region, period)
+
+The dashboard's multi-select filters ("these sites x these divisions") cannot be
+answered from the fixed output columns. The cube is built from the interactions
+once and keeps one visitor set per cell plus every coarser rollup, so a query
+only unions the cells named by the filter. Each set is a VisitorBitmap, so a
+cell with a few visitors costs a few bytes each and only the big rollups are
+packed into bit arrays:
+
+    cube = RollupCube.build(interactions, employees, pages, dates)
+    cube.unique_visitors('d28', sites=['NewsPortal', 'KnowledgeBase'], divisions=['IT'])
+
+Usage:
+    python rollup_cube.py --employees 5000 --interactions 100000 --queries 200
+"""
+
+import argparse
+import itertools
+import random
+import time
+from collections import defaultdict
+
+from generate_complete_sample import (DEFAULT_LAUNCH_WINDOWS, DateOrdinals, compute_page_mindates,
+                                      parse_launch_windows, period_membership_table, period_names, random_filter)
+from visitor_sets import ContactEncoder, VisitorBitmap
+
+DIMENSIONS = ('site', 'div', 'reg')
+
+
+def iter_interaction_cells(interactions, employees, pages, dates, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Yield (visitor, (website, division, region), periods) per interaction"""
+    emp_lookup = {e['contactid']: e for e in employees}
+    page_lookup = {p['marketingPageId']: p for p in pages}
+    date_lookup = {d['date_key']: d for d in dates}
+    page_mindates = compute_page_mindates(interactions)
+    memberships = period_membership_table(launch_windows)
+    horizon = len(memberships[0]) - 1
+    ordinals = DateOrdinals()
+
+    for interaction in interactions:
+        emp = emp_lookup[interaction['viewingcontactid']]
+        page = page_lookup[interaction['marketingPageId']]
+        date = date_lookup[interaction['visitdatekey']]
+        days_since = ordinals[date['date']] - ordinals[page_mindates[interaction['marketingPageId']]]
+        periods = memberships[date['year'] == 2024][min(max(days_since, 0), horizon)]
+
+        cell = (page['websitename'], emp['employeebusinessdivision'] or 'Unknown', emp['employeeregion'] or 'Unknown')
+        yield interaction['viewingcontactid'], cell, periods
+
+
+class RollupCube:
+    """Visitor sets for every (site, division, region) cell and all coarser rollups, per period
+
+    rollups[period][dims] maps a key over `dims` (a subset of DIMENSIONS, e.g.
+    ('site', 'div')) to a VisitorBitmap of encoded contacts.
+    The periods are those of launch_windows (see period_names).
+    """
+
+    def __init__(self, rollups, encoder, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+        self.rollups = rollups
+        self.encoder = encoder
+        self.launch_windows = launch_windows
+        self.periods = period_names(launch_windows)
+
+    @classmethod
+    def build(cls, interactions, employees, pages, dates, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+        periods = period_names(launch_windows)
+        encoder = ContactEncoder()
+        cells = {period: defaultdict(VisitorBitmap) for period in periods}
+        for visitor, cell, row_periods in iter_interaction_cells(interactions, employees, pages, dates,
+                                                                 launch_windows):
+            code = encoder.encode(visitor)
+            for period in row_periods:
+                cells[period][cell].add(code)
+
+        rollups = {}
+        for period in periods:
+            base = dict(cells[period])
+            rollups[period] = {DIMENSIONS: base}
+            for size in range(len(DIMENSIONS)):
+                for dims in itertools.combinations(range(len(DIMENSIONS)), size):
+                    groups = defaultdict(list)
+                    for cell, visitors in base.items():
+                        groups[tuple(cell[i] for i in dims)].append(visitors)
+                    rollups[period][tuple(DIMENSIONS[i] for i in dims)] = {
+                        key: VisitorBitmap.union_all(group) for key, group in groups.items()}
+        return cls(rollups, encoder, launch_windows)
+
+    def _matching(self, period, sites, divisions, regions):
+        """The stored visitor sets named by a filter; None means no filter on that dimension"""
+        filters = {'site': sites, 'div': divisions, 'reg': regions}
+        dims = tuple(d for d in DIMENSIONS if filters[d] is not None)
+        table = self.rollups[period][dims]
+        keys = itertools.product(*(filters[d] for d in dims))
+        return [table[key] for key in keys if key in table]
+
+    def visitors(self, period='all', sites=None, divisions=None, regions=None):
+        """VisitorBitmap of encoded contacts matching the filter; None means no filter on that dimension"""
+        return VisitorBitmap.union_all(self._matching(period, sites, divisions, regions))
+
+    def unique_visitors(self, period='all', sites=None, divisions=None, regions=None):
+        """Unique visitors for any set of sites x divisions x regions in one period"""
+        return VisitorBitmap.union_size(self._matching(period, sites, divisions, regions))
+
+    def cell_count(self):
+        return sum(len(table) for rollup in self.rollups.values() for table in rollup.values())
+
+
+def recompute_unique_visitors(interactions, employees, pages, dates, period='all', sites=None, divisions=None,
+                              regions=None, launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Reference answer by rescanning the raw interactions"""
+    visitors = set()
+    for visitor, (website, division, region), periods in iter_interaction_cells(interactions, employees, pages, dates,
+                                                                                launch_windows):
+        if period not in periods:
+            continue
+        if sites is not None and website not in sites:
+            continue
+        if divisions is not None and division not in divisions:
+            continue
+        if regions is not None and region not in regions:
+            continue
+        visitors.add(visitor)
+    return len(visitors)
+
+
+def random_query(rng, employees, pages, periods):
+    """A random dashboard-style filter over one of the periods"""
+    return {'period': rng.choice(periods), **random_filter(rng, employees, pages, shares=(0.8, 0.6, 0.4))}
+
+
+def benchmark_cube(interactions, employees, pages, dates, num_queries=100, seed=0,
+                   launch_windows=DEFAULT_LAUNCH_WINDOWS):
+    """Time cube build and queries against recomputing each query from raw interactions"""
+    rng = random.Random(seed)
+    periods = period_names(launch_windows)
+    queries = [random_query(rng, employees, pages, periods) for _ in range(num_queries)]
+
+    start = time.perf_counter()
+    cube = RollupCube.build(interactions, employees, pages, dates, launch_windows)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cube_answers = [cube.unique_visitors(**q) for q in queries]
+    cube_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw_answers = [recompute_unique_visitors(interactions, employees, pages, dates, launch_windows=launch_windows, **q)
+                   for q in queries]
+    raw_seconds = time.perf_counter() - start
+
+    if cube_answers != raw_answers:
+        raise AssertionError("Cube answers differ from the raw recomputation")
+
+    return {
+        'queries': num_queries,
+        'cells': cube.cell_count(),
+        'build_s': build_seconds,
+        'cube_ms_per_query': cube_seconds * 1000 / num_queries,
+        'raw_ms_per_query': raw_seconds * 1000 / num_queries,
+    }
+
+
+def main():
+    from generate_complete_sample import generate_sample_data
+
+    parser = argparse.ArgumentParser(description='Benchmark the rollup cube against raw recomputation')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--launch-windows', default=','.join(map(str, DEFAULT_LAUNCH_WINDOWS)),
+                        help='comma-separated launch windows in days, e.g. 3,7,28,60')
+    args = parser.parse_args()
+    try:
+        launch_windows = parse_launch_windows(args.launch_windows)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                 seed=args.seed)
+
+    result = benchmark_cube(interactions, employees, pages, dates, num_queries=args.queries, seed=args.seed,
+                            launch_windows=launch_windows)
+    print(f"Cube with {result['cells']} cells built in {result['build_s']:.2f}s")
+    print(f"   Cube query: {result['cube_ms_per_query']:.3f} ms/query")
+    print(f"   Raw recompute: {result['raw_ms_per_query']:.1f} ms/query "
+          f"({result['raw_ms_per_query'] / max(result['cube_ms_per_query'], 1e-9):.0f}x slower)")
+
+
+if __name__ == '__main__':
+    main()
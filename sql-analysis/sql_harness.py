@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Run the Spark SQL scripts locally on DuckDB against generated data
+
+Loads the generator's dim_date, employeecontact, website_page_inventory and
+interactions_metrics tables into an in-process DuckDB database under their
+sharepoint_gold names, adapts the Databricks-only syntax, runs each script and
+reports its time and memory. The FIXED fact table is then diffed column by
+column against generate_complete_output.
+
+Adaptations (see adapt_spark_sql):
+- `%sql` magic lines are dropped
+- `USING delta LOCATION '...'` is dropped, so CREATE TABLE ... AS builds a local table
+- DATE_ADD(x, n) / DATE_SUB(x, n) become date arithmetic
+- Spark functions DuckDB lacks or defines differently are rewritten call by
+  call (SPARK_FUNCTIONS): COLLECT_SET, PERCENTILE, two-argument DATEDIFF and
+  to_date/date_format with Spark date patterns
+- CURRENT_DATE() is pinned to --as-of (default: last dim_date day) and
+  YEAR(NOW()) to --current-year (2024, the generator's "this year")
+- production-only columns the generator does not produce (week, quarter,
+  fullpageurl, duration/flag and employee attributes) are added as derived
+  values or NULLs, and pbi_db_referrer_application is created empty
+
+Usage:
+    python sql_harness.py --employees 2000 --pages 300 --interactions 50000 --json sql_harness.json
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+from generate_complete_sample import INPUT_TABLES, generate_complete_output
+from instrumentation import peak_rss_mb
+from output_sinks import FACT_TABLE, FACT_TABLE_COLUMNS, PARQUET_TABLE_NAMES, arrow_table
+
+SCHEMA = 'sharepoint_gold'
+DEFAULT_SCRIPTS = ['Overview_fact_table_FIXED.sql', 'Overview_fact_table_90days_contact_level.sql',
+                   'Overview_fact_table_UNIFIED.sql']
+CURRENT_YEAR = 2024
+
+# (column, type, expression) added to the loaded tables; expression None means NULL
+PRODUCTION_COLUMNS = {
+    'dim_date': [('week', 'INTEGER', 'weekofyear(date)'), ('quarter', 'INTEGER', 'quarter(date)')],
+    'interactions_metrics': [('referrerapplicationid', 'VARCHAR', None), ('durationsum', 'DOUBLE', None),
+                             ('durationavg', 'DOUBLE', None), ('flag', 'INTEGER', None)],
+    'website_page_inventory': [('fullpageurl', 'VARCHAR', 'page_url')],
+    'employeecontact': [('employeeClass', 'VARCHAR', None), ('employeeRank', 'VARCHAR', None),
+                        ('employeeWorkCountry', 'VARCHAR', None)] +
+                       [(f'OU_LVL_{level}', 'VARCHAR', None) for level in range(1, 6)],
+}
+
+
+def _strftime_pattern(pattern):
+    """A Spark date pattern literal such as 'yyyyMMdd' as a strftime format literal"""
+    for spark, strftime in (('yyyy', '%Y'), ('MM', '%m'), ('dd', '%d'), ('HH', '%H'), ('mm', '%M'), ('ss', '%S')):
+        pattern = pattern.replace(spark, strftime)
+    return pattern
+
+
+# Spark function -> DuckDB expression built from the (already rewritten) argument texts
+SPARK_FUNCTIONS = {
+    'date_add': lambda date, days: f'(CAST({date} AS DATE) + {days})',
+    'date_sub': lambda date, days: f'(CAST({date} AS DATE) - {days})',
+    'datediff': lambda end, start: f"date_diff('day', CAST({start} AS DATE), CAST({end} AS DATE))",
+    'collect_set': lambda value: f'list_sort(list(DISTINCT {value}))',
+    'percentile': lambda value, fraction: f'quantile_cont({value}, {fraction})',
+    'to_date': lambda value, pattern="'yyyy-MM-dd'":
+        f'CAST(strptime(CAST({value} AS VARCHAR), {_strftime_pattern(pattern)}) AS DATE)',
+    'date_format': lambda date, pattern: f'strftime(CAST({date} AS DATE), {_strftime_pattern(pattern)})',
+}
+
+
+def connect(database=':memory:'):
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("The SQL harness requires duckdb: pip install duckdb")
+    return duckdb.connect(database)
+
+
+def add_production_columns(con, name, target):
+    """Add the PRODUCTION_COLUMNS of one input table to its loaded copy"""
+    for column, column_type, expression in PRODUCTION_COLUMNS.get(name, []):
+        con.execute(f'ALTER TABLE {target} ADD COLUMN {column} {column_type}')
+        if expression:
+            con.execute(f'UPDATE {target} SET {column} = {expression}')
+
+
+def create_referrer_table(con):
+    con.execute(f'CREATE OR REPLACE TABLE {SCHEMA}.pbi_db_referrer_application '
+                f'(referrerapplicationid VARCHAR, referrerapplication VARCHAR)')
+
+
+def load_tables(con, tables):
+    """Create sharepoint_gold.pbi_db_* tables from {table name: rows} of the generator's tables"""
+    con.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+    for name, rows in tables.items():
+        target = f'{SCHEMA}.{PARQUET_TABLE_NAMES[name]}'
+        data = arrow_table(name, rows, INPUT_TABLES[name])  # noqa: F841 - scanned by name below
+        con.execute(f'CREATE OR REPLACE TABLE {target} AS SELECT * FROM data')
+        add_production_columns(con, name, target)
+    create_referrer_table(con)
+
+
+def adapt_spark_sql(sql, as_of, current_year=CURRENT_YEAR):
+    """Rewrite Databricks SQL into DuckDB SQL (see the module docstring)"""
+    sql = re.sub(r'^\s*%sql\s*$', '', sql, flags=re.MULTILINE)
+    sql = re.sub(r"\bUSING\s+delta\s+LOCATION\s+'[^']*'", '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bYEAR\s*\(\s*NOW\s*\(\s*\)\s*\)', str(current_year), sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bCURRENT_DATE\s*\(\s*\)', f"DATE '{as_of}'", sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bNOW\s*\(\s*\)', f"TIMESTAMP '{as_of}'", sql, flags=re.IGNORECASE)
+    return rewrite_spark_functions(sql)
+
+
+def _skip_literal(sql, i):
+    """Index past the comment or string literal starting at sql[i], or None when none starts there"""
+    if sql.startswith('--', i):
+        end = sql.find('\n', i)
+        return len(sql) if end == -1 else end
+    if sql.startswith('/*', i):
+        end = sql.find('*/', i + 2)
+        return len(sql) if end == -1 else end + 2
+    quote = sql[i]
+    if quote not in ("'", '"', '`'):
+        return None
+    end = i + 1
+    while end < len(sql):
+        if sql[end] == '\\':
+            end += 2
+        elif sql.startswith(quote * 2, end):
+            end += 2  # doubled quote inside the literal
+        elif sql[end] == quote:
+            return end + 1
+        else:
+            end += 1
+    return len(sql)
+
+
+def _call_arguments(sql, start):
+    """(argument texts, index past the closing parenthesis) of the call whose '(' is at sql[start]
+
+    Parentheses and commas inside comments and string literals do not count;
+    None when the call is never closed.
+    """
+    depth = 0
+    arguments = []
+    argument_start = start + 1
+    i = start
+    while i < len(sql):
+        end = _skip_literal(sql, i)
+        if end is not None:
+            i = end
+            continue
+        char = sql[i]
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                arguments.append(sql[argument_start:i].strip())
+                return [argument for argument in arguments if argument], i + 1
+        elif char == ',' and depth == 1:
+            arguments.append(sql[argument_start:i].strip())
+            argument_start = i + 1
+        i += 1
+    return None
+
+
+SPARK_CALL = re.compile(rf'\b({"|".join(SPARK_FUNCTIONS)})\s*\(', re.IGNORECASE)
+
+
+def rewrite_spark_functions(sql):
+    """Replace the calls of SPARK_FUNCTIONS, innermost arguments first
+
+    Comments and string literals are copied as they are. Calls with another
+    arity or without a closing parenthesis are left untouched.
+    """
+    parts = []
+    position = 0
+    i = 0
+    while i < len(sql):
+        end = _skip_literal(sql, i)
+        if end is not None:
+            i = end
+            continue
+        match = SPARK_CALL.match(sql, i)
+        call = match and _call_arguments(sql, match.end() - 1)
+        if call:
+            arguments, end = call
+            try:
+                rewritten = SPARK_FUNCTIONS[match.group(1).lower()](*map(rewrite_spark_functions, arguments))
+            except TypeError:
+                rewritten = None
+            if rewritten is not None:
+                parts.append(sql[position:i])
+                parts.append(rewritten)
+                position = i = end
+                continue
+        i += 1
+    parts.append(sql[position:])
+    return ''.join(parts)
+
+
+def split_statements(sql):
+    """Split a script into statements on top-level semicolons, skipping comments and string literals"""
+    statements = []
+    current = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        char = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+            continue
+        if char in ("'", '"', '`'):
+            end = i + 1
+            while end < n and sql[end] != char:
+                end += 2 if sql[end] == '\\' else 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if char == ';':
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statements.append(''.join(current))
+    return [statement.strip() for statement in statements if _strip_comments(statement).strip()]
+
+
+def _split_literals(sql):
+    """sql as (text, kind) pieces, kind being 'code', 'comment' or 'literal' (strings and quoted names)"""
+    pieces = []
+    start = i = 0
+    while i < len(sql):
+        end = _skip_literal(sql, i)
+        if end is None:
+            i += 1
+            continue
+        if i > start:
+            pieces.append((sql[start:i], 'code'))
+        pieces.append((sql[i:end], 'comment' if sql.startswith(('--', '/*'), i) else 'literal'))
+        start = i = end
+    if start < len(sql):
+        pieces.append((sql[start:], 'code'))
+    return pieces
+
+
+def _strip_comments(sql):
+    """sql with each comment replaced by a space; '--' and '/*' inside string literals are kept"""
+    return ''.join(' ' if kind == 'comment' else text for text, kind in _split_literals(sql))
+
+
+def _duckdb_memory_mb(con):
+    try:
+        return con.execute('SELECT sum(memory_usage_bytes) FROM duckdb_memory()').fetchone()[0] / 2**20
+    except Exception:
+        return None
+
+
+def run_script(con, path, as_of, current_year=CURRENT_YEAR):
+    """Adapt and execute one script; returns its timing and memory figures"""
+    with open(path) as f:
+        statements = split_statements(adapt_spark_sql(f.read(), as_of, current_year))
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    for statement in statements:
+        con.execute(statement)
+    seconds = time.perf_counter() - start
+
+    created = re.search(r'CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+([\w.]+)', statements[-1], re.IGNORECASE)
+    table = created.group(1) if created else None
+    return {
+        'script': os.path.basename(path),
+        'statements': len(statements),
+        'seconds': seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_growth_mb': peak_rss_mb() - rss_before,
+        'duckdb_memory_mb': _duckdb_memory_mb(con),
+        'table': table,
+        'rows': con.execute(f'SELECT count(*) FROM {table}').fetchone()[0] if table else None,
+    }
+
+
+def diff_fact_table(con, reference_rows, table=f'{SCHEMA}.pbi_db_overview_fact_tbl'):
+    """Compare the SQL fact table with generate_complete_output, column by column
+
+    SQL leaves a metric NULL where a LEFT JOINed CTE has no row for the grain,
+    while generate_complete_output reports 0; those cells are counted as
+    null_vs_zero rather than as mismatches.
+    """
+    dimensions = FACT_TABLE_COLUMNS[:4]
+    cursor = con.execute(f'SELECT * FROM {table}')
+    sql_columns = [column[0] for column in cursor.description]
+    sql_rows = {tuple(record[:4]): dict(zip(sql_columns, record)) for record in cursor.fetchall()}
+    reference = {tuple(row[column] for column in dimensions): row for row in reference_rows}
+
+    common = sorted(set(sql_rows) & set(reference), key=str)
+    columns = {}
+    for column in FACT_TABLE_COLUMNS[4:]:
+        stats = {'mismatches': 0, 'null_vs_zero': 0, 'example': None}
+        for key in common:
+            sql_value = sql_rows[key].get(column)
+            expected = reference[key][column]
+            if sql_value == expected:
+                continue
+            if sql_value is None and expected == 0:
+                stats['null_vs_zero'] += 1
+                continue
+            stats['mismatches'] += 1
+            if stats['example'] is None:
+                stats['example'] = {'key': list(key), 'sql': sql_value, 'python': expected}
+        columns[column] = stats
+
+    return {
+        'rows_sql': len(sql_rows),
+        'rows_python': len(reference),
+        'only_in_sql': len(set(sql_rows) - set(reference)),
+        'only_in_python': len(set(reference) - set(sql_rows)),
+        'missing_columns': [column for column in FACT_TABLE_COLUMNS if column not in sql_columns],
+        'columns': columns,
+    }
+
+
+def run_harness(tables, scripts, as_of=None, current_year=CURRENT_YEAR, database=':memory:'):
+    """Load the tables, run every script and diff the fact table; returns a JSON-friendly report"""
+    con = connect(database)
+    start = time.perf_counter()
+    load_tables(con, {name: rows for name, rows in tables.items() if name != FACT_TABLE})
+    load_seconds = time.perf_counter() - start
+    as_of = as_of or str(con.execute(f'SELECT max(date) FROM {SCHEMA}.pbi_db_dim_date').fetchone()[0])
+
+    report = {'as_of': as_of, 'current_year': current_year, 'load_seconds': load_seconds, 'scripts': []}
+    for path in scripts:
+        try:
+            report['scripts'].append(run_script(con, path, as_of, current_year))
+        except Exception as exc:
+            report['scripts'].append({'script': os.path.basename(path), 'error': str(exc).splitlines()[0]})
+
+    if FACT_TABLE in tables and any((result.get('table') or '').endswith('pbi_db_overview_fact_tbl')
+                                    for result in report['scripts'] if 'error' not in result):
+        report['fact_table_diff'] = diff_fact_table(con, tables[FACT_TABLE])
+    con.close()
+    return report
+
+
+def print_report(report):
+    print(f"Loaded input tables in {report['load_seconds']:.2f}s (as of {report['as_of']}, "
+          f"current year {report['current_year']})")
+    print(f"\n{'Script':<48} {'Time (s)':>9} {'Rows':>9} {'Peak RSS (MB)':>14} {'DuckDB (MB)':>12}")
+    for result in report['scripts']:
+        if 'error' in result:
+            print(f"{result['script']:<48} FAILED: {result['error']}")
+            continue
+        duckdb_mb = f"{result['duckdb_memory_mb']:.1f}" if result['duckdb_memory_mb'] is not None else '-'
+        print(f"{result['script']:<48} {result['seconds']:>9.3f} {result['rows'] or 0:>9,} "
+              f"{result['peak_rss_mb']:>14.1f} {duckdb_mb:>12}")
+
+    diff = report.get('fact_table_diff')
+    if not diff:
+        return
+    print(f"\nFact table vs generate_complete_output: {diff['rows_sql']:,} SQL rows, "
+          f"{diff['rows_python']:,} python rows ({diff['only_in_sql']} only in SQL, "
+          f"{diff['only_in_python']} only in python)")
+    if diff['missing_columns']:
+        print(f"   Missing columns: {', '.join(diff['missing_columns'])}")
+    for column, stats in diff['columns'].items():
+        if stats['mismatches']:
+            print(f"   ❌ {column:<32} {stats['mismatches']:>6} mismatches, e.g. {stats['example']}")
+    null_columns = sum(1 for stats in diff['columns'].values() if stats['null_vs_zero'])
+    null_cells = sum(stats['null_vs_zero'] for stats in diff['columns'].values())
+    if null_cells:
+        print(f"   {null_cells:,} cells in {null_columns} columns are NULL in SQL where python reports 0")
+    if not any(stats['mismatches'] for stats in diff['columns'].values()):
+        print("   ✅ All values match")
+
+
+def main():
+    from generate_complete_sample import generate_sample_data
+
+    parser = argparse.ArgumentParser(description='Run the Spark SQL scripts on DuckDB against generated data')
+    parser.add_argument('scripts', nargs='*', help='SQL scripts to run, in order (default: FIXED, 90days, UNIFIED)')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', help='date used for CURRENT_DATE() (default: last dim_date day)')
+    parser.add_argument('--current-year', type=int, default=CURRENT_YEAR, help='year used for YEAR(NOW())')
+    parser.add_argument('--database', default=':memory:', help='DuckDB database file (default: in memory)')
+    parser.add_argument('--json', help='write the report to this JSON file')
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    scripts = args.scripts or [os.path.join(here, name) for name in DEFAULT_SCRIPTS]
+
+    interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                 seed=args.seed)
+    tables = {
+        'dim_date': dates,
+        'employeecontact': employees,
+        'website_page_inventory': pages,
+        'interactions_metrics': interactions,
+        FACT_TABLE: generate_complete_output(interactions, employees, pages, dates),
+    }
+
+    report = run_harness(tables, scripts, as_of=args.as_of, current_year=args.current_year, database=args.database)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n   Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Shared fixtures: one small seeded dataset and its reference output"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# The modules are flat scripts in sql-analysis/, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_complete_sample import (generate_complete_output, generate_dim_date,  # noqa: E402
+                                      generate_employee_contacts, generate_interactions,
+                                      generate_website_page_inventory)
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    """(interactions, employees, pages, dates) from the sample generator with a fixed seed"""
+    random.seed(11)
+    dates = generate_dim_date(400)
+    employees = generate_employee_contacts(300)
+    pages = generate_website_page_inventory(40)
+    interactions = generate_interactions(6000, employees, pages, dates)
+    return interactions, employees, pages, dates
+
+
+@pytest.fixture(scope='session')
+def reference(dataset):
+    """Rows of the single-process python engine, which every other path must reproduce"""
+    return generate_complete_output(*dataset)
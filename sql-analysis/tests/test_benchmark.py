@@ -0,0 +1,62 @@
+"""Benchmark size parsing, scaling exponents and the baseline regression check"""
+
+import copy
+
+import pytest
+
+from benchmark import COMPARABLE_META, compare_to_baseline, parse_size, run_size, scaling_exponents
+
+
+def _report(seconds, rss=100.0, size='s', interactions=1000, **meta):
+    stages = {stage: {'seconds': seconds, 'peak_rss_mb': rss, 'rows': interactions, 'rows_per_s': None}
+              for stage in ('generate', 'aggregate', 'write')}
+    return {
+        'meta': {'engine': 'python', 'sink': 'parquet', 'visitor_sets': 'set', 'seed': 42, 'generator': 'numpy',
+                 **meta},
+        'results': [{'size': size, 'interactions': interactions, 'stages': stages}],
+    }
+
+
+def test_parse_size():
+    assert parse_size('xs') == ('xs', 1_000, 200, 50, 4)
+    assert parse_size('50kx5000x1000') == ('50kx5000x1000', 50_000, 5_000, 1_000, 20)
+    assert parse_size('1.5m') == ('1.5m', 1_500_000, 15_000, 6_000, 120)
+
+
+def test_scaling_exponents():
+    small, large = _report(1.0)['results'][0], _report(4.0, size='m', interactions=2000)['results'][0]
+    [entry] = scaling_exponents([large, small])
+    assert (entry['from'], entry['to']) == ('s', 'm')
+    assert entry['aggregate'] == pytest.approx(2.0)
+
+
+def test_growth_over_the_threshold_is_a_regression():
+    baseline = _report(1.0)
+    assert compare_to_baseline(_report(1.2, rss=120.0), baseline, threshold=0.25) == []
+
+    regressions = compare_to_baseline(_report(1.3, rss=140.0), baseline, threshold=0.25)
+    assert {(r['stage'], r['metric']) for r in regressions} == {
+        (stage, metric) for stage in ('generate', 'aggregate', 'write') for metric in ('seconds', 'peak_rss_mb')}
+    assert regressions[0]['change'] == pytest.approx(0.3)
+
+
+def test_noisy_stages_and_new_sizes_are_not_compared():
+    assert compare_to_baseline(_report(0.04), _report(0.01)) == []
+    assert compare_to_baseline(_report(9.0, size='m'), _report(1.0)) == []
+
+
+@pytest.mark.parametrize('key', COMPARABLE_META)
+def test_baseline_with_other_settings_is_refused(key):
+    baseline = _report(1.0)
+    report = copy.deepcopy(baseline)
+    report['meta'][key] = 'other'
+    with pytest.raises(ValueError, match=key):
+        compare_to_baseline(report, baseline)
+
+
+@pytest.mark.parametrize('engine', ['python', 'columnar'])
+def test_run_size(engine):
+    pytest.importorskip('pyarrow')
+    result = run_size(('tiny', 2000, 100, 30, 4), engine=engine)
+    assert result['output_rows'] > 0
+    assert all(result['stages'][stage]['seconds'] > 0 for stage in ('generate', 'aggregate', 'write'))
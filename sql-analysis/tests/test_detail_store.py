@@ -0,0 +1,47 @@
+"""DetailStore builds from every interaction input shape and answers like a raw rescan"""
+
+import random
+
+import pytest
+
+from compact_records import RecordTable
+from detail_store import DetailStore, random_query, recompute_query
+
+
+def _chunks(interactions, size=1000):
+    return (interactions[start:start + size] for start in range(0, len(interactions), size))
+
+
+@pytest.mark.parametrize('shape', ['dicts', 'record_table', 'records', 'chunks'])
+def test_build_accepts_every_input_shape(dataset, tmp_path, shape):
+    interactions, employees, pages, dates = dataset
+    table = RecordTable.from_records(interactions)
+    inputs = {
+        'dicts': interactions,
+        'record_table': table,
+        'records': list(table),
+        'chunks': _chunks(interactions),
+    }[shape]
+    store = DetailStore.build(str(tmp_path / shape), inputs, employees, pages, dates, days=120)
+    expected = DetailStore.build(str(tmp_path / 'expected'), interactions, employees, pages, dates, days=120)
+    assert store.meta == expected.meta
+    for name, values in expected.columns.items():
+        assert (store.columns[name] == values).all()
+
+
+def test_queries_match_raw_recompute(dataset, tmp_path):
+    interactions, employees, pages, dates = dataset
+    store = DetailStore.build(str(tmp_path / 'store'), interactions, employees, pages, dates, days=60)
+    assert 0 < store.meta['rows'] < len(interactions)
+    rng = random.Random(3)
+    for _ in range(30):
+        query = random_query(rng, store, employees, pages)
+        assert store.query(**query) == recompute_query(interactions, employees, pages, dates, **query)
+
+
+def test_date_range_outside_the_window_is_empty(dataset, tmp_path):
+    interactions, employees, pages, dates = dataset
+    store = DetailStore.build(str(tmp_path / 'store'), interactions, employees, pages, dates, days=30)
+    assert store.row_range(end=store.first_day - 1) == (0, 0)
+    assert store.query(start=store.last_day + 1) == {'rows': 0, 'uv': 0, 'views': 0, 'visits': 0,
+                                                      'comments': 0, 'likes': 0}
@@ -0,0 +1,112 @@
+"""Every engine and visitor-set kind against the reference generate_complete_output"""
+
+import pytest
+
+import instrumentation
+from compact_records import RecordTable
+from generate_complete_sample import (GRAIN_MEASURES, OUTPUT_DIMENSIONS, column_measures, generate_complete_output,
+                                      output_columns, period_names)
+
+
+@pytest.mark.parametrize('options', [
+    {'engine': 'columnar'},
+    {'engine': 'parallel', 'workers': 1},
+    {'engine': 'parallel', 'workers': 2},
+    {'visitor_sets': 'bitmap'},
+    {'engine': 'parallel', 'workers': 2, 'visitor_sets': 'bitmap'},
+], ids=lambda options: '-'.join(str(value) for value in options.values()))
+def test_engine_matches_reference(dataset, reference, options):
+    assert generate_complete_output(*dataset, **options) == reference
+
+
+def test_compact_inputs_and_output(dataset, reference):
+    compact_inputs = [RecordTable.from_records(table) for table in dataset]
+    output = generate_complete_output(*compact_inputs, compact=True)
+    assert isinstance(output, RecordTable)
+    assert output.to_records() == reference
+
+
+def test_record_table_pickles_without_its_getters(dataset):
+    import pickle
+
+    employees = RecordTable.from_records(dataset[1])
+    copy = pickle.loads(pickle.dumps(employees))
+    assert copy.to_records() == dataset[1]
+    assert list(copy.iter_rows(['employeeregion', 'contactid'])) == [
+        (e['employeeregion'], e['contactid']) for e in dataset[1]]
+    # A single Record travels as a dict of its row, not with the whole table
+    record = pickle.dumps(employees[3])
+    assert len(record) < 1000
+    assert pickle.loads(record) == dataset[1][3]
+
+
+def test_columnar_engine_reads_numpy_chunks():
+    from generate_scale_data import chunk_to_records, concatenate_chunks, generate_dataset, iter_interaction_chunks_np
+
+    dates, employees, pages = generate_dataset(400, 6, 60, seed=5)
+    chunks = list(iter_interaction_chunks_np(5000, len(employees), len(pages), len(dates), chunk_size=2000, seed=5))
+    records = [record for chunk in chunks for record in chunk_to_records(chunk, employees, pages, dates)]
+    expected = generate_complete_output(records, employees, pages, dates)
+    rows = generate_complete_output(concatenate_chunks(chunks), employees, pages, dates, engine='columnar',
+                                    compact=True)
+    assert rows.to_records() == expected
+
+
+@pytest.mark.parametrize('engine', ['python', 'columnar', 'parallel'])
+def test_empty_input_keeps_the_column_schema(dataset, engine):
+    _, employees, pages, dates = dataset
+    rows = generate_complete_output([], employees, pages, dates, engine=engine, workers=1, compact=True)
+    assert len(rows) == 0
+    assert rows.columns == output_columns()
+
+
+def test_output_columns_in_select_order(reference):
+    assert list(reference[0]) == output_columns()
+
+
+def test_hll_estimates_uv_and_keeps_sums_exact(dataset, reference):
+    rows = generate_complete_output(*dataset, visitor_sets='hll')
+    assert len(rows) == len(reference)
+    measures = column_measures()
+    for row, expected in zip(rows, reference):
+        for column in OUTPUT_DIMENSIONS:
+            assert row[column] == expected[column]
+        for column, (_, measure) in measures.items():
+            if measure in GRAIN_MEASURES and measure != 'uv':
+                assert row[column] == expected[column]
+            else:
+                assert row[column] == pytest.approx(expected[column], rel=0.1, abs=2)
+
+
+def test_fold_by_level_matches_fold(dataset, reference, monkeypatch):
+    import generate_complete_sample
+    from generate_complete_sample import AggregationState, compute_page_mindates
+
+    # Small chunks, so the per-level breakdown runs several passes
+    monkeypatch.setattr(generate_complete_sample, 'PROFILE_CHUNK_ROWS', 1000)
+    interactions, employees, pages, dates = dataset
+    state = AggregationState(employees, pages, dates, compute_page_mindates(interactions))
+    state.fold_by_level(interactions)
+    assert state.output_rows() == reference
+
+
+@pytest.mark.parametrize('engine', ['python', 'columnar', 'parallel'])
+def test_custom_launch_windows(dataset, engine):
+    launch_windows = (60, 3)
+    rows = generate_complete_output(*dataset, engine=engine, workers=2, launch_windows=launch_windows)
+    assert list(rows[0]) == output_columns(launch_windows)
+    assert rows == generate_complete_output(*dataset, launch_windows=launch_windows)
+    assert period_names(launch_windows) == ['all', 'ty', 'd60', 'd3']
+
+
+@pytest.mark.parametrize('launch_windows', [(0,), (-3,), (7.5,), (28, True)])
+def test_invalid_launch_windows(dataset, launch_windows):
+    with pytest.raises(ValueError):
+        generate_complete_output(*dataset, launch_windows=launch_windows)
+
+
+@pytest.mark.parametrize('engine, visitor_sets', [('columnar', 'hll'), ('columnar', 'bitmap'), ('python', 'dense'),
+                                                  ('spark', 'set')])
+def test_unsupported_engine_options(dataset, engine, visitor_sets):
+    with pytest.raises(ValueError, match=engine):
+        generate_complete_output(*dataset, engine=engine, visitor_sets=visitor_sets)
@@ -0,0 +1,105 @@
+"""The workbook and Parquet sinks, and the Spark SQL rewriting"""
+
+import os
+
+import pytest
+
+from generate_complete_sample import INPUT_TABLES, excel_layout, generate_complete_output, output_columns
+from output_sinks import FACT_TABLE, ExcelSink, ParallelExcelSink, ParquetSink, arrow_table
+from sql_harness import rewrite_spark_functions, split_statements
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def _write(sink, dataset, reference):
+    interactions, employees, pages, dates = dataset
+    columns, uv_col_indices, collapse_groups = excel_layout()
+    sink.write_overview([['Title'], [''], ['Purpose', 'Tests'], ['  padded  ', 3]])
+    tables = {'dim_date': dates, 'employeecontact': employees, 'website_page_inventory': pages,
+              'interactions_metrics': interactions}
+    for table, table_columns in INPUT_TABLES.items():
+        sink.write_table(table, tables[table], table_columns)
+    sink.write_table(FACT_TABLE, reference, columns, uv_col_indices=uv_col_indices, collapse_groups=collapse_groups)
+    sink.close()
+
+
+def _sheet_values(path):
+    wb = openpyxl.load_workbook(path)
+    return {title: list(wb[title].values) for title in wb.sheetnames}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_workbook_matches_openpyxl(dataset, reference, tmp_path, workers):
+    _write(ExcelSink(str(tmp_path / 'openpyxl.xlsx')), dataset, reference)
+    _write(ParallelExcelSink(str(tmp_path / 'parallel.xlsx'), workers=workers), dataset, reference)
+    values = _sheet_values(tmp_path / 'openpyxl.xlsx')
+    assert _sheet_values(tmp_path / 'parallel.xlsx') == values
+    assert f'⭐ COMPLETE OUTPUT ({len(output_columns())} cols)' in values
+
+
+def test_parallel_workbook_splits_tables_over_the_row_limit(dataset, reference, tmp_path):
+    _write(ExcelSink(str(tmp_path / 'openpyxl.xlsx')), dataset, reference)
+    expected = _sheet_values(tmp_path / 'openpyxl.xlsx')
+    sink = ParallelExcelSink(str(tmp_path / 'split.xlsx'), workers=2)
+    sink.max_rows = 2001
+    _write(sink, dataset, reference)
+    values = _sheet_values(tmp_path / 'split.xlsx')
+
+    parts = [title for title in values if title.startswith('interactions_metrics')]
+    assert parts == [f'interactions_metrics ({part})' for part in range(1, 4)]
+    header = expected['interactions_metrics'][0]
+    rows = []
+    for title in parts:
+        assert values[title][0] == header
+        assert len(values[title]) <= sink.max_rows
+        rows += values[title][1:]
+    assert rows == expected['interactions_metrics'][1:]
+
+
+def test_parquet_sink_round_trip(dataset, reference, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    interactions, employees, pages, dates = dataset
+    sink = ParquetSink(str(tmp_path))
+    sink.write_overview([['ignored']])
+    sink.write_table('interactions_metrics', interactions, INPUT_TABLES['interactions_metrics'])
+    sink.write_table(FACT_TABLE, reference, output_columns())
+    sink.close()
+
+    table = pq.read_table(tmp_path / 'pbi_db_interactions_metrics.parquet')
+    assert str(table.schema.field('visit_date').type) == 'date32[day]'
+    assert str(table.schema.field('views').type) == 'int64'
+    assert table.column('interaction_id').to_pylist() == [i['interaction_id'] for i in interactions]
+
+    fact = pq.read_table(tmp_path / 'pbi_db_overview_fact_tbl')
+    assert sorted(os.listdir(tmp_path / 'pbi_db_overview_fact_tbl')) == \
+        sorted(f'websitename={site}' for site in {row['websitename'] for row in reference})
+    rows = sorted(fact.to_pylist(), key=lambda row: (row['websitename'], row['employeebusinessdivision'],
+                                                     row['employeeregion'], row['marketingPageId']))
+    assert [{column: row[column] for column in output_columns()} for row in rows] == reference
+
+
+@pytest.mark.parametrize('launch_windows', [(28, 21, 14, 7), (60, 3)])
+def test_arrow_table_types_and_empty_fact(dataset, launch_windows):
+    pa = pytest.importorskip('pyarrow')
+    rows = generate_complete_output(*dataset, launch_windows=launch_windows, compact=True)
+    table = arrow_table(FACT_TABLE, rows, None)
+    assert table.column_names == output_columns(launch_windows)
+    assert table.schema.field('websitename').type == pa.string()
+    assert table.schema.field('uniquevisitor').type == pa.int64()
+    assert table.to_pylist() == rows.to_records()
+
+    empty = arrow_table(FACT_TABLE, [], None, launch_windows)
+    assert empty.num_rows == 0 and empty.column_names == output_columns(launch_windows)
+
+
+def test_spark_calls_in_comments_and_literals_are_left_alone():
+    sql = "SELECT 1 -- note: DATEDIFF( is weird\nFROM t"
+    assert rewrite_spark_functions(sql) == sql
+    sql = "SELECT 'it''s date_sub(x', /* collect_set( */ datediff(a, (b)) FROM t"
+    assert rewrite_spark_functions(sql) == ("SELECT 'it''s date_sub(x', /* collect_set( */ "
+                                            "date_diff('day', CAST((b) AS DATE), CAST(a AS DATE)) FROM t")
+    assert rewrite_spark_functions('SELECT date_add(d, 1') == 'SELECT date_add(d, 1'
+
+
+def test_split_statements_ignores_semicolons_in_comments_and_literals():
+    assert split_statements("SELECT ';'; -- a; b\nSELECT 2;") == ["SELECT ';'", '-- a; b\nSELECT 2']
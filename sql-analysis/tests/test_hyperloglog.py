@@ -0,0 +1,77 @@
+"""HyperLogLog sketches, filtered UV estimates and the error report"""
+
+import pytest
+
+from generate_complete_sample import AggregationState, compute_page_mindates, generate_complete_output
+from hyperloglog import HyperLogLog, estimate_unique_visitors, hash64, uv_error_report
+
+
+def _sketch(values, precision=10):
+    sketch = HyperLogLog(precision)
+    for value in values:
+        sketch.add(hash64(value))
+    return sketch
+
+
+@pytest.mark.parametrize('size', [10, 200, 20_000])
+def test_estimate_within_four_standard_errors(size):
+    sketch = _sketch(range(size))
+    assert sketch.estimate() == pytest.approx(size, rel=4 * sketch.relative_error())
+
+
+@pytest.mark.parametrize('left, right', [((0, 5), (3, 9)), ((0, 5), (0, 5000)), ((0, 5000), (2000, 9000))])
+def test_merge_equals_sketch_of_the_union(left, right):
+    merged = _sketch(range(*left)) | _sketch(range(*right))
+    direct = _sketch(range(min(left[0], right[0]), max(left[1], right[1])))
+    assert merged.estimate() == pytest.approx(direct.estimate())
+    # The operands are left alone
+    assert _sketch(range(*left)).estimate() == pytest.approx((_sketch(range(*left)) | HyperLogLog(10)).estimate())
+
+
+def test_merge_needs_the_same_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10) | HyperLogLog(12)
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+
+
+def _state(dataset, visitor_sets):
+    interactions, employees, pages, dates = dataset
+    state = AggregationState(employees, pages, dates, compute_page_mindates(interactions), visitor_sets=visitor_sets)
+    state.fold(interactions)
+    return state
+
+
+@pytest.mark.parametrize('filters', [{}, {'sites': {'NewsPortal'}}, {'divisions': {'IT', 'HR'}, 'regions': {'EMEA'}},
+                                     {'sites': {'NoSuchSite'}}])
+def test_estimate_unique_visitors(dataset, filters):
+    interactions, employees, pages, _ = dataset
+    contacts = {e['contactid']: e for e in employees}
+    page_sites = {p['marketingPageId']: p['websitename'] for p in pages}
+
+    def matches(interaction):
+        contact = contacts[interaction['viewingcontactid']]
+        cell = {'sites': page_sites[interaction['marketingPageId']],
+                'divisions': contact['employeebusinessdivision'] or 'Unknown',
+                'regions': contact['employeeregion'] or 'Unknown'}
+        return all(cell[dimension] in values for dimension, values in filters.items())
+
+    expected = len({i['viewingcontactid'] for i in interactions if matches(i)})
+    assert estimate_unique_visitors(_state(dataset, 'set'), **filters) == expected
+    approx = estimate_unique_visitors(_state(dataset, 'hll'), **filters)
+    assert approx == pytest.approx(expected, rel=0.05, abs=2)
+
+
+def test_uv_error_report(dataset, reference):
+    report = uv_error_report(reference, reference)
+    assert set(report) == {column for column in reference[0] if 'uniquevisitor' in column}
+    assert all(stats == {'rows': len(reference), 'max_error': 0.0, 'mean_error': 0.0} for stats in report.values())
+
+    approx = generate_complete_output(*dataset, visitor_sets='hll')
+    report = uv_error_report(reference, approx)
+    assert 0 < report['uniquevisitor']['max_error'] < 0.1
+    assert report['uniquevisitor']['mean_error'] <= report['uniquevisitor']['max_error'] + 1e-12
+
+    rows = [{'uniquevisitor': 10}, {'uniquevisitor': 0}]
+    assert uv_error_report(rows, [{'uniquevisitor': 12}, {'uniquevisitor': 1}])['uniquevisitor'] == \
+        {'rows': 2, 'max_error': 1.0, 'mean_error': 0.6}
@@ -0,0 +1,62 @@
+"""Stage timings, counters and level sizes recorded while instrumentation is enabled"""
+
+import pytest
+
+import generate_complete_sample
+import instrumentation
+from generate_complete_sample import generate_complete_output
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.reset()
+    instrumentation.enable(trace_allocations=True)
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_disabled_records_nothing():
+    instrumentation.reset()
+    with instrumentation.stage('idle'):
+        instrumentation.count('rows', 5)
+    assert instrumentation.summary() == {'stages': {}, 'counters': {}, 'level_sizes': {}}
+
+
+def test_nested_stage_peak_reaches_the_enclosing_stage(enabled):
+    with instrumentation.stage('outer'):
+        with instrumentation.stage('inner'):
+            block = bytearray(4 * 2**20)
+            del block
+        instrumentation.count('rows', 2)
+        instrumentation.count('rows', 3)
+    stages = instrumentation.summary()['stages']
+    assert stages['inner']['calls'] == stages['outer']['calls'] == 1
+    assert stages['inner']['peak_bytes'] >= 4 * 2**20
+    assert stages['outer']['peak_bytes'] >= stages['inner']['peak_bytes']
+    assert stages['outer']['seconds'] >= stages['inner']['seconds']
+    assert instrumentation.summary()['counters'] == {'rows': 5}
+
+
+def test_profiled_run_times_the_production_fold(dataset, reference, enabled, monkeypatch):
+    calls = []
+    fold = generate_complete_sample.AggregationState.fold
+    monkeypatch.setattr(generate_complete_sample.AggregationState, 'fold',
+                        lambda state, interactions: calls.append(len(interactions)) or fold(state, interactions))
+    assert generate_complete_output(*dataset) == reference
+    assert calls == [len(dataset[0])]
+
+    recorded = instrumentation.summary()
+    assert {'mindate', 'fold', 'breakdown/periods', 'breakdown/grain/all', 'breakdown/overall/all',
+            'breakdown/site/d28'} <= set(recorded['stages'])
+    assert recorded['counters']['interactions'] == len(dataset[0])
+    assert recorded['level_sizes']['all/overall']['keys'] == 1
+    assert recorded['level_sizes']['all/grain']['keys'] == len(reference)
+
+
+def test_print_summary_labels_the_breakdown(dataset, enabled, capsys):
+    generate_complete_output(*dataset)
+    instrumentation.print_summary()
+    out = capsys.readouterr().out
+    assert 'separate per-level run' in out
+    assert 'Accumulation time (s) by level and period' in out
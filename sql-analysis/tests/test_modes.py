@@ -0,0 +1,94 @@
+"""Column selection, streaming and incremental refresh against the reference output"""
+
+import pytest
+
+from generate_complete_sample import OUTPUT_DIMENSIONS, generate_complete_output
+from incremental_refresh import apply_delta, build_state, load_state, save_state
+from interaction_stream import generate_complete_output_streaming, write_interactions_csv
+
+SELECTIONS = [
+    ['site_uniquevisitor7'],
+    ['uniquevisitor', 'div_reg_likes14', 'websitename', 'div_uniquevisitorty'],
+    ['site_div_reg_uniquevisitorTY', 'div_reg_viewty', 'div_reg_uniquevisitor28', 'reg_uniquevisitor21'],
+]
+
+
+def _project(rows, columns):
+    columns = OUTPUT_DIMENSIONS + [column for column in dict.fromkeys(columns) if column not in OUTPUT_DIMENSIONS]
+    return [{column: row[column] for column in columns} for row in rows]
+
+
+@pytest.mark.parametrize('columns', SELECTIONS, ids=lambda columns: columns[0])
+@pytest.mark.parametrize('options', [{}, {'engine': 'columnar'}, {'engine': 'parallel', 'workers': 2},
+                                     {'visitor_sets': 'bitmap'}],
+                         ids=lambda options: '-'.join(map(str, options.values())) or 'python')
+def test_column_selection(dataset, reference, columns, options):
+    assert generate_complete_output(*dataset, columns=columns, **options) == _project(reference, columns)
+
+
+def test_unknown_column(dataset):
+    with pytest.raises(ValueError, match='nope'):
+        generate_complete_output(*dataset, columns=['nope'])
+
+
+@pytest.mark.parametrize('visitor_sets', ['set', 'bitmap'])
+def test_streaming_matches_reference(dataset, reference, tmp_path, visitor_sets):
+    interactions, employees, pages, dates = dataset
+    path = str(tmp_path / 'interactions.csv')
+    write_interactions_csv(interactions, path)
+    rows = generate_complete_output_streaming(path, employees, pages, dates, chunk_size=700,
+                                              visitor_sets=visitor_sets)
+    assert rows == reference
+
+
+def _split_last_day(interactions):
+    last_day = max(interaction['visitdatekey'] for interaction in interactions)
+    return ([interaction for interaction in interactions if interaction['visitdatekey'] < last_day],
+            [interaction for interaction in interactions if interaction['visitdatekey'] == last_day])
+
+
+def test_incremental_refresh_matches_full_rebuild(dataset, tmp_path):
+    interactions, employees, pages, dates = dataset
+    history, delta = _split_last_day(interactions)
+    path = str(tmp_path / 'history.csv')
+    write_interactions_csv(history, path)
+
+    state = build_state(path, employees, pages, dates, chunk_size=1000)
+    changed = apply_delta(state, delta)
+
+    expected = generate_complete_output(history + delta, employees, pages, dates)
+    assert state.output_rows() == expected
+    expected_by_key = {tuple(row[column] for column in OUTPUT_DIMENSIONS): row for row in expected}
+    assert changed
+    for row in changed:
+        assert row == expected_by_key[tuple(row[column] for column in OUTPUT_DIMENSIONS)]
+
+
+@pytest.mark.parametrize('visitor_sets', ['set', 'bitmap'])
+def test_saved_state_resumes_refresh(dataset, tmp_path, visitor_sets):
+    interactions, employees, pages, dates = dataset
+    history, delta = _split_last_day(interactions)
+    path = str(tmp_path / 'history.csv')
+    write_interactions_csv(history, path)
+    state_path = str(tmp_path / 'uv_state.pkl')
+
+    save_state(build_state(path, employees, pages, dates, visitor_sets=visitor_sets, launch_windows=(30, 5)),
+               state_path)
+    state = load_state(state_path)
+    apply_delta(state, delta)
+    save_state(state, state_path)
+
+    assert not (tmp_path / 'uv_state.pkl.tmp').exists()
+    assert load_state(state_path).output_rows() == generate_complete_output(interactions, employees, pages, dates,
+                                                                             launch_windows=(30, 5))
+
+
+def test_delta_before_a_pages_first_interaction_is_refused(dataset, tmp_path):
+    interactions, employees, pages, dates = dataset
+    history, delta = _split_last_day(interactions)
+    path = str(tmp_path / 'late.csv')
+    write_interactions_csv(delta, path)
+    state = build_state(path, employees, pages, dates)
+    late = [interaction for interaction in history if interaction['marketingPageId'] in state.page_mindates][:1]
+    with pytest.raises(ValueError, match='rebuild the state'):
+        apply_delta(state, late)
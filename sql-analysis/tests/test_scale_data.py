@@ -0,0 +1,52 @@
+"""Seeded generation of production-size extracts"""
+
+import filecmp
+import os
+
+import numpy as np
+import pytest
+
+from generate_scale_data import (chunk_to_records, generate_dataset, iter_interaction_chunks_np,
+                                 write_interaction_files)
+
+
+def _write(directory, workers, seed=7, fmt='csv'):
+    dates, employees, pages = generate_dataset(300, 6, 40, num_days=60, seed=seed)
+    return write_interaction_files(str(directory), 2500, employees, pages, dates, chunk_size=1000, seed=seed,
+                                   workers=workers, fmt=fmt)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_files_do_not_depend_on_the_number_of_workers(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    serial = _write(tmp_path / 'serial', 1, fmt=fmt)
+    parallel = _write(tmp_path / 'parallel', 2, fmt=fmt)
+    assert [os.path.basename(path) for path in serial] == [os.path.basename(path) for path in parallel]
+    assert len(serial) == 3
+    for a, b in zip(serial, parallel):
+        assert filecmp.cmp(a, b, shallow=False)
+
+
+def test_seed_decides_the_data(tmp_path):
+    first = _write(tmp_path / 'first', 1)
+    again = _write(tmp_path / 'again', 1)
+    other = _write(tmp_path / 'other', 1, seed=8)
+    assert all(filecmp.cmp(a, b, shallow=False) for a, b in zip(first, again))
+    assert not filecmp.cmp(first[0], other[0], shallow=False)
+    assert generate_dataset(300, 6, 40, seed=7) == generate_dataset(300, 6, 40, seed=7)
+
+
+def test_chunks_keep_the_sample_shape():
+    dates, employees, pages = generate_dataset(300, 6, 40, num_days=60, seed=3)
+    chunks = list(iter_interaction_chunks_np(4000, len(employees), len(pages), len(dates), chunk_size=1500, seed=3))
+    assert [len(chunk['page']) for chunk in chunks] == [1500, 1500, 1000]
+    assert np.concatenate([chunk['interaction_index'] for chunk in chunks]).tolist() == list(range(4000))
+
+    records = [record for chunk in chunks for record in chunk_to_records(chunk, employees, pages, dates)]
+    assert {r['visitdatekey'] for r in records} <= {d['date_key'] for d in dates}
+    assert all(1 <= r['visits'] <= min(5, r['views']) <= 10 for r in records)
+    assert all(r['marketingPageIdliked'] in (None, r['marketingPageId']) for r in records)
+    # 20% of the pages get 60% of the traffic
+    counts = sorted(np.bincount(np.concatenate([chunk['page'] for chunk in chunks])).tolist(), reverse=True)
+    assert sum(counts[:len(pages) // 5]) > 0.5 * len(records)
@@ -0,0 +1,96 @@
+"""Sharding, heavy-hitter detection and the rollup cube"""
+
+from collections import Counter
+
+import pytest
+
+from generate_complete_sample import FOLD_COLUMNS, compute_page_mindates
+from heavy_hitters import find_heavy_hitters
+from parallel_aggregation import hot_keys, new_state, shard_by_website, shard_skew_aware
+from rollup_cube import RollupCube, random_query, recompute_unique_visitors
+
+
+PAGE = FOLD_COLUMNS.index('marketingPageId')
+
+
+def _rows(interactions):
+    return Counter(tuple(interaction[column] for column in FOLD_COLUMNS) for interaction in interactions)
+
+
+@pytest.mark.parametrize('shard', [shard_by_website, shard_skew_aware])
+def test_shards_merge_to_reference(dataset, reference, shard):
+    interactions, employees, pages, dates = dataset
+    shards = shard(interactions, pages, 8)
+    assert sum((Counter(shard) for shard in shards), Counter()) == _rows(interactions)
+
+    page_mindates = compute_page_mindates(interactions)
+    state = new_state(employees, pages, dates, {})
+    for rows in shards:
+        partial_state = new_state(employees, pages, dates, page_mindates)
+        partial_state.fold(rows)
+        state.merge(partial_state.partial())
+    assert state.output_rows() == reference
+
+
+def test_parallel_engine_with_compact_inputs(dataset, reference):
+    from compact_records import RecordTable
+    from generate_complete_sample import generate_complete_output
+
+    compact_inputs = [RecordTable.from_records(table) for table in dataset]
+    output = generate_complete_output(*compact_inputs, engine='parallel', workers=2, compact=True)
+    assert output.to_records() == reference
+
+
+def test_website_sharding_keeps_websites_whole(dataset):
+    interactions, _, pages, _ = dataset
+    page_website = {page['marketingPageId']: page['websitename'] for page in pages}
+    shards = shard_by_website(interactions, pages, 8)
+    sites = [{page_website[row[PAGE]] for row in shard} for shard in shards]
+    assert sum(len(shard_sites) for shard_sites in sites) == len(set().union(*sites))
+
+
+def test_skew_aware_sharding_splits_hot_pages(dataset):
+    interactions, _, pages, _ = dataset
+    # With 32 shards every popular page is over the limit of a shard
+    shards = shard_skew_aware(interactions, pages, 32)
+    largest_page = max(Counter(interaction['marketingPageId'] for interaction in interactions).values())
+    assert max(len(shard) for shard in shards) < largest_page
+
+
+def test_heavy_hitters_never_miss_a_hot_key():
+    keys = [f'page{i % 50}' for i in range(5000)] + ['hot'] * 700
+    exact = Counter(keys)
+    hitters = find_heavy_hitters(keys, 500, width=64, chunk_size=333)
+    assert 'hot' in hitters
+    assert all(hitters[key] >= exact[key] for key in hitters)
+    # Exact counts are filtered as they are, without the sketch's overcount
+    assert find_heavy_hitters(exact, 500, width=64) == {'hot': 700}
+
+
+def test_hot_keys_split_by_exact_counts():
+    page_counts = Counter({'p1': 1000, 'p2': 999, 'p3': 400, 'p4': 400})
+    page_website = {'p1': 'A', 'p2': 'B', 'p3': 'B', 'p4': 'C'}
+    page_splits, site_splits = hot_keys(page_counts, page_website, 500)
+    assert page_splits == {'p1': 2, 'p2': 2}
+    assert site_splits == {'A': 2, 'B': 3}
+
+
+@pytest.mark.parametrize('launch_windows', [(28, 21, 14, 7), (60, 3)])
+def test_rollup_cube_matches_recomputation(dataset, launch_windows):
+    import random
+
+    interactions, employees, pages, dates = dataset
+    cube = RollupCube.build(interactions, employees, pages, dates, launch_windows)
+    rng = random.Random(3)
+    for _ in range(20):
+        query = random_query(rng, employees, pages, cube.periods)
+        assert cube.unique_visitors(**query) == len(cube.visitors(**query)) == recompute_unique_visitors(
+            interactions, employees, pages, dates, launch_windows=launch_windows, **query)
+
+
+def test_rollup_cube_keeps_small_cells_sparse(dataset):
+    interactions, employees, pages, dates = dataset
+    cube = RollupCube.build(interactions, employees, pages, dates)
+    cells = cube.rollups['d7'][('site', 'div', 'reg')].values()
+    assert any(visitors._dense is None for visitors in cells)
+    assert cube.rollups['all'][()][()]._sparse is None
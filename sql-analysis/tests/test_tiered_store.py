@@ -0,0 +1,69 @@
+"""TieredStore against one contact-level DetailStore of the whole history"""
+
+import random
+import sys
+
+import pytest
+
+import tiered_store
+from compact_records import RecordTable
+from detail_store import DetailStore, to_ordinal
+from tiered_store import TieredStore, month_bounds, month_index, random_query
+
+
+@pytest.fixture(scope='module')
+def stores(dataset, tmp_path_factory):
+    interactions, employees, pages, dates = dataset
+    path = tmp_path_factory.mktemp('stores')
+    all_days = max(to_ordinal(d['date']) for d in dates) - min(to_ordinal(d['date']) for d in dates) + 1
+    tiered = TieredStore.build(str(path / 'tiered'), interactions, employees, pages, dates, recent_days=45)
+    full = DetailStore.build(str(path / 'full'), interactions, employees, pages, dates, days=all_days)
+    return tiered, full
+
+
+@pytest.mark.parametrize('kind', ['recent', 'history', 'spanning'])
+def test_queries_match_the_full_store(dataset, stores, kind):
+    _, employees, pages, _ = dataset
+    tiered, full = stores
+    rng = random.Random(5)
+    for _ in range(20):
+        query = random_query(rng, tiered, kind, employees, pages)
+        assert tiered.query(**query) == full.query(**query)
+
+
+def test_spanning_plan_uses_both_tiers(stores):
+    tiered, full = stores
+    # Part of the month before the last one: only the recent tier has those days
+    end = month_bounds(month_index(tiered.last_day) - 1)[0] + 9
+    assert end >= tiered.recent.first_day
+    segments = tiered.plan(end=end)
+    assert {tier for tier, _, _ in segments} == {'history', 'recent'}
+    assert segments[-1] == ('recent', end - 9, end)
+    assert tiered.query(end=end) == full.query(end=end)
+
+
+def test_build_from_a_record_table(dataset, stores, tmp_path):
+    interactions, employees, pages, dates = dataset
+    compact = TieredStore.build(str(tmp_path / 'compact'), RecordTable.from_records(interactions), employees, pages,
+                                dates, recent_days=45)
+    assert compact.history.meta == stores[0].history.meta
+    assert compact.query() == stores[0].query()
+
+
+def test_partial_month_before_the_recent_window_is_refused(stores):
+    tiered, _ = stores
+    first, _ = month_bounds(tiered.history.first_month + 1)
+    with pytest.raises(ValueError, match='only whole months are kept'):
+        tiered.plan(first + 3, month_bounds(month_index(first))[1])
+
+
+def test_query_cli_reports_partial_months_as_usage_errors(stores, monkeypatch, capsys):
+    tiered, _ = stores
+    first, last = month_bounds(tiered.history.first_month + 1)
+    monkeypatch.setattr(sys, 'argv', ['tiered_store.py', 'query', tiered.path,
+                                      '--start', str(tiered_store.date.fromordinal(first + 3)),
+                                      '--end', str(tiered_store.date.fromordinal(last))])
+    with pytest.raises(SystemExit) as exit_info:
+        tiered_store.main()
+    assert exit_info.value.code == 2
+    assert 'only whole months are kept' in capsys.readouterr().err
@@ -0,0 +1,91 @@
+"""Query normalisation, data fingerprints and the on-disk result cache of validation_runner"""
+
+import os
+
+import pytest
+
+pytest.importorskip('duckdb')
+
+from sql_harness import _strip_comments, load_tables  # noqa: E402
+from validation_runner import normalise_query, parquet_snapshot, run_validation  # noqa: E402
+
+SCRIPT = """
+-- Dates
+SELECT count(*) AS days FROM sharepoint_gold.pbi_db_dim_date;
+/* a literal that looks like a comment */
+SELECT '-- not a comment' AS text;
+SELECT * FROM sharepoint_gold.no_such_table;
+"""
+
+
+def test_normalise_query_ignores_comments_and_layout():
+    assert normalise_query('SELECT a, -- first\n  b\nFROM t /* x */') == 'SELECT a, b FROM t'
+    assert normalise_query('SELECT a,\n\tb FROM t') == normalise_query('SELECT a, b FROM t -- edited')
+
+
+def test_normalise_query_keeps_string_literals():
+    assert normalise_query("SELECT '--a' AS x") != normalise_query("SELECT '--b' AS x")
+    assert normalise_query("SELECT '/* a */' AS x") != normalise_query("SELECT '/* b */' AS x")
+    assert normalise_query("WHERE name = 'a  b'") != normalise_query("WHERE name = 'a b'")
+    assert _strip_comments("SELECT 'it''s -- kept' -- dropped") == "SELECT 'it''s -- kept'  "
+
+
+def test_parquet_snapshot_follows_file_stats(tmp_path):
+    (tmp_path / 'fact').mkdir()
+    table = tmp_path / 'fact' / 'part-0.parquet'
+    table.write_bytes(b'one')
+    (tmp_path / 'notes.txt').write_text('ignored')
+    snapshot = parquet_snapshot(str(tmp_path))
+    (tmp_path / 'notes.txt').write_text('still ignored')
+    assert parquet_snapshot(str(tmp_path)) == snapshot
+
+    os.utime(table, ns=(0, 10**9))
+    touched = parquet_snapshot(str(tmp_path))
+    assert touched != snapshot
+    table.write_bytes(b'longer')
+    os.utime(table, ns=(0, 10**9))
+    assert parquet_snapshot(str(tmp_path)) != touched
+
+
+def _validate(tmp_path, dataset, snapshot=None):
+    interactions, employees, pages, dates = dataset
+    script = tmp_path / 'checks.sql'
+    script.write_text(SCRIPT)
+    loads = []
+
+    def load(con):
+        loads.append(1)
+        load_tables(con, {'dim_date': dates, 'employeecontact': employees, 'website_page_inventory': pages,
+                          'interactions_metrics': interactions})
+
+    report = run_validation([str(script)], load, as_of='2024-12-30', cache_dir=str(tmp_path / 'cache'),
+                            workers=2, snapshot=snapshot)
+    return report, len(loads)
+
+
+def test_known_snapshot_skips_loading_when_every_query_is_cached(tmp_path, dataset):
+    first, loads = _validate(tmp_path, dataset, snapshot='files-v1')
+    assert loads == 1 and first['loaded']
+    assert [query.get('rows') for query in first['queries'][:2]] == [[(len(dataset[3]),)], [('-- not a comment',)]]
+    assert 'error' in first['queries'][2]
+
+    second, loads = _validate(tmp_path, dataset, snapshot='files-v1')
+    assert loads == 0 and not second['loaded']
+    assert all(query['cached'] for query in second['queries'])
+    assert [query.get('rows') for query in second['queries']] == [query.get('rows') for query in first['queries']]
+
+    _, loads = _validate(tmp_path, dataset, snapshot='files-v2')
+    assert loads == 1
+
+
+def test_loaded_tables_are_fingerprinted(tmp_path, dataset):
+    first, loads = _validate(tmp_path, dataset)
+    second, _ = _validate(tmp_path, dataset)
+    assert loads == 1
+    assert second['snapshot'] == first['snapshot']
+    assert all(query['cached'] for query in second['queries'])
+
+    interactions, employees, pages, dates = dataset
+    changed, _ = _validate(tmp_path, (interactions[:-1], employees, pages, dates))
+    assert changed['snapshot'] != first['snapshot']
+    assert not any(query['cached'] for query in changed['queries'])
@@ -0,0 +1,53 @@
+"""VisitorBitmap against Python sets of the same codes"""
+
+import pickle
+import random
+
+import pytest
+
+from visitor_sets import VisitorBitmap
+
+
+def _codes(size, universe, seed):
+    rng = random.Random(seed)
+    return [rng.randrange(universe) for _ in range(size)]
+
+
+@pytest.mark.parametrize('size, universe', [(0, 10), (5, 100_000), (300, 100_000), (3000, 4000)])
+def test_bitmap_behaves_like_a_set(size, universe):
+    codes = _codes(size, universe, size)
+    bitmap = VisitorBitmap(codes)
+    expected = set(codes)
+    assert len(bitmap) == len(expected)
+    assert list(bitmap) == sorted(expected)
+    assert all(code in bitmap for code in expected)
+    assert universe not in bitmap
+    assert pickle.loads(pickle.dumps(bitmap)) == bitmap
+
+
+def test_small_sets_stay_sparse_and_large_ones_pack():
+    sparse = VisitorBitmap(_codes(100, 1_000_000, 1))
+    dense = VisitorBitmap(range(0, 4000, 2))
+    assert sparse._dense is None and len(sparse._sparse) == len(sparse)
+    assert dense._sparse is None
+
+
+@pytest.mark.parametrize('left, right', [((50, 100_000), (70, 100_000)), ((50, 100_000), (3000, 4000)),
+                                         ((3000, 4000), (50, 100_000)), ((3000, 4000), (2000, 8000))])
+def test_union(left, right):
+    a, b = _codes(*left, 1), _codes(*right, 2)
+    union = VisitorBitmap(a)
+    union |= VisitorBitmap(b)
+    assert list(union) == sorted(set(a) | set(b))
+    assert len(union) == len(set(a) | set(b))
+    assert list(VisitorBitmap(a) | b) == sorted(set(a) | set(b))
+
+
+@pytest.mark.parametrize('shapes', [[], [(5, 100_000)], [(50, 100_000)] * 20, [(50, 100_000), (3000, 4000)] * 3])
+def test_union_all(shapes):
+    groups = [_codes(size, universe, seed) for seed, (size, universe) in enumerate(shapes)]
+    expected = set().union(*groups)
+    bitmaps = [VisitorBitmap(codes) for codes in groups]
+    union = VisitorBitmap.union_all(bitmaps)
+    assert list(union) == sorted(expected)
+    assert len(union) == VisitorBitmap.union_size(bitmaps) == len(expected)
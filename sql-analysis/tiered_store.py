@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Two-tier historical + recent store mirroring Overview_fact_table_UNIFIED.sql
+
+The UNIFIED table appends contact-level rows for the last 90 days to aggregated
+history. Its history rows carry no contact, so UV cannot be deduplicated across
+the boundary. Here the two tiers share the contact encoding instead:
+
+- history: per calendar month, the distinct (website, contact) pairs and the
+  metric sums per (website, division, region). This is far smaller than the
+  interaction rows and still answers exact UV for whole months.
+- recent: the contact-level DetailStore of the last `recent_days` days, for
+  any day range.
+
+A query is split into whole months and leftover days. Each whole month is read
+from whichever tier has fewer rows to scan for it (months inside the recent
+window exist in both). Leftover days must fall inside the recent window;
+before it, history is kept per whole month only. Visitors of all segments are
+unioned as one contact mask, so a contact seen on both sides of the boundary
+is counted once:
+
+    store = TieredStore.build('uv_store', interactions, employees, pages, dates, recent_days=90)
+    store.query('2024-01-01', '2024-12-15', sites=['NewsPortal'])
+
+Usage:
+    python tiered_store.py build uv_store --extract interactions/ --dims interactions/
+    python tiered_store.py query uv_store --start 2024-01-01 --end 2024-12-15 --divisions IT
+    python tiered_store.py benchmark --interactions 1000000 --months 13
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date
+
+import numpy as np
+
+from detail_store import DetailStore, as_chunks, name_codes, split_names, to_ordinal
+
+DEFAULT_RECENT_DAYS = 90
+FORMAT_VERSION = 1
+
+# The month of each pair and cell is implied by the month offset index, so it is not stored
+PAIR_COLUMNS = ['site', 'contact']
+CELL_COLUMNS = ['cell_site', 'cell_division', 'cell_region', 'rows', 'views', 'visits', 'comments', 'likes']
+METRICS = ['rows', 'views', 'visits', 'comments', 'likes']
+
+
+def month_index(ordinal):
+    """Months since year 0 of a date ordinal, so consecutive months are consecutive integers"""
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def month_bounds(index):
+    """(first, last) day ordinals of a month index"""
+    first = date(index // 12, index % 12 + 1, 1).toordinal()
+    following = index + 1
+    return first, date(following // 12, following % 12 + 1, 1).toordinal() - 1
+
+
+def month_name(index):
+    return f'{index // 12}-{index % 12 + 1:02d}'
+
+
+def _aggregate(keys, values):
+    """Sum the rows of values (a 2-D array, one row per key) per distinct key"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = np.zeros((len(unique), values.shape[1]), dtype=np.int64)
+    np.add.at(sums, inverse, values)
+    return unique, sums
+
+
+class HistoryTier:
+    """Per-month (website, contact) pairs and metric cells as memory-mapped column files"""
+
+    def __init__(self, path, meta, columns):
+        self.path = path
+        self.meta = meta
+        self.columns = columns
+        self.first_month = meta['first_month']
+        self.last_month = meta['last_month']
+        self.num_contacts = len(meta['contacts'])
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path} has history format {meta.get('version')}, expected {FORMAT_VERSION}")
+        names = PAIR_COLUMNS + CELL_COLUMNS + ['contact_division', 'contact_region', 'pair_offsets', 'cell_offsets']
+        columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
+        return cls(path, meta, columns)
+
+    def _month_rows(self, offsets, first_month, last_month):
+        first = max(first_month, self.first_month) - self.first_month
+        last = min(last_month, self.last_month) - self.first_month
+        if first > last:
+            return 0, 0
+        offsets = self.columns[offsets]
+        return int(offsets[first]), int(offsets[last + 1])
+
+    def pair_count(self, first_month, last_month):
+        lo, hi = self._month_rows('pair_offsets', first_month, last_month)
+        return hi - lo
+
+    def scan(self, first_month, last_month, sites=None, divisions=None, regions=None):
+        """(visitor mask over contact codes, metric sums) for a range of whole months"""
+        lo, hi = self._month_rows('pair_offsets', first_month, last_month)
+        site = self.columns['site'][lo:hi]
+        contact = self.columns['contact'][lo:hi]
+        mask = None
+        for names, values, dictionary in (
+                (sites, lambda: site, 'websites'),
+                (divisions, lambda: self.columns['contact_division'][contact], 'divisions'),
+                (regions, lambda: self.columns['contact_region'][contact], 'regions')):
+            if names is not None:
+                matches = np.isin(values(), name_codes(names, self.meta[dictionary]))
+                mask = matches if mask is None else mask & matches
+        seen = np.zeros(self.num_contacts, dtype=bool)
+        seen[contact if mask is None else contact[mask]] = True
+
+        lo, hi = self._month_rows('cell_offsets', first_month, last_month)
+        mask = np.ones(hi - lo, dtype=bool)
+        for names, column, dictionary in ((sites, 'cell_site', 'websites'), (divisions, 'cell_division', 'divisions'),
+                                          (regions, 'cell_region', 'regions')):
+            if names is not None:
+                mask &= np.isin(self.columns[column][lo:hi], name_codes(names, self.meta[dictionary]))
+        totals = {metric: int(self.columns[metric][lo:hi][mask].sum(dtype=np.int64)) for metric in METRICS}
+        return seen, totals
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+
+class TieredStore:
+    """Monthly history plus contact-level recent days, queried as one exact UV store"""
+
+    def __init__(self, path, history, recent):
+        self.path = path
+        self.history = history
+        self.recent = recent
+        self.last_day = recent.last_day
+        # Recent-tier contact codes translated to history codes, the shared visitor mask space
+        index = {contact: code for code, contact in enumerate(history.meta['contacts'])}
+        self._recent_codes = np.array([index[contact] for contact in recent.meta['contacts']], dtype=np.int64)
+
+    @classmethod
+    def build(cls, path, interactions, employees, pages, dates, recent_days=DEFAULT_RECENT_DAYS, as_of=None):
+        """Write both tiers from one pass over the interactions (one table of rows or an iterable of them)"""
+        date_ordinal = {d['date_key']: to_ordinal(d['date']) for d in dates}
+        last_day = to_ordinal(as_of) if as_of else max(date_ordinal.values())
+        date_month = {key: month_index(ordinal) for key, ordinal in date_ordinal.items()}
+
+        site_index = {}
+        page_site = {p['marketingPageId']: site_index.setdefault(p['websitename'], len(site_index)) for p in pages}
+        websites = list(site_index)
+        contacts = [e['contactid'] for e in employees]
+        contact_code = {contact: code for code, contact in enumerate(contacts)}
+        divisions = [e['employeebusinessdivision'] or 'Unknown' for e in employees]
+        regions = [e['employeeregion'] or 'Unknown' for e in employees]
+
+        # Partial sums per (month, site, contact) key, re-aggregated once all chunks are read
+        partial_keys, partial_sums = [], []
+
+        def history_chunks(chunks):
+            """Fold each chunk into the history partials and pass it on to the recent tier"""
+            for chunk in chunks:
+                keys, values = [], []
+                for interaction in chunk:
+                    if date_ordinal[interaction['visitdatekey']] > last_day:
+                        continue
+                    contact = interaction['viewingcontactid']
+                    code = contact_code.get(contact)
+                    if code is None:
+                        code = contact_code[contact] = len(contacts)
+                        contacts.append(contact)
+                        divisions.append('Unknown')
+                        regions.append('Unknown')
+                    month_site = date_month[interaction['visitdatekey']] * len(websites) + \
+                        page_site[interaction['marketingPageId']]
+                    keys.append((month_site << 31) | code)
+                    values.append((1, interaction['views'] or 0, interaction['visits'] or 0,
+                                   interaction['comments'] or 0, interaction['marketingPageIdliked'] is not None))
+                if keys:
+                    unique, sums = _aggregate(np.array(keys, dtype=np.int64), np.array(values, dtype=np.int64))
+                    partial_keys.append(unique)
+                    partial_sums.append(sums)
+                yield chunk
+
+        recent = DetailStore.build(os.path.join(path, 'recent'), history_chunks(as_chunks(interactions)), employees, pages,
+                                   dates, days=recent_days, as_of=as_of)
+
+        if partial_keys:
+            keys, sums = _aggregate(np.concatenate(partial_keys), np.concatenate(partial_sums))
+        else:
+            keys, sums = np.zeros(0, np.int64), np.zeros((0, len(METRICS)), np.int64)
+        month_site = keys >> 31
+        pair = {'month': (month_site // len(websites)).astype(np.int32),
+                'site': (month_site % len(websites)).astype(np.int32),
+                'contact': (keys & (2**31 - 1)).astype(np.int32)}
+
+        division_index, region_index = {}, {}
+        contact_division = np.array([division_index.setdefault(d, len(division_index)) for d in divisions], np.int32)
+        contact_region = np.array([region_index.setdefault(r, len(region_index)) for r in regions], np.int32)
+
+        # Cells: pairs rolled up to (month, site, division, region); the key order keeps them sorted by month
+        num_divisions, num_regions = max(len(division_index), 1), max(len(region_index), 1)
+        cell_keys = ((month_site * num_divisions + contact_division[pair['contact']]) * num_regions
+                     + contact_region[pair['contact']])
+        cell_keys, cell_sums = _aggregate(cell_keys, sums)
+        cell_region = cell_keys % num_regions
+        cell_division = cell_keys // num_regions % num_divisions
+        cell_month_site = cell_keys // num_regions // num_divisions
+        cells = {'cell_month': (cell_month_site // len(websites)).astype(np.int32),
+                 'cell_site': (cell_month_site % len(websites)).astype(np.int32),
+                 'cell_division': cell_division.astype(np.int32), 'cell_region': cell_region.astype(np.int32)}
+        for i, metric in enumerate(METRICS):
+            cells[metric] = cell_sums[:, i].astype(np.int32) if len(cell_sums) else np.zeros(0, np.int32)
+
+        first_month = int(pair['month'][0]) if len(keys) else month_index(last_day)
+        last_month = month_index(last_day)
+        month_range = np.arange(first_month, last_month + 2)
+        offsets = {'pair_offsets': np.searchsorted(pair['month'], month_range).astype(np.int64),
+                   'cell_offsets': np.searchsorted(cells['cell_month'], month_range).astype(np.int64)}
+
+        history_path = os.path.join(path, 'history')
+        os.makedirs(history_path, exist_ok=True)
+        lookups = {'contact_division': contact_division, 'contact_region': contact_region}
+        stored = [(name, pair[name]) for name in PAIR_COLUMNS] + [(name, cells[name]) for name in CELL_COLUMNS]
+        for name, values in stored + list(lookups.items()) + list(offsets.items()):
+            np.save(os.path.join(history_path, f'{name}.npy'), values)
+        meta = {
+            'version': FORMAT_VERSION,
+            'first_month': first_month,
+            'last_month': last_month,
+            'months': [month_name(index) for index in range(first_month, last_month + 1)],
+            'pairs': int(len(keys)),
+            'cells': int(len(cell_keys)),
+            'websites': websites,
+            'contacts': contacts,
+            'divisions': list(division_index),
+            'regions': list(region_index),
+        }
+        with open(os.path.join(history_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(path, HistoryTier.open(history_path), recent)
+
+    @classmethod
+    def open(cls, path):
+        return cls(path, HistoryTier.open(os.path.join(path, 'history')),
+                   DetailStore.open(os.path.join(path, 'recent')))
+
+    def plan(self, start=None, end=None):
+        """Segments ('history', first_month, last_month) / ('recent', first_day, last_day) covering start..end"""
+        first_stored = month_bounds(self.history.first_month)[0]
+        first = first_stored if start is None else max(to_ordinal(start), first_stored)
+        last = self.last_day if end is None else min(to_ordinal(end), self.last_day)
+
+        segments = []
+        day = first
+        while day <= last:
+            month = month_index(day)
+            month_first, month_last = month_bounds(month)
+            segment_last = min(month_last, last)
+            whole_month = day == month_first and segment_last == min(month_last, self.last_day)
+
+            if whole_month and day >= self.recent.first_day:
+                lo, hi = self.recent.row_range(day, segment_last)
+                tier = 'history' if self.history.pair_count(month, month) <= hi - lo else 'recent'
+            elif whole_month:
+                tier = 'history'
+            elif day >= self.recent.first_day:
+                tier = 'recent'
+            else:
+                raise ValueError(
+                    f"{date.fromordinal(day)} to {date.fromordinal(segment_last)} is only part of "
+                    f"{month_name(month)}; before {self.recent.meta['first_date']} only whole months are kept")
+
+            if tier == 'history':
+                segment = ('history', month, month)
+            else:
+                segment = ('recent', day, segment_last)
+            if segments and segments[-1][0] == tier and segments[-1][2] + 1 == segment[1]:
+                segments[-1] = (tier, segments[-1][1], segment[2])
+            else:
+                segments.append(segment)
+            day = segment_last + 1
+        return segments
+
+    def scan(self, start=None, end=None, sites=None, divisions=None, regions=None):
+        """(visitor mask over history contact codes, metric sums) across both tiers"""
+        seen = np.zeros(self.history.num_contacts, dtype=bool)
+        totals = dict.fromkeys(METRICS, 0)
+        for tier, first, last in self.plan(start, end):
+            if tier == 'history':
+                visitors, sums = self.history.scan(first, last, sites, divisions, regions)
+                seen |= visitors
+            else:
+                visitors, sums = self.recent.scan(first, last, sites, divisions, regions)
+                seen[self._recent_codes[visitors]] = True
+            for metric in METRICS:
+                totals[metric] += sums[metric]
+        return seen, totals
+
+    def query(self, start=None, end=None, sites=None, divisions=None, regions=None):
+        """Rows, UV and metric sums; contacts on both sides of the tier boundary are counted once"""
+        seen, totals = self.scan(start, end, sites, divisions, regions)
+        return {'rows': totals['rows'], 'uv': int(np.count_nonzero(seen)), 'views': totals['views'],
+                'visits': totals['visits'], 'comments': totals['comments'], 'likes': totals['likes']}
+
+    def unique_visitors(self, start=None, end=None, sites=None, divisions=None, regions=None):
+        return int(np.count_nonzero(self.scan(start, end, sites, divisions, regions)[0]))
+
+    def size_bytes(self):
+        return {'history': self.history.size_bytes(), 'recent': self.recent.size_bytes()}
+
+
+def random_query(rng, store, kind, employees, pages):
+    """A query of one kind: 'recent' days, whole 'history' months, or 'spanning' the tier boundary"""
+    from generate_complete_sample import random_filter
+
+    recent_first, last_day = store.recent.first_day, store.last_day
+    months = list(range(store.history.first_month, store.history.last_month + 1))
+    if kind == 'recent':
+        first = rng.randint(recent_first, last_day)
+        last = rng.randint(first, last_day)
+    elif kind == 'history':
+        older = [m for m in months if month_bounds(m)[1] < recent_first] or months
+        first_month = rng.choice(older)
+        first = month_bounds(first_month)[0]
+        last = month_bounds(rng.choice([m for m in older if m >= first_month]))[1]
+    else:
+        # Days before the recent window are only kept per whole month, so the range has to cover the boundary month
+        boundary_first, boundary_last = month_bounds(month_index(recent_first))
+        first = month_bounds(rng.choice([m for m in months if month_bounds(m)[0] < recent_first]))[0]
+        last = rng.randint(recent_first if boundary_first == recent_first else boundary_last, last_day)
+    return {'start': date.fromordinal(first).isoformat(), 'end': date.fromordinal(min(last, last_day)).isoformat(),
+            **random_filter(rng, employees, pages)}
+
+
+def benchmark_tiers(path, interactions, employees, pages, dates, recent_days=DEFAULT_RECENT_DAYS, num_queries=100,
+                    seed=0):
+    """Storage and query latency of the tiered store against one contact-level store of the whole history"""
+    all_days = max(to_ordinal(d['date']) for d in dates) - min(to_ordinal(d['date']) for d in dates) + 1
+
+    start = time.perf_counter()
+    tiered = TieredStore.build(os.path.join(path, 'tiered'), interactions, employees, pages, dates,
+                               recent_days=recent_days)
+    tiered_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    full = DetailStore.build(os.path.join(path, 'full'), interactions, employees, pages, dates, days=all_days)
+    full_build = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    result = {
+        'rows': full.meta['rows'],
+        'months': len(tiered.history.meta['months']),
+        'history_pairs': tiered.history.meta['pairs'],
+        'history_cells': tiered.history.meta['cells'],
+        'recent_rows': tiered.recent.meta['rows'],
+        'size_mb': {tier: size / 2**20 for tier, size in tiered.size_bytes().items()},
+        'full_size_mb': full.size_bytes() / 2**20,
+        'build_s': {'tiered': tiered_build, 'full': full_build},
+        'queries': {},
+    }
+    for kind in ('recent', 'history', 'spanning'):
+        queries = [random_query(rng, tiered, kind, employees, pages) for _ in range(num_queries)]
+
+        start = time.perf_counter()
+        tiered_answers = [tiered.query(**q) for q in queries]
+        tiered_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full_answers = [full.query(**q) for q in queries]
+        full_seconds = time.perf_counter() - start
+
+        if tiered_answers != full_answers:
+            raise AssertionError(f"Tiered answers for {kind} queries differ from the full contact-level store")
+        result['queries'][kind] = {'tiered_ms': tiered_seconds * 1000 / num_queries,
+                                   'full_ms': full_seconds * 1000 / num_queries}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Two-tier historical + recent UV store')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='write both tiers from an interactions extract')
+    build.add_argument('store')
+    build.add_argument('--extract', required=True, help='interactions extract (.csv or .parquet, or a directory of them)')
+    build.add_argument('--dims', required=True, help='workbook or directory with the dimension tables')
+    build.add_argument('--recent-days', type=int, default=DEFAULT_RECENT_DAYS)
+    build.add_argument('--as-of', help='last day of the store (default: last date in dim_date)')
+
+    query = commands.add_parser('query', help='UV and metrics for a date range and filter')
+    query.add_argument('store')
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--sites', help='comma-separated website names')
+    query.add_argument('--divisions')
+    query.add_argument('--regions')
+
+    bench = commands.add_parser('benchmark', help='storage and latency against a full contact-level store')
+    bench.add_argument('--employees', type=int, default=20_000)
+    bench.add_argument('--sites', type=int, default=200)
+    bench.add_argument('--pages', type=int, default=5_000)
+    bench.add_argument('--interactions', type=int, default=1_000_000)
+    bench.add_argument('--months', type=int, default=13)
+    bench.add_argument('--recent-days', type=int, default=DEFAULT_RECENT_DAYS)
+    bench.add_argument('--queries', type=int, default=100, help='queries per kind')
+    bench.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from interaction_stream import iter_interaction_chunks, load_dimensions
+
+        dates, employees, pages = load_dimensions(args.dims)
+        store = TieredStore.build(args.store, iter_interaction_chunks(args.extract), employees, pages, dates,
+                                  recent_days=args.recent_days, as_of=args.as_of)
+        sizes = store.size_bytes()
+        print(f"Wrote {args.store}: history {store.history.meta['months'][0]} to {store.history.meta['months'][-1]} "
+              f"({store.history.meta['pairs']:,} pairs, {sizes['history'] / 2**20:.1f} MB), "
+              f"recent {store.recent.meta['first_date']} to {store.recent.meta['last_date']} "
+              f"({store.recent.meta['rows']:,} rows, {sizes['recent'] / 2**20:.1f} MB)")
+
+    elif args.command == 'query':
+        store = TieredStore.open(args.store)
+        filters = {'sites': split_names(args.sites), 'divisions': split_names(args.divisions),
+                   'regions': split_names(args.regions)}
+        try:
+            segments = store.plan(args.start, args.end)
+        except ValueError as exc:
+            parser.error(str(exc))
+        for tier, first, last in segments:
+            if tier == 'history':
+                print(f"   history {month_name(first)} to {month_name(last)}")
+            else:
+                print(f"   recent  {date.fromordinal(first)} to {date.fromordinal(last)}")
+        for name, value in store.query(args.start, args.end, **filters).items():
+            print(f"{name:<10} {value:>12,}")
+
+    else:
+        import tempfile
+
+        from generate_scale_data import chunk_to_records, generate_dataset, iter_interaction_chunks_np
+
+        # generate_dim_date starts on 2024-01-01
+        num_days = month_bounds(2024 * 12 + args.months)[0] - date(2024, 1, 1).toordinal()
+        dates, employees, pages = generate_dataset(args.employees, args.sites, args.pages, num_days, seed=args.seed)
+        interactions = []
+        for chunk in iter_interaction_chunks_np(args.interactions, len(employees), len(pages), num_days,
+                                                seed=args.seed):
+            interactions.extend(chunk_to_records(chunk, employees, pages, dates))
+
+        with tempfile.TemporaryDirectory(prefix='tiered_store_') as path:
+            result = benchmark_tiers(path, interactions, employees, pages, dates, recent_days=args.recent_days,
+                                     num_queries=args.queries, seed=args.seed)
+        sizes = result['size_mb']
+        print(f"{result['rows']:,} interactions over {result['months']} months, last {args.recent_days} days contact-level")
+        print(f"   History tier: {result['history_pairs']:,} (month, site, contact) pairs, "
+              f"{result['history_cells']:,} metric cells, {sizes['history']:.1f} MB")
+        print(f"   Recent tier: {result['recent_rows']:,} rows, {sizes['recent']:.1f} MB")
+        print(f"   Tiered total: {sizes['history'] + sizes['recent']:.1f} MB, built in {result['build_s']['tiered']:.1f}s; "
+              f"full contact-level store: {result['full_size_mb']:.1f} MB, built in {result['build_s']['full']:.1f}s")
+        print(f"\n{'Queries':<10} {'Tiered (ms)':>12} {'Full (ms)':>10}")
+        for kind, timing in result['queries'].items():
+            print(f"{kind:<10} {timing['tiered_ms']:>12.2f} {timing['full_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Run the Validation/ diagnostic queries concurrently on DuckDB, with cached results
+
+Every script in Validation/ is split into its individual queries (the same
+adaptation and splitting as sql_harness.py), and the queries run side by side
+on cursors of one in-process DuckDB database, loaded either with generated
+data or with a Parquet extract written by `generate_complete_sample.py
+--parquet`. Results are cached on disk under a key made of the normalised
+query text and a fingerprint of the data, so re-running an unchanged query
+against unchanged data returns the stored result without touching the tables.
+Generated data is fingerprinted by hashing the loaded tables; a Parquet extract
+by its files' paths, sizes and modification times, so when every query is
+cached the extract is not loaded at all. Editing a query's comments does not
+invalidate it; changing the data, --as-of or --current-year does.
+
+Queries written for production-only tables or placeholder values (such as
+sharepoint_bronze.pages) are reported (and cached) as failed or empty rather
+than stopping the run.
+
+Usage:
+    python validation_runner.py --employees 2000 --pages 300 --interactions 50000
+    python validation_runner.py --parquet out/ ../Validation/grain_analysis.sql --show 5
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from output_sinks import FACT_TABLE, PARQUET_TABLE_NAMES
+from sql_harness import (CURRENT_YEAR, SCHEMA, _split_literals, _strip_comments, adapt_spark_sql,
+                         add_production_columns, connect, create_referrer_table, load_tables, split_statements)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_VALIDATION_DIR = os.path.join(os.path.dirname(HERE), 'Validation')
+DEFAULT_CACHE_DIR = os.path.join(HERE, '.validation_cache')
+
+
+def query_title(statement):
+    """The heading of a statement: the first comment under a '-- ====' rule, else its first comment or SQL line"""
+    comments = [line.strip().lstrip('-').strip() for line in statement.splitlines() if line.strip().startswith('--')]
+    for previous, text in zip([''] + comments, comments):
+        if previous and not previous.strip('=') and text.strip('=-'):
+            return text
+    for text in comments:
+        if text.strip('=-'):
+            return text
+    return _strip_comments(statement).strip().splitlines()[0]
+
+
+def normalise_query(statement):
+    """Query text without comments and with whitespace collapsed outside string literals, as hashed for the cache"""
+    parts, code = [], ''
+    for text, kind in _split_literals(statement):
+        if kind == 'literal':
+            parts += [re.sub(r'\s+', ' ', code), text]
+            code = ''
+        else:
+            code += ' ' if kind == 'comment' else text
+    parts.append(re.sub(r'\s+', ' ', code))
+    return ''.join(parts).strip()
+
+
+def parse_queries(path, as_of, current_year=CURRENT_YEAR):
+    """The adapted queries of one script: dicts with script, index, title and sql"""
+    with open(path) as f:
+        statements = split_statements(adapt_spark_sql(f.read(), as_of, current_year))
+    script = os.path.basename(path)
+    return [{'script': script, 'index': index, 'title': query_title(statement), 'sql': statement}
+            for index, statement in enumerate(statements, 1)]
+
+
+def load_parquet_tables(con, directory):
+    """Create the sharepoint_gold tables from a ParquetSink directory (see output_sinks.py)"""
+    con.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+    for name, table in PARQUET_TABLE_NAMES.items():
+        path = os.path.join(directory, table)
+        if name == FACT_TABLE:
+            if not os.path.isdir(path):
+                continue
+            source = f"read_parquet('{path}/**/*.parquet', hive_partitioning = true)"
+        elif os.path.exists(path + '.parquet'):
+            source = f"read_parquet('{path}.parquet')"
+        else:
+            raise FileNotFoundError(f"{path}.parquet not found; write it with generate_complete_sample.py --parquet")
+        target = f'{SCHEMA}.{table}'
+        con.execute(f'CREATE OR REPLACE TABLE {target} AS SELECT * FROM {source}')
+        add_production_columns(con, name, target)
+    create_referrer_table(con)
+
+
+def data_snapshot(con, schema=SCHEMA):
+    """Fingerprint of every table in the schema: columns, types, row count and a hash of all rows"""
+    tables = con.execute('SELECT table_name FROM information_schema.tables WHERE table_schema = ? '
+                         'ORDER BY table_name', [schema]).fetchall()
+    digest = hashlib.sha256()
+    for (table,) in tables:
+        columns = con.execute('SELECT column_name, data_type FROM information_schema.columns '
+                              'WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position',
+                              [schema, table]).fetchall()
+        # Row hashes are summed, so the fingerprint does not depend on the scan order
+        rows, row_hash = con.execute(f'SELECT count(*), sum(hash(t)) FROM {schema}.{table} AS t').fetchone()
+        digest.update(repr((table, columns, rows, str(row_hash))).encode())
+    return digest.hexdigest()
+
+
+def parquet_snapshot(directory):
+    """Fingerprint of a ParquetSink directory from its files' paths, sizes and modification times"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.parquet'):
+                stat = os.stat(os.path.join(root, name))
+                path = os.path.relpath(os.path.join(root, name), directory)
+                digest.update(repr((path, stat.st_size, stat.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+
+def parquet_as_of(directory):
+    """Last dim_date day of a ParquetSink directory, read from that one file"""
+    path = os.path.join(directory, PARQUET_TABLE_NAMES['dim_date'] + '.parquet')
+    con = connect()
+    try:
+        return str(con.execute(f"SELECT max(date) FROM read_parquet('{path}')").fetchone()[0])
+    finally:
+        con.close()
+
+
+class ResultCache:
+    """Query results pickled under cache_dir, one file per (query text, data snapshot) key"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(sql, snapshot):
+        return hashlib.sha256(f'{snapshot}\n{normalise_query(sql)}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, key, result):
+        # Written under a temporary name and renamed, so concurrent runs never read a partial file
+        fd, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(temporary, self._path(key))
+
+
+def _execute(con, sql):
+    """Run one query on its own cursor; returns columns, rows and seconds"""
+    cursor = con.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.execute(sql)
+        rows = cursor.fetchall() if cursor.description else []
+        columns = [column[0] for column in cursor.description or []]
+        return {'columns': columns, 'rows': rows, 'seconds': time.perf_counter() - start}
+    finally:
+        cursor.close()
+
+
+def run_queries(con, queries, snapshot, cache=None, workers=None, prepare=None):
+    """Run the queries concurrently, answering unchanged ones from the cache; results in query order
+
+    prepare(), if given, is called once before the first query that is not cached runs.
+    """
+    results = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        key = ResultCache.key(query['sql'], snapshot)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[i] = dict(query, **cached, cached=True)
+        else:
+            pending.append((i, key))
+    if pending and prepare is not None:
+        prepare()
+
+    def run(item):
+        i, key = item
+        try:
+            result = _execute(con, queries[i]['sql'])
+        except Exception as exc:
+            # Cached too: the same query fails the same way on the same data
+            result = {'error': str(exc).splitlines()[0]}
+        if cache is not None:
+            cache.put(key, result)
+        return i, dict(queries[i], **result, cached=False)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for i, result in pool.map(run, pending):
+            results[i] = result
+    return results
+
+
+def run_validation(scripts, load, as_of=None, current_year=CURRENT_YEAR, cache_dir=DEFAULT_CACHE_DIR, workers=None,
+                   database=':memory:', snapshot=None):
+    """Load the data with load(con), then run every query of the scripts; returns a JSON-friendly report
+
+    snapshot is the data fingerprint when it is known without loading (see
+    parquet_snapshot); with it and as_of given, load(con) only runs once a
+    query misses the cache. Otherwise the loaded tables are fingerprinted
+    with data_snapshot.
+    """
+    con = connect(database)
+    timings = {'loaded': False, 'load_seconds': 0.0, 'snapshot_seconds': 0.0}
+
+    def prepare():
+        start = time.perf_counter()
+        load(con)
+        timings.update(loaded=True, load_seconds=time.perf_counter() - start)
+
+    if snapshot is None or as_of is None:
+        prepare()
+        as_of = as_of or str(con.execute(f'SELECT max(date) FROM {SCHEMA}.pbi_db_dim_date').fetchone()[0])
+    if snapshot is None:
+        start = time.perf_counter()
+        snapshot = data_snapshot(con)
+        timings['snapshot_seconds'] = time.perf_counter() - start
+
+    queries = [query for path in scripts for query in parse_queries(path, as_of, current_year)]
+    start = time.perf_counter()
+    results = run_queries(con, queries, snapshot, ResultCache(cache_dir) if cache_dir else None, workers,
+                          prepare=None if timings['loaded'] else prepare)
+    con.close()
+    return {
+        'as_of': as_of,
+        'current_year': current_year,
+        'snapshot': snapshot,
+        **timings,
+        'run_seconds': time.perf_counter() - start,
+        'queries': results,
+    }
+
+
+def print_report(report, show=0):
+    loaded = f"Loaded tables in {report['load_seconds']:.2f}s" if report['loaded'] else 'Tables not loaded'
+    print(f"{loaded}, fingerprinted in {report['snapshot_seconds']:.2f}s "
+          f"(snapshot {report['snapshot'][:12]}, as of {report['as_of']})")
+    print(f"\n{'Script':<40} {'#':>3} {'Query':<48} {'Rows':>8} {'Time (s)':>9}")
+    for result in report['queries']:
+        title = result['title'][:48]
+        if 'error' in result:
+            print(f"{result['script']:<40} {result['index']:>3} {title:<48} FAILED: {result['error'][:80]}")
+            continue
+        timing = 'cached' if result['cached'] else f"{result['seconds']:.3f}"
+        print(f"{result['script']:<40} {result['index']:>3} {title:<48} {len(result['rows']):>8,} {timing:>9}")
+        if show and result['rows']:
+            print(f"      {' | '.join(result['columns'])}")
+            for row in result['rows'][:show]:
+                print(f"      {' | '.join(str(value) for value in row)}")
+
+    failed = sum(1 for result in report['queries'] if 'error' in result)
+    cached = sum(1 for result in report['queries'] if result.get('cached'))
+    print(f"\n{len(report['queries'])} queries in {report['run_seconds']:.2f}s: {cached} from the cache, "
+          f"{failed} failed")
+
+
+def main():
+    from generate_complete_sample import generate_sample_data
+
+    parser = argparse.ArgumentParser(description='Run the Validation/ queries concurrently on DuckDB')
+    parser.add_argument('scripts', nargs='*', help='SQL scripts to run (default: every script in Validation/)')
+    parser.add_argument('--parquet', help='load the tables from this generate_complete_sample.py --parquet directory')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--interactions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', help='date used for CURRENT_DATE() (default: last dim_date day)')
+    parser.add_argument('--current-year', type=int, default=CURRENT_YEAR, help='year used for YEAR(NOW())')
+    parser.add_argument('--workers', type=int, default=None, help='queries run at once (default: all cores)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'result cache (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='run every query, without reading or writing the cache')
+    parser.add_argument('--show', type=int, default=0, metavar='N', help='print the first N rows of every result')
+    parser.add_argument('--json', help='write the report, with all result rows, to this JSON file')
+    args = parser.parse_args()
+
+    scripts = args.scripts or sorted(glob.glob(os.path.join(DEFAULT_VALIDATION_DIR, '*.sql')))
+
+    snapshot, as_of = None, args.as_of
+    if args.parquet:
+        snapshot = parquet_snapshot(args.parquet)
+        as_of = as_of or parquet_as_of(args.parquet)
+
+        def load(con):
+            load_parquet_tables(con, args.parquet)
+    else:
+        interactions, employees, pages, dates = generate_sample_data(args.employees, args.pages, args.interactions,
+                                                                     seed=args.seed)
+        tables = {'dim_date': dates, 'employeecontact': employees, 'website_page_inventory': pages,
+                  'interactions_metrics': interactions}
+
+        def load(con):
+            load_tables(con, tables)
+
+    report = run_validation(scripts, load, as_of=as_of, current_year=args.current_year,
+                            cache_dir=None if args.no_cache else args.cache_dir, workers=args.workers,
+                            snapshot=snapshot)
+    print_report(report, show=args.show)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n   Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
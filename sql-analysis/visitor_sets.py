@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Compact unique-visitor sets for the UV aggregation levels
+
+Contacts are dense-encoded to small integers once (ContactEncoder) and stored
+in VisitorBitmap, which keeps small sets as sorted arrays of 4-byte codes and
+switches to a packed bit array once that is the smaller representation. Large
+rollups such as `overall`, `div` or `site` then cost one bit per contact, and
+the many small grain and site_div_reg sets 4 bytes per member, instead of a
+hash table entry and an int object per member.
+"""
+
+from array import array
+from bisect import bisect_left
+
+# A sparse member costs 4 bytes in a sorted array('I'); a set is packed into a
+# bit array once the bit array would be no bigger than the sorted array.
+SPARSE_ENTRY_BYTES = 4
+MIN_DENSE_MEMBERS = 64
+
+
+class ContactEncoder:
+    """Dense integer encoding of contact ids, assigned on first sight"""
+
+    def __init__(self):
+        self.codes = {}
+        self.contacts = []
+
+    def encode(self, contact_id):
+        code = self.codes.get(contact_id)
+        if code is None:
+            code = self.codes[contact_id] = len(self.contacts)
+            self.contacts.append(contact_id)
+        return code
+
+    def decode(self, code):
+        return self.contacts[code]
+
+    def __len__(self):
+        return len(self.contacts)
+
+
+def _pack(codes, dense=None):
+    """Set the bit of every code in a little-endian bit array, growing it as needed"""
+    if dense is None:
+        dense = bytearray()
+    if codes:
+        size = (max(codes) >> 3) + 1
+        if size > len(dense):
+            dense.extend(bytes(size - len(dense)))
+    for code in codes:
+        dense[code >> 3] |= 1 << (code & 7)
+    return dense
+
+
+def _union_parts(bitmaps):
+    """(set of the sparse members, int bitset of the dense members) over several VisitorBitmaps"""
+    codes = set()
+    bits = 0
+    for bitmap in bitmaps:
+        if bitmap._dense is None:
+            codes.update(bitmap._sparse)
+        else:
+            bits |= int.from_bytes(bitmap._dense, 'little')
+    return codes, bits
+
+
+class VisitorBitmap:
+    """Set of encoded contact ids with fast union and O(1) cardinality"""
+
+    __slots__ = ('_sparse', '_dense', '_count')
+
+    def __init__(self, codes=()):
+        # Most grain sets stay empty or tiny; the array is created on the first add
+        self._sparse = ()
+        self._dense = None
+        self._count = 0
+        for code in codes:
+            self.add(code)
+
+    def add(self, code):
+        if self._dense is None:
+            sparse = self._sparse
+            i = bisect_left(sparse, code)
+            if i < self._count and sparse[i] == code:
+                return
+            if self._count:
+                sparse.insert(i, code)
+            else:
+                self._sparse = array('I', (code,))
+            self._count += 1
+            n = self._count
+            # Re-check the representation whenever the set doubles in size
+            if n >= MIN_DENSE_MEMBERS and n & (n - 1) == 0:
+                self._maybe_pack()
+            return
+
+        dense = self._dense
+        index = code >> 3
+        if index >= len(dense):
+            dense.extend(bytes(index - len(dense) + 1))
+        mask = 1 << (code & 7)
+        byte = dense[index]
+        if not byte & mask:
+            dense[index] = byte | mask
+            self._count += 1
+
+    def _maybe_pack(self):
+        sparse = self._sparse
+        if len(sparse) * SPARSE_ENTRY_BYTES >= (sparse[-1] >> 3) + 1:
+            self._dense = _pack(sparse)
+            self._sparse = None
+
+    @classmethod
+    def union_all(cls, bitmaps):
+        """One VisitorBitmap holding the union of many, built in a single pass instead of pairwise"""
+        codes, bits = _union_parts(bitmaps)
+        result = cls()
+        if bits:
+            result._dense = _pack(codes, bytearray(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')))
+            result._sparse = None
+            result._count = int.from_bytes(result._dense, 'little').bit_count()
+        elif codes:
+            result._sparse = array('I', sorted(codes))
+            result._count = len(codes)
+            if result._count >= MIN_DENSE_MEMBERS:
+                result._maybe_pack()
+        return result
+
+    @staticmethod
+    def union_size(bitmaps):
+        """len(VisitorBitmap.union_all(bitmaps)), without building the union when all of them are sparse"""
+        codes, bits = _union_parts(bitmaps)
+        if not bits:
+            return len(codes)
+        return int.from_bytes(_pack(codes, bytearray(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))),
+                              'little').bit_count()
+
+    def bitset(self):
+        """Members as a Python int with bit `code` set for each member"""
+        if self._dense is not None:
+            return int.from_bytes(self._dense, 'little')
+        return int.from_bytes(_pack(self._sparse), 'little')
+
+    def update(self, other):
+        """In-place union with another VisitorBitmap or iterable of codes"""
+        if not isinstance(other, VisitorBitmap):
+            for code in other:
+                self.add(code)
+            return self
+        if other._dense is None:
+            if self._dense is None:
+                merged = sorted(set(self._sparse).union(other._sparse))
+                self._sparse = array('I', merged)
+                self._count = len(merged)
+                if self._count >= MIN_DENSE_MEMBERS:
+                    self._maybe_pack()
+                return self
+            for code in other._sparse:
+                self.add(code)
+            return self
+
+        merged = self.bitset() | other.bitset()
+        self._dense = bytearray(merged.to_bytes(max((merged.bit_length() + 7) // 8, 1), 'little'))
+        self._sparse = None
+        self._count = merged.bit_count()
+        return self
+
+    __ior__ = update
+
+    def __or__(self, other):
+        return self.copy().update(other)
+
+    def copy(self):
+        result = VisitorBitmap()
+        result._sparse = None if self._sparse is None else array('I', self._sparse)
+        result._dense = None if self._dense is None else bytearray(self._dense)
+        result._count = self._count
+        return result
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, code):
+        if self._dense is None:
+            i = bisect_left(self._sparse, code)
+            return i < self._count and self._sparse[i] == code
+        index = code >> 3
+        return index < len(self._dense) and bool(self._dense[index] & (1 << (code & 7)))
+
+    def __iter__(self):
+        if self._dense is None:
+            yield from self._sparse
+            return
+        for index, byte in enumerate(self._dense):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (index << 3) | bit
+
+    def __eq__(self, other):
+        if not isinstance(other, VisitorBitmap):
+            return NotImplemented
+        return self._count == other._count and self.bitset() == other.bitset()
+
+    def __getstate__(self):
+        return self._sparse, self._dense, self._count
+
+    def __setstate__(self, state):
+        self._sparse, self._dense, self._count = state
+
+    def __repr__(self):
+        return f'VisitorBitmap(<{self._count} visitors>)'
+
+
+def visitor_set_factory(kind='set', hll_precision=None):
+    """Return (new_set, encode) for a visitor-set kind
+
+    'set' keeps the original Python sets of contact id strings (encode is None);
+    'bitmap' encodes contacts to integers once and stores them in VisitorBitmap;
+    'hll' hashes contacts once and stores approximate HyperLogLog sketches.
+    """
+    if kind == 'set':
+        return set, None
+    if kind == 'bitmap':
+        return VisitorBitmap, ContactEncoder().encode
+    if kind == 'hll':
+        from functools import partial
+        from hyperloglog import DEFAULT_PRECISION, HashEncoder, HyperLogLog
+        return partial(HyperLogLog, hll_precision or DEFAULT_PRECISION), HashEncoder().encode
+    raise ValueError(f"Unknown visitor set kind: {kind!r}")